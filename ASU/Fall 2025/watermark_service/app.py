@@ -1,8 +1,11 @@
 import os
+import io
 import uuid
 from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
 from werkzeug.utils import secure_filename
 from watermark_service import PDFWatermarker
+from document_cache import DocumentCache
+from upload_index import UploadIndex
 import tempfile
 import shutil
 
@@ -11,6 +14,7 @@ app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_INDEX'] = os.path.join(app.config['UPLOAD_FOLDER'], '.upload_index.db')
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -18,6 +22,13 @@ os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# Parsed uploads reused across preview requests
+document_cache = DocumentCache()
+
+# File id to upload and output paths, rebuilt from disk so lookups never list the directories
+upload_index = UploadIndex(app.config['UPLOAD_INDEX'])
+upload_index.rebuild(app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER'])
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -40,6 +51,7 @@ def upload_file():
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
         file.save(file_path)
+        upload_index.add(unique_id, file_path)
         
         return jsonify({
             'success': True,
@@ -72,12 +84,7 @@ def apply_watermark():
             return jsonify({'error': 'No watermarks specified'}), 400
         
         # Find the uploaded file
-        upload_dir = app.config['UPLOAD_FOLDER']
-        input_file = None
-        for filename in os.listdir(upload_dir):
-            if filename.startswith(file_id):
-                input_file = os.path.join(upload_dir, filename)
-                break
+        input_file = upload_index.find_upload(file_id)
         
         if not input_file:
             return jsonify({'error': 'File not found'}), 404
@@ -91,6 +98,7 @@ def apply_watermark():
         
         # Apply watermarks
         watermarker.add_multiple_watermarks(input_file, output_path, watermarks)
+        upload_index.add(file_id, output_path, 'output')
         
         return jsonify({
             'success': True,
@@ -155,25 +163,26 @@ def preview_file(file_id):
             }]
         
         # Find the uploaded file
-        upload_dir = app.config['UPLOAD_FOLDER']
-        input_file = None
-        for filename in os.listdir(upload_dir):
-            if filename.startswith(file_id):
-                input_file = os.path.join(upload_dir, filename)
-                break
+        input_file = upload_index.find_upload(file_id)
         
         if not input_file:
             return jsonify({'error': 'File not found'}), 404
         
-        # Create a temporary watermarked file for preview
-        watermarker = PDFWatermarker()
-        temp_output = os.path.join(app.config['OUTPUT_FOLDER'], f"preview_{file_id}.pdf")
+        try:
+            page_number = int(request.args.get('page', 1))
+        except ValueError:
+            return jsonify({'error': 'page must be an integer'}), 400
         
-        # Apply watermarks with actual settings for preview
-        watermarker.add_multiple_watermarks(input_file, temp_output, watermarks)
+        # Render only the requested page, from a cached parse of the document
+        document = document_cache.get(input_file)
+        with document.lock:
+            preview = PDFWatermarker().render_page_preview(document.reader, page_number, watermarks)
         
-        return send_file(temp_output, mimetype='application/pdf')
+        return send_file(io.BytesIO(preview), mimetype='application/pdf')
         
+    except ValueError as e:
+        # Pages out of range and malformed watermark fields are the client's error
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Preview error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -183,12 +192,7 @@ def get_original_file(file_id):
     """Get the original PDF file without watermarks"""
     try:
         # Find the uploaded file
-        upload_dir = app.config['UPLOAD_FOLDER']
-        input_file = None
-        for filename in os.listdir(upload_dir):
-            if filename.startswith(file_id):
-                input_file = os.path.join(upload_dir, filename)
-                break
+        input_file = upload_index.find_upload(file_id)
         
         if not input_file:
             return jsonify({'error': 'File not found'}), 404
@@ -204,18 +208,13 @@ def cleanup_files():
         data = request.get_json()
         file_id = data.get('file_id')
         
-        # Clean up uploaded file
-        upload_dir = app.config['UPLOAD_FOLDER']
-        for filename in os.listdir(upload_dir):
-            if filename.startswith(file_id):
-                os.remove(os.path.join(upload_dir, filename))
-                break
-        
-        # Clean up output files
-        output_dir = app.config['OUTPUT_FOLDER']
-        for filename in os.listdir(output_dir):
-            if file_id in filename:
-                os.remove(os.path.join(output_dir, filename))
+        # Clean up the uploaded file and its outputs
+        for path, kind in upload_index.paths(file_id):
+            if kind == 'upload':
+                document_cache.invalidate(path)
+            if os.path.exists(path):
+                os.remove(path)
+        upload_index.remove(file_id)
         
         return jsonify({'success': True, 'message': 'Files cleaned up successfully'})
         
@@ -10,7 +10,11 @@ import json
 from flask import Flask, request, jsonify, send_file
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.utils import secure_filename
-from watermark_service import PDFWatermarker
+from event_coalescer import UpdateCoalescer
+from watermark_index import add_watermark, update_watermark, remove_watermark, watermark_list
+from session_store import create_session_store
+from job_queue import create_job_queue, default_queue_url, JOB_DONE
+from worker import start_worker_threads
 import tempfile
 import shutil
 
@@ -21,8 +25,10 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# Initialize SocketIO, with a message queue when replicas run so room broadcasts reach
+# clients connected to any of them
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('REDIS_URL'))
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -33,8 +39,16 @@ ALLOWED_EXTENSIONS = {'pdf'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Store active sessions
-active_sessions = {}
+# Store active sessions, shared by all replicas unless the in-process store is used
+active_sessions = create_session_store()
+
+# Watermark jobs run outside the request handler, in worker.py processes or,
+# with the in-process broker, in worker threads started here
+JOB_QUEUE_URL = default_queue_url()
+job_queue = create_job_queue(JOB_QUEUE_URL)
+
+if JOB_QUEUE_URL.startswith('memory://'):
+    start_worker_threads(job_queue, int(os.environ.get('JOB_WORKER_THREADS', 1)))
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -57,7 +71,8 @@ def upload_file():
         active_sessions[unique_id] = {
             'filename': filename,
             'file_path': file_path,
-            'watermarks': [],
+            # Watermark id -> record, see watermark_index.py
+            'watermarks': {},
             'room': f"session_{unique_id}"
         }
         
@@ -72,7 +87,7 @@ def upload_file():
 
 @app.route('/api/watermark', methods=['POST'])
 def apply_watermark():
-    """Apply watermarks to PDF"""
+    """Queue a job applying watermarks to a PDF"""
     try:
         data = request.get_json()
         file_id = data.get('file_id')
@@ -85,28 +100,50 @@ def apply_watermark():
         if file_id not in active_sessions:
             return jsonify({'error': 'File not found'}), 404
         
-        session = active_sessions[file_id]
-        input_file = session['file_path']
-        
-        # Create watermarker instance
-        watermarker = PDFWatermarker()
+        session = active_sessions.get(file_id, watermarks=False)
         
         # Generate output filename
-        output_filename = f"watermarked_{file_id}.pdf"
+        # Unique per request, so concurrent jobs for one file never write the same output
+        output_filename = f"watermarked_{file_id}_{uuid.uuid4().hex[:16]}.pdf"
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        # Apply watermarks
-        watermarker.add_multiple_watermarks(input_file, output_path, watermarks)
+        job_id = job_queue.enqueue({
+            'file_id': file_id,
+            'input_path': session['file_path'],
+            'output_path': output_path,
+            'watermarks': watermarks
+        })
         
         return jsonify({
             'success': True,
-            'output_file': output_filename,
-            'message': f'{len(watermarks)} watermark(s) applied successfully'
-        })
+            'job_id': job_id,
+            'status': 'queued',
+            'message': f'{len(watermarks)} watermark(s) queued'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Poll the status of a watermark job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = {
+        'success': True,
+        'job_id': job_id,
+        'status': job['status']
+    }
+    if job['status'] == JOB_DONE:
+        response['output_file'] = os.path.basename(job['result']['output_path'])
+        response['message'] = f"{len(job['payload']['watermarks'])} watermark(s) applied successfully"
+    elif job['error']:
+        response['error'] = job['error']
+    
+    return jsonify(response)
+
 @app.route('/api/download/<filename>')
 def download_file(filename):
     """Download watermarked PDF"""
@@ -139,6 +176,8 @@ def cleanup_files():
                 if file_id in filename:
                     os.remove(os.path.join(output_dir, filename))
             
+            update_coalescer.forget_session(file_id)
+            
             # Remove session
             del active_sessions[file_id]
         
@@ -147,6 +186,34 @@ def cleanup_files():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def broadcast_coalesced_updates(file_id, updates):
+    """Apply one tick of coalesced updates to a session and broadcast them as one message"""
+    def apply(records):
+        for update in updates:
+            fields = dict(update.get('properties', {}))
+            if 'position' in update:
+                fields['position'] = update['position']
+            update_watermark(records, update['watermark_id'], fields)
+    
+    # Only the records of the updated watermarks are read and written back
+    watermark_ids = {update['watermark_id'] for update in updates}
+    session = active_sessions.modify_watermarks(file_id, watermark_ids, apply)
+    if session is not None:
+        socketio.emit('watermark_updates', {
+            'file_id': file_id,
+            'tick': update_coalescer.tick,
+            'updates': updates
+        }, room=session['room'])
+
+# Position and property updates are broadcast at a fixed rate, whatever rate clients send them at
+update_coalescer = UpdateCoalescer(broadcast_coalesced_updates)
+socketio.start_background_task(update_coalescer.run, socketio.sleep)
+
+def client_seq(data):
+    """The client's sequence number of an update, if it sent a usable one"""
+    seq = data.get('seq')
+    return seq if isinstance(seq, (int, float)) and not isinstance(seq, bool) else None
+
 # WebSocket Events
 @socketio.on('connect')
 def handle_connect():
@@ -158,17 +225,18 @@ def handle_connect():
 def handle_disconnect():
     """Handle client disconnection"""
     print(f"Client disconnected: {request.sid}")
+    update_coalescer.forget_client(request.sid)
 
 @socketio.on('join_session')
 def handle_join_session(data):
     """Join a watermarking session"""
     file_id = data.get('file_id')
-    if file_id and file_id in active_sessions:
-        room = active_sessions[file_id]['room']
-        join_room(room)
+    session = active_sessions.get(file_id) if file_id else None
+    if session is not None:
+        join_room(session['room'])
         emit('session_joined', {
             'file_id': file_id,
-            'watermarks': active_sessions[file_id]['watermarks']
+            'watermarks': watermark_list(session['watermarks'])
         })
         print(f"Client {request.sid} joined session {file_id}")
 
@@ -176,8 +244,9 @@ def handle_join_session(data):
 def handle_leave_session(data):
     """Leave a watermarking session"""
     file_id = data.get('file_id')
-    if file_id and file_id in active_sessions:
-        room = active_sessions[file_id]['room']
+    session = active_sessions.get(file_id, watermarks=False) if file_id else None
+    if session is not None:
+        room = session['room']
         leave_room(room)
         emit('session_left', {'file_id': file_id})
 
@@ -188,41 +257,28 @@ def handle_update_position(data):
     watermark_id = data.get('watermark_id')
     position = data.get('position')
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Update watermark position
-        for watermark in session['watermarks']:
-            if watermark.get('id') == watermark_id:
-                watermark['position'] = position
-                break
-        
-        # Broadcast update to all clients in the room
-        emit('watermark_position_updated', {
-            'watermark_id': watermark_id,
-            'position': position
-        }, room=room)
-        
-        print(f"Updated position for watermark {watermark_id} in session {file_id}")
+    # Stored and broadcast with the next tick, stale updates are dropped
+    update_coalescer.submit(file_id, watermark_id, request.sid, client_seq(data), position=position)
 
 @socketio.on('add_watermark')
 def handle_add_watermark(data):
     """Add a new watermark"""
     file_id = data.get('file_id')
     watermark_data = data.get('watermark')
+    if not isinstance(watermark_data, dict):
+        return
+    # Other clients refer to the watermark by id
+    watermark_data.setdefault('id', str(uuid.uuid4()))
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Add watermark to session
-        session['watermarks'].append(watermark_data)
-        
+    # Add watermark to session
+    session = active_sessions.modify_watermarks(
+        file_id, [watermark_data['id']], lambda records: add_watermark(records, watermark_data)
+    )
+    if session is not None:
         # Broadcast to all clients in the room
         emit('watermark_added', {
             'watermark': watermark_data
-        }, room=room)
+        }, room=session['room'])
         
         print(f"Added watermark to session {file_id}")
 
@@ -232,17 +288,15 @@ def handle_remove_watermark(data):
     file_id = data.get('file_id')
     watermark_id = data.get('watermark_id')
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Remove watermark from session
-        session['watermarks'] = [w for w in session['watermarks'] if w.get('id') != watermark_id]
-        
+    # Remove watermark from session
+    session = active_sessions.modify_watermarks(
+        file_id, [watermark_id], lambda records: remove_watermark(records, watermark_id)
+    )
+    if session is not None:
         # Broadcast to all clients in the room
         emit('watermark_removed', {
             'watermark_id': watermark_id
-        }, room=room)
+        }, room=session['room'])
         
         print(f"Removed watermark {watermark_id} from session {file_id}")
 
@@ -253,23 +307,11 @@ def handle_update_properties(data):
     watermark_id = data.get('watermark_id')
     properties = data.get('properties')
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Update watermark properties
-        for watermark in session['watermarks']:
-            if watermark.get('id') == watermark_id:
-                watermark.update(properties)
-                break
-        
-        # Broadcast to all clients in the room
-        emit('watermark_properties_updated', {
-            'watermark_id': watermark_id,
-            'properties': properties
-        }, room=room)
-        
-        print(f"Updated properties for watermark {watermark_id} in session {file_id}")
+    if not isinstance(properties, dict):
+        return
+    
+    # Stored and broadcast with the next tick, stale updates are dropped
+    update_coalescer.submit(file_id, watermark_id, request.sid, client_seq(data), properties=properties)
 
 if __name__ == '__main__':
     print("Starting PDF Watermark API Server...")
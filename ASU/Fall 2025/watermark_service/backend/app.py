@@ -5,15 +5,32 @@ Handles real-time watermark positioning via WebSockets
 """
 
 import os
+import io
 import uuid
 import json
 import logging
+import functools
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, request, jsonify, send_file, Response, stream_with_context
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from watermark_service import PDFWatermarker
+from watermark_service import PDFWatermarker, set_default_observer
+from engine_observer import StageTimerObserver
+from job_queue import create_job_queue, default_queue_url, JOB_DONE
+from result_cache import create_result_cache, result_key, copy_atomic
+from content_store import ContentStore, HashingWriter
+from chunked_upload import ChunkedUploadStore, UploadOffsetError, UploadBusyError, UploadCapacityError, DEFAULT_CHUNK_SIZE
+from document_cache import DocumentCache
+from document_metadata import analyze_document, page_geometry_at, pdf_info, METADATA_VERSION
+from event_coalescer import UpdateCoalescer
+from watermark_index import add_watermark, update_watermark, remove_watermark, watermark_list
+from session_store import create_session_store, default_store_url
+from page_geometry import display_size
+from raster_tiles import WatermarkRasterizer, TileCache, tile_grid, TILE_SIZE, ZOOM_LEVELS
+from worker import start_worker_threads
+from engine_pool import run_engine, iterate_in_engine_pool, ENGINE_POOL_SIZE
+from metrics import MetricsRegistry, directory_size, CONTENT_TYPE as METRICS_CONTENT_TYPE
 import tempfile
 import shutil
 
@@ -35,8 +52,15 @@ performance_logger = logging.getLogger('performance')
 # Create logs directory
 os.makedirs(os.path.join(os.path.dirname(__file__), 'logs'), exist_ok=True)
 
+class ContentStoreRequest(Request):
+    """Streams uploaded files straight into the content store, hashing them on the way in"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return content_store.new_writer()
+
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = ContentStoreRequest
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
 app.config['OUTPUT_FOLDER'] = os.path.join(os.path.dirname(__file__), 'outputs')
@@ -45,20 +69,83 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Enable CORS for React frontend
 CORS(app, origins=["http://localhost:3000"], supports_credentials=True)
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000", async_mode='eventlet')
+# Initialize SocketIO, with a message queue when replicas run so room broadcasts reach
+# clients connected to any of them
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('REDIS_URL')
+socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000", async_mode='eventlet',
+                    message_queue=SOCKETIO_MESSAGE_QUEUE)
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
+# Uploads are stored once per content hash, sessions hold hard links to them
+content_store = ContentStore(os.path.join(app.config['UPLOAD_FOLDER'], 'store'))
+
+# Prometheus metrics served at /metrics, see metrics.py
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    'watermark_stage_seconds', 'Time spent in each stage of watermark work', ['stage']
+)
+socketio_events = metrics.counter(
+    'watermark_socketio_events_total', 'Socket.IO events received', ['event']
+)
+broadcast_recipients = metrics.histogram(
+    'watermark_broadcast_recipients', 'Clients on this replica reached by each room broadcast', ['event'],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250)
+)
+metrics.gauge(
+    'watermark_active_sessions', 'Upload sessions in the session store',
+    collect=lambda: len(active_sessions)
+)
+metrics.gauge(
+    'watermark_disk_usage_bytes', 'Bytes used by the files in each directory', ['directory'],
+    collect=lambda: {
+        ('uploads',): directory_size(app.config['UPLOAD_FOLDER']),
+        ('outputs',): directory_size(app.config['OUTPUT_FOLDER'])
+    }
+)
+
+# Engine stages run in this process: requests, the engine pool and in-process workers
+set_default_observer(StageTimerObserver(lambda stage, seconds: stage_seconds.observe(seconds, stage=stage)))
+
+# Parsed uploads keyed by file id and content hash, shared by pdf-info, previews, tiles and
+# in-process watermark jobs so only the first request of a session parses the document
+document_cache = DocumentCache(parse_timer=lambda seconds: stage_seconds.observe(seconds, stage='parse'))
+
+# Watermark layer tiles, keyed by watermark spec, page geometry, zoom and tile, so a drag that
+# revisits a position is answered without drawing
+tile_rasterizer = WatermarkRasterizer(PDFWatermarker())
+tile_cache = TileCache()
+
+# Resumable uploads in progress, finished ones move into the content store
+chunked_uploads = ChunkedUploadStore(os.path.join(app.config['UPLOAD_FOLDER'], 'partial'))
+
 ALLOWED_EXTENSIONS = {'pdf'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Store active sessions
-active_sessions = {}
+# Store active sessions, shared by all replicas unless the in-process store is used
+SESSION_STORE_URL = default_store_url()
+active_sessions = create_session_store(SESSION_STORE_URL)
+
+# Watermark jobs run outside the request handler, in worker.py processes or,
+# with the in-process broker, in worker threads started here
+JOB_QUEUE_URL = default_queue_url()
+job_queue = create_job_queue(JOB_QUEUE_URL)
+
+# Watermarked outputs keyed by input hash + watermark spec + engine version, shared with workers
+result_cache = create_result_cache()
+
+if JOB_QUEUE_URL.startswith('memory://'):
+    start_worker_threads(job_queue, int(os.environ.get('JOB_WORKER_THREADS', 1)), result_cache, document_cache)
+
+@app.route('/metrics')
+def get_metrics():
+    """Metrics in the Prometheus text format"""
+    # Walks the upload and output directories, off the event loop
+    return Response(run_engine(metrics.render), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/api/health')
 def health_check():
@@ -66,6 +153,28 @@ def health_check():
     app_logger.info('Health check requested')
     return jsonify({'status': 'healthy', 'message': 'PDF Watermark Service is running'})
 
+def create_session(file_id, filename, file_path, sha256):
+    """Store session info for an uploaded file"""
+    session = {
+        'filename': filename,
+        'file_path': file_path,
+        'sha256': sha256,
+        # Watermark id -> record, see watermark_index.py
+        'watermarks': {},
+        'room': f"session_{file_id}"
+    }
+    active_sessions[file_id] = session
+    return session
+
+def start_analysis(file_id, session):
+    """Record the metadata of a new upload in the background, so pdf-info finds it ready"""
+    def analyze():
+        try:
+            run_engine(document_metadata, file_id, session)
+        except Exception as e:
+            app_logger.error(f'Error analyzing upload {file_id}: {str(e)}')
+    socketio.start_background_task(analyze)
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Upload PDF file"""
@@ -86,33 +195,154 @@ def upload_file():
         unique_id = str(uuid.uuid4())
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
-        file.save(file_path)
         
-        # Store session info
-        active_sessions[unique_id] = {
-            'filename': filename,
-            'file_path': file_path,
-            'watermarks': [],
-            'room': f"session_{unique_id}"
-        }
+        # The body was hashed while it streamed into the store, duplicates share one file
+        if isinstance(file.stream, HashingWriter):
+            sha256, duplicate = content_store.commit(file.stream, file_path)
+        else:
+            sha256, duplicate = content_store.store_file(file.stream, file_path)
+        
+        session = create_session(unique_id, filename, file_path, sha256)
+        start_analysis(unique_id, session)
         
         processing_time = (datetime.now() - start_time).total_seconds()
+        stage_seconds.observe(processing_time, stage='upload')
         performance_logger.info(f'File upload completed in {processing_time:.3f}s - File: {filename}, Size: {os.path.getsize(file_path)} bytes')
-        app_logger.info(f'File uploaded successfully: {filename} (ID: {unique_id})')
+        app_logger.info(f'File uploaded successfully: {filename} (ID: {unique_id}, duplicate: {duplicate})')
         
         return jsonify({
             'success': True,
             'file_id': unique_id,
             'filename': filename,
+            'sha256': sha256,
+            'deduplicated': duplicate,
             'message': 'File uploaded successfully'
         })
     
     app_logger.warning(f'Invalid file type attempted: {file.filename}')
     return jsonify({'error': 'Invalid file type'}), 400
 
+@app.route('/api/uploads', methods=['POST'])
+def create_chunked_upload():
+    """Start a resumable upload for files larger than a single request allows"""
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename', ''))
+    size = data.get('size')
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    if not isinstance(size, int):
+        return jsonify({'error': 'Upload size is required'}), 400
+    
+    try:
+        upload = chunked_uploads.create(filename, size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
+    except UploadCapacityError as e:
+        return jsonify({'error': str(e)}), 429
+    
+    app_logger.info(f'Chunked upload started: {filename} ({size} bytes, ID: {upload["upload_id"]})')
+    return jsonify({
+        'success': True,
+        'upload_id': upload['upload_id'],
+        'offset': upload['offset'],
+        'size': upload['size'],
+        'chunk_size': DEFAULT_CHUNK_SIZE
+    }), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Report how many bytes of an upload the server has, so the client can resume"""
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        'upload_id': upload_id,
+        'offset': upload['offset'],
+        'size': upload['size']
+    })
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """Append the request body at the offset given in the Upload-Offset header"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    
+    try:
+        upload = chunked_uploads.write_chunk(upload_id, offset, request.stream, request.content_length or 0)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadOffsetError as e:
+        # The client resends from the offset the server actually has
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    except UploadBusyError:
+        # A retry that overtook its own earlier attempt, the client waits and asks for the offset
+        upload = chunked_uploads.get(upload_id)
+        return jsonify({
+            'error': 'Another chunk of this upload is being written',
+            'busy': True,
+            'offset': upload['offset'] if upload else 0
+        }), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'upload_id': upload_id, 'offset': upload['offset'], 'size': upload['size']})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Validate a finished upload and open a session for it"""
+    start_time = datetime.now()
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        # Parses and may hash the whole file in the engine pool
+        data_path, sha256, num_pages = chunked_uploads.finish(upload_id)
+    except KeyError:
+        # Completed by an earlier request
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadBusyError:
+        return jsonify({'error': 'The upload is still being written or completed', 'busy': True}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    unique_id = str(uuid.uuid4())
+    filename = upload['filename']
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
+    _, duplicate = run_engine(content_store.adopt, data_path, sha256, file_path)
+    session = create_session(unique_id, filename, file_path, sha256)
+    start_analysis(unique_id, session)
+    
+    processing_time = (datetime.now() - start_time).total_seconds()
+    stage_seconds.observe(processing_time, stage='upload')
+    performance_logger.info(f'Chunked upload finalized in {processing_time:.3f}s - File: {filename}, Size: {upload["size"]} bytes, Pages: {num_pages}')
+    
+    return jsonify({
+        'success': True,
+        'file_id': unique_id,
+        'filename': filename,
+        'sha256': sha256,
+        'deduplicated': duplicate,
+        'num_pages': num_pages,
+        'message': 'File uploaded successfully'
+    })
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Abandon an upload and free its preallocated space"""
+    if chunked_uploads.get(upload_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    run_engine(chunked_uploads.discard, upload_id)
+    return jsonify({'success': True, 'message': 'Upload aborted'})
+
 @app.route('/api/watermark', methods=['POST'])
 def apply_watermark():
-    """Apply watermarks to PDF"""
+    """Queue a job applying watermarks to a PDF"""
     try:
         data = request.get_json()
         file_id = data.get('file_id')
@@ -125,37 +355,169 @@ def apply_watermark():
         if file_id not in active_sessions:
             return jsonify({'error': 'File not found'}), 404
         
-        session = active_sessions[file_id]
-        input_file = session['file_path']
+        session = active_sessions.get(file_id, watermarks=False)
+        cache_key = result_key(session['sha256'], watermarks)
         
-        # Create watermarker instance
-        watermarker = PDFWatermarker()
-        
-        # Generate output filename
-        output_filename = f"watermarked_{file_id}.pdf"
+        # One output per spec: jobs for other specs of the file never write this path, and every
+        # writer of it produces the same bytes and moves them into place atomically
+        output_filename = f"watermarked_{file_id}_{cache_key[:16]}.pdf"
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        # Apply watermarks
-        watermarker.add_multiple_watermarks(input_file, output_path, watermarks)
+        # Serve an identical earlier result without running the engine
+        cached_path = result_cache.get(cache_key)
+        if cached_path is not None:
+            run_engine(copy_atomic, cached_path, output_path)
+            app_logger.info(f'Result cache hit for {file_id}: {cache_key[:12]}')
+            return jsonify({
+                'success': True,
+                'status': JOB_DONE,
+                'output_file': output_filename,
+                'cached': True,
+                'message': f'{len(watermarks)} watermark(s) applied successfully'
+            })
+        
+        # Join a job that is already producing this result for the same file, so repeated clicks
+        # share one job. The queue only returns jobs that are queued or still leased to a worker
+        dedupe_key = f'{file_id}:{cache_key}'
+        pending_job = job_queue.find_pending(dedupe_key)
+        if pending_job is not None:
+            return jsonify({
+                'success': True,
+                'job_id': pending_job['id'],
+                'status': pending_job['status'],
+                'message': f'{len(watermarks)} watermark(s) queued'
+            }), 202
+        
+        job_id = job_queue.enqueue({
+            'file_id': file_id,
+            'input_path': session['file_path'],
+            'output_path': output_path,
+            'watermarks': watermarks,
+            'cache_key': cache_key,
+            'document_key': [file_id, session['sha256']],
+            # Page geometries for planning overlays, when the upload has been analyzed
+            'metadata': content_store.load_metadata(session['sha256'])
+        }, dedupe_key=dedupe_key)
+        app_logger.info(f'Queued watermark job {job_id} for {file_id}: {len(watermarks)} watermark(s)')
         
         return jsonify({
             'success': True,
-            'output_file': output_filename,
-            'message': f'{len(watermarks)} watermark(s) applied successfully'
-        })
+            'job_id': job_id,
+            'status': 'queued',
+            'message': f'{len(watermarks)} watermark(s) queued'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """Hit counters and sizes of the result, tile and document caches"""
+    return jsonify({
+        'success': True,
+        'result_cache': result_cache.stats(),
+        'tile_cache': tile_cache.stats(),
+        'document_cache': document_cache.stats()
+    })
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Poll the status of a watermark job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = {
+        'success': True,
+        'job_id': job_id,
+        'status': job['status']
+    }
+    if job['status'] == JOB_DONE:
+        response['output_file'] = os.path.basename(job['result']['output_path'])
+        response['message'] = f"{len(job['payload']['watermarks'])} watermark(s) applied successfully"
+    elif job['error']:
+        response['error'] = job['error']
+    
+    return jsonify(response)
+
+@app.route('/api/watermark/batch', methods=['POST'])
+def apply_watermark_batch():
+    """Apply watermarks to many uploaded PDFs, streaming one NDJSON result line per file"""
+    data = request.get_json()
+    items = data.get('items', []) if data else []
+    
+    if not items:
+        return jsonify({'error': 'No batch items specified'}), 400
+    
+    # Resolve file ids up front so unknown files are reported without reaching the engine
+    batch_items = []
+    rejected = []
+    for index, item in enumerate(items):
+        file_id = item.get('file_id')
+        watermarks = item.get('watermarks', [])
+        item_id = item.get('id', index)
+        session = active_sessions.get(file_id, watermarks=False) if file_id else None
+        
+        if session is None:
+            rejected.append({'id': item_id, 'file_id': file_id, 'success': False, 'error': 'File not found'})
+        elif not watermarks:
+            rejected.append({'id': item_id, 'file_id': file_id, 'success': False, 'error': 'No watermarks specified'})
+        else:
+            batch_items.append({
+                'id': index,
+                'input_path': session['file_path'],
+                'output_path': os.path.join(app.config['OUTPUT_FOLDER'], f"watermarked_{file_id}_{index}.pdf"),
+                'watermarks': watermarks,
+                'stamp_mode': item.get('stamp_mode', 'merge')
+            })
+    
+    # Engine results carry the item's index, mapped back to the client's id and file id
+    item_keys = {index: (item.get('id', index), item.get('file_id')) for index, item in enumerate(items)}
+    app_logger.info(f'Batch watermark request: {len(batch_items)} item(s), {len(rejected)} rejected')
+    
+    def generate():
+        start_time = datetime.now()
+        for result in rejected:
+            yield json.dumps(result) + '\n'
+        
+        # One engine for the whole batch, results are streamed in completion order
+        watermarker = PDFWatermarker()
+        for result in iterate_in_engine_pool(watermarker.watermark_batch(batch_items)):
+            item_id, file_id = item_keys[result['id']]
+            line = {
+                'id': item_id,
+                'file_id': file_id,
+                'success': result['success'],
+                'elapsed': round(result['elapsed'], 3)
+            }
+            if result['success']:
+                line['output_file'] = os.path.basename(result['output_path'])
+            else:
+                line['error'] = result['error']
+            yield json.dumps(line) + '\n'
+        
+        processing_time = (datetime.now() - start_time).total_seconds()
+        performance_logger.info(f'Batch of {len(batch_items)} item(s) completed in {processing_time:.3f}s')
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/download/<filename>')
 def download_file(filename):
     """Download watermarked PDF"""
     try:
-        return send_file(
+        start_time = datetime.now()
+        response = send_file(
             os.path.join(app.config['OUTPUT_FOLDER'], filename),
             as_attachment=True,
             download_name=filename
         )
+        # Observed once the whole file has been sent. Passed-through file bodies skip close
+        # callbacks, so the body is streamed through the response instead
+        response.direct_passthrough = False
+        response.call_on_close(
+            lambda: stage_seconds.observe((datetime.now() - start_time).total_seconds(), stage='download')
+        )
+        return response
     except FileNotFoundError:
         return jsonify({'error': 'File not found'}), 404
 
@@ -192,18 +554,16 @@ def get_pdf_info(file_id):
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found'}), 404
         
-        # Create watermarker instance to get PDF info
-        watermarker = PDFWatermarker()
-        pdf_info = watermarker.get_pdf_info(file_path)
+        # Recorded at upload, analyzed here only if that has not finished yet
+        info = pdf_info(run_engine(document_metadata, file_id, session))
         
-        app_logger.info(f'PDF info requested for {file_id}: {pdf_info["num_pages"]} pages')
+        app_logger.info(f'PDF info requested for {file_id}: {info["num_pages"]} pages')
         
         return jsonify({
             'success': True,
             'file_id': file_id,
             'filename': session['filename'],
-            'num_pages': pdf_info['num_pages'],
-            'page_size': pdf_info['page_size']
+            **info
         })
         
     except Exception as e:
@@ -232,6 +592,137 @@ def get_pdf_preview(file_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/preview/<file_id>/page/<int:page_number>', methods=['GET', 'POST'])
+def get_page_preview(file_id, page_number):
+    """Render a single page with watermarks as a one-page PDF"""
+    try:
+        if file_id not in active_sessions:
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Watermarks come from the JSON body, or a JSON query parameter for GET
+        if request.method == 'POST':
+            watermarks = (request.get_json() or {}).get('watermarks', [])
+        else:
+            watermarks = json.loads(request.args.get('watermarks', '[]'))
+        if not isinstance(watermarks, list):
+            return jsonify({'error': 'watermarks must be a list'}), 400
+        
+        start_time = datetime.now()
+        preview = run_engine(render_cached_preview, file_id, active_sessions[file_id], page_number, watermarks)
+        
+        processing_time = (datetime.now() - start_time).total_seconds()
+        performance_logger.debug(f'Page preview {file_id} p{page_number} rendered in {processing_time:.3f}s')
+        
+        return send_file(io.BytesIO(preview), mimetype='application/pdf')
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def session_document(file_id, session):
+    """The cached parse of a session's upload, run in the engine pool"""
+    return document_cache.get(session['file_path'], (file_id, session['sha256']))
+
+def document_metadata(file_id, session):
+    """Metadata of a session's upload, analyzed once per content hash, run in the engine pool"""
+    metadata = content_store.load_metadata(session['sha256'])
+    if metadata is None or metadata.get('version') != METADATA_VERSION:
+        document = session_document(file_id, session)
+        with document.lock:
+            metadata = analyze_document(document.reader, session['file_path'])
+        content_store.save_metadata(session['sha256'], metadata)
+    return metadata
+
+def render_cached_preview(file_id, session, page_number, watermarks):
+    """Render a page preview from the cached document, run in the engine pool"""
+    document = session_document(file_id, session)
+    with document.lock:
+        return PDFWatermarker().render_page_preview(document.reader, page_number, watermarks)
+
+def recorded_page_geometry(file_id, session, page_number):
+    """Page count and the geometry of one page (None when out of range), run in the engine pool"""
+    metadata = document_metadata(file_id, session)
+    return metadata['num_pages'], page_geometry_at(metadata, page_number)
+
+@app.route('/api/tiles/<file_id>/<int:page_number>')
+def get_tile_grid(file_id, page_number):
+    """Displayed page size and the tile grid at each zoom level"""
+    try:
+        if file_id not in active_sessions:
+            return jsonify({'error': 'File not found'}), 404
+        
+        _, geometry = run_engine(recorded_page_geometry, file_id, active_sessions[file_id], page_number)
+        if geometry is None:
+            return jsonify({'error': f'Page {page_number} is out of range'}), 400
+        
+        page_width, page_height = display_size(geometry)
+        return jsonify({
+            'success': True,
+            'page_width': page_width,
+            'page_height': page_height,
+            'tile_size': TILE_SIZE,
+            'zoom_levels': {str(zoom): tile_grid(geometry, zoom) for zoom in ZOOM_LEVELS}
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tiles/<file_id>/<int:page_number>/<zoom>/<int:tile_x>/<int:tile_y>.png')
+def get_watermark_tile(file_id, page_number, zoom, tile_x, tile_y):
+    """Transparent PNG tile of a page's watermark layer, for compositing over the client's page view"""
+    try:
+        session = active_sessions.get(file_id, watermarks=False)
+        if session is None:
+            return jsonify({'error': 'File not found'}), 404
+        
+        try:
+            zoom = float(zoom)
+        except ValueError:
+            zoom = None
+        if zoom not in ZOOM_LEVELS:
+            return jsonify({'error': f'zoom must be one of {list(ZOOM_LEVELS)}'}), 400
+        
+        start_time = datetime.now()
+        watermarks_arg = request.args.get('watermarks', '[]')
+        # A repeated request is answered before the engine pool and the metadata are touched
+        request_key = (session['sha256'], page_number, zoom, tile_x, tile_y, watermarks_arg)
+        png = tile_cache.lookup(request_key)
+        
+        if png is None:
+            watermarks = json.loads(watermarks_arg)
+            if not isinstance(watermarks, list):
+                return jsonify({'error': 'watermarks must be a list'}), 400
+            
+            total_pages, geometry = run_engine(recorded_page_geometry, file_id, session, page_number)
+            if geometry is None:
+                return jsonify({'error': f'Page {page_number} is out of range'}), 400
+            
+            columns, rows = tile_grid(geometry, zoom)
+            if not (0 <= tile_x < columns and 0 <= tile_y < rows):
+                return jsonify({'error': f'Tile {tile_x},{tile_y} is outside the {columns}x{rows} grid'}), 400
+            
+            engine = tile_rasterizer.watermarker
+            page_watermarks = [wm for wm in watermarks if engine.targets_page(wm, page_number, total_pages)]
+            cache_key = (engine._overlay_key(page_watermarks, geometry), zoom, tile_x, tile_y)
+            
+            png = tile_cache.get(cache_key)
+            if png is None:
+                png = run_engine(tile_rasterizer.render_tile, page_watermarks, geometry, zoom, tile_x, tile_y)
+            tile_cache.put(cache_key, png, request_key)
+        
+        processing_time = (datetime.now() - start_time).total_seconds()
+        performance_logger.debug(f'Tile {file_id} p{page_number} z{zoom} {tile_x},{tile_y} served in {processing_time:.4f}s')
+        
+        response = send_file(io.BytesIO(png), mimetype='image/png')
+        # The URL carries the whole spec, so a tile never changes
+        response.headers['Cache-Control'] = 'private, max-age=3600, immutable'
+        return response
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/cleanup', methods=['POST'])
 def cleanup_files():
     """Clean up temporary files"""
@@ -242,9 +733,10 @@ def cleanup_files():
         if file_id in active_sessions:
             session = active_sessions[file_id]
             
-            # Clean up uploaded file
-            if os.path.exists(session['file_path']):
-                os.remove(session['file_path'])
+            document_cache.invalidate(file_id)
+            
+            # Drop this session's handle, the stored file goes with the last one
+            content_store.release_handle(session['sha256'], session['file_path'])
             
             # Clean up output files
             output_dir = app.config['OUTPUT_FOLDER']
@@ -252,6 +744,8 @@ def cleanup_files():
                 if file_id in filename:
                     os.remove(os.path.join(output_dir, filename))
             
+            update_coalescer.forget_session(file_id)
+            
             # Remove session
             del active_sessions[file_id]
         
@@ -260,129 +754,157 @@ def cleanup_files():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def broadcast_coalesced_updates(file_id, updates):
+    """Apply one tick of coalesced updates to a session and broadcast them as one message"""
+    def apply(records):
+        for update in updates:
+            fields = dict(update.get('properties', {}))
+            if 'position' in update:
+                fields['position'] = update['position']
+            update_watermark(records, update['watermark_id'], fields)
+    
+    # Only the records of the updated watermarks are read and written back
+    watermark_ids = {update['watermark_id'] for update in updates}
+    session = active_sessions.modify_watermarks(file_id, watermark_ids, apply)
+    if session is not None:
+        socketio.emit('watermark_updates', {
+            'file_id': file_id,
+            'tick': update_coalescer.tick,
+            'updates': updates
+        }, room=session['room'])
+        record_broadcast('watermark_updates', session['room'])
+
+# Position and property updates are broadcast at a fixed rate, whatever rate clients send them at
+update_coalescer = UpdateCoalescer(broadcast_coalesced_updates)
+socketio.start_background_task(update_coalescer.run, socketio.sleep)
+
+def record_broadcast(event, room):
+    """Record how many clients connected to this replica a room broadcast reached"""
+    recipients = sum(1 for _ in socketio.server.manager.get_participants('/', room))
+    broadcast_recipients.observe(recipients, event=event)
+
+def on_event(event):
+    """
+    Register a Socket.IO event handler like socketio.on, counting the events received
+
+    Connect handlers must take the auth argument, Flask-SocketIO retries them without it
+    on TypeError, which would count the connection twice.
+    """
+    def register(handler):
+        @functools.wraps(handler)
+        def counted_handler(*args):
+            socketio_events.inc(event=event)
+            return handler(*args)
+        return socketio.on(event)(counted_handler)
+    return register
+
+def client_seq(data):
+    """The client's sequence number of an update, if it sent a usable one"""
+    seq = data.get('seq')
+    return seq if isinstance(seq, (int, float)) and not isinstance(seq, bool) else None
+
 # WebSocket Events
-@socketio.on('connect')
-def handle_connect():
+@on_event('connect')
+def handle_connect(auth=None):
     """Handle client connection"""
     websocket_logger.info(f'Client connected: {request.sid}')
     emit('connected', {'message': 'Connected to watermark service'})
 
-@socketio.on('disconnect')
+@on_event('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     websocket_logger.info(f'Client disconnected: {request.sid}')
+    update_coalescer.forget_client(request.sid)
 
-@socketio.on('join_session')
+@on_event('join_session')
 def handle_join_session(data):
     """Join a watermarking session"""
     file_id = data.get('file_id')
-    if file_id and file_id in active_sessions:
-        room = active_sessions[file_id]['room']
-        join_room(room)
+    session = active_sessions.get(file_id) if file_id else None
+    if session is not None:
+        join_room(session['room'])
         emit('session_joined', {
             'file_id': file_id,
-            'watermarks': active_sessions[file_id]['watermarks']
+            'watermarks': watermark_list(session['watermarks'])
         })
         websocket_logger.info(f'Client {request.sid} joined session {file_id}')
 
-@socketio.on('leave_session')
+@on_event('leave_session')
 def handle_leave_session(data):
     """Leave a watermarking session"""
     file_id = data.get('file_id')
-    if file_id and file_id in active_sessions:
-        room = active_sessions[file_id]['room']
+    session = active_sessions.get(file_id, watermarks=False) if file_id else None
+    if session is not None:
+        room = session['room']
         leave_room(room)
         emit('session_left', {'file_id': file_id})
 
-@socketio.on('update_watermark_position')
+@on_event('update_watermark_position')
 def handle_update_position(data):
     """Update watermark position in real-time"""
     file_id = data.get('file_id')
     watermark_id = data.get('watermark_id')
     position = data.get('position')
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Update watermark position
-        for watermark in session['watermarks']:
-            if watermark.get('id') == watermark_id:
-                watermark['position'] = position
-                break
-        
-        # Broadcast update to all clients in the room
-        emit('watermark_position_updated', {
-            'watermark_id': watermark_id,
-            'position': position
-        }, room=room)
-        
+    # Stored and broadcast with the next tick, stale updates are dropped
+    if update_coalescer.submit(file_id, watermark_id, request.sid, client_seq(data), position=position):
         performance_logger.debug(f'Position update - Watermark: {watermark_id}, Session: {file_id}, Position: {position}')
 
-@socketio.on('add_watermark')
+@on_event('add_watermark')
 def handle_add_watermark(data):
     """Add a new watermark"""
     file_id = data.get('file_id')
     watermark_data = data.get('watermark')
+    if not isinstance(watermark_data, dict):
+        return
+    # Other clients refer to the watermark by id
+    watermark_data.setdefault('id', str(uuid.uuid4()))
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Add watermark to session
-        session['watermarks'].append(watermark_data)
-        
+    # Add watermark to session
+    session = active_sessions.modify_watermarks(
+        file_id, [watermark_data['id']], lambda records: add_watermark(records, watermark_data)
+    )
+    if session is not None:
         # Broadcast to all clients in the room
         emit('watermark_added', {
             'watermark': watermark_data
-        }, room=room)
+        }, room=session['room'])
+        record_broadcast('watermark_added', session['room'])
         
         websocket_logger.info(f'Added watermark to session {file_id}: {watermark_data.get("text", "N/A")}')
 
-@socketio.on('remove_watermark')
+@on_event('remove_watermark')
 def handle_remove_watermark(data):
     """Remove a watermark"""
     file_id = data.get('file_id')
     watermark_id = data.get('watermark_id')
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Remove watermark from session
-        session['watermarks'] = [w for w in session['watermarks'] if w.get('id') != watermark_id]
-        
+    # Remove watermark from session
+    session = active_sessions.modify_watermarks(
+        file_id, [watermark_id], lambda records: remove_watermark(records, watermark_id)
+    )
+    if session is not None:
         # Broadcast to all clients in the room
         emit('watermark_removed', {
             'watermark_id': watermark_id
-        }, room=room)
+        }, room=session['room'])
+        record_broadcast('watermark_removed', session['room'])
         
         websocket_logger.info(f'Removed watermark {watermark_id} from session {file_id}')
 
-@socketio.on('update_watermark_properties')
+@on_event('update_watermark_properties')
 def handle_update_properties(data):
     """Update watermark properties (text, color, size, etc.)"""
     file_id = data.get('file_id')
     watermark_id = data.get('watermark_id')
     properties = data.get('properties')
     
-    if file_id in active_sessions:
-        session = active_sessions[file_id]
-        room = session['room']
-        
-        # Update watermark properties
-        for watermark in session['watermarks']:
-            if watermark.get('id') == watermark_id:
-                watermark.update(properties)
-                break
-        
-        # Broadcast to all clients in the room
-        emit('watermark_properties_updated', {
-            'watermark_id': watermark_id,
-            'properties': properties
-        }, room=room)
-        
-        websocket_logger.info(f'Updated properties for watermark {watermark_id} in session {file_id}: {list(properties.keys())}')
+    if not isinstance(properties, dict):
+        return
+    
+    # Stored and broadcast with the next tick, stale updates are dropped
+    if update_coalescer.submit(file_id, watermark_id, request.sid, client_seq(data), properties=properties):
+        websocket_logger.debug(f'Queued properties for watermark {watermark_id} in session {file_id}: {list(properties.keys())}')
 
 if __name__ == '__main__':
     app_logger.info('=== PDF Watermark Backend Server Starting ===')
@@ -393,6 +915,9 @@ if __name__ == '__main__':
     app_logger.info('  - Max file size: 16MB')
     app_logger.info('  - Upload folder: ' + app.config['UPLOAD_FOLDER'])
     app_logger.info('  - Output folder: ' + app.config['OUTPUT_FOLDER'])
+    app_logger.info('  - Session store: ' + SESSION_STORE_URL.split('://')[0])
+    app_logger.info(f'  - Engine pool threads: {ENGINE_POOL_SIZE}')
+    app_logger.info('  - Socket.IO message queue: ' + ('enabled' if SOCKETIO_MESSAGE_QUEUE else 'disabled'))
     app_logger.info('=== Server Ready ===')
     
     socketio.run(app, host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,301 @@
+"""
+Resumable chunked uploads
+Large files are sent as a sequence of chunks, each written at its offset into a preallocated file.
+The server tracks the confirmed offset so an interrupted upload resumes where it stopped.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from PyPDF2 import PdfReader
+from engine_pool import run_engine
+
+# Bytes read from the request body at a time, bounding memory use per chunk
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Size clients are asked to send per request, kept under MAX_CONTENT_LENGTH
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Largest upload accepted through the chunked protocol
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 1024 * 1024 * 1024))
+
+# Uploads in progress and the disk space preallocated for them, across all clients
+MAX_PENDING_UPLOADS = int(os.environ.get('MAX_PENDING_UPLOADS', 32))
+MAX_PENDING_BYTES = int(os.environ.get('MAX_PENDING_BYTES', 4 * 1024 * 1024 * 1024))
+
+# Uploads without a chunk for this long are abandoned, and dropped when space is needed
+STALE_UPLOAD_SECONDS = int(os.environ.get('STALE_UPLOAD_SECONDS', 24 * 60 * 60))
+
+# How far from the end of a PDF to look for %%EOF
+PDF_TRAILER_SEARCH_BYTES = 2048
+
+class UploadBusyError(Exception):
+    """Another request is writing a chunk of the same upload"""
+
+class UploadCapacityError(Exception):
+    """Starting the upload would exceed the uploads or bytes allowed in progress"""
+
+class UploadOffsetError(ValueError):
+    """A chunk was sent for a different offset than the server has confirmed"""
+
+    def __init__(self, expected_offset, received_offset):
+        super().__init__(f"Expected offset {expected_offset}, got {received_offset}")
+        self.offset = expected_offset
+
+def validate_pdf(file_path):
+    """
+    Check that a file is a readable PDF without loading it into memory
+
+    Returns:
+        int: Number of pages
+
+    Raises:
+        ValueError: If the file is not a valid PDF
+    """
+    with open(file_path, 'rb') as pdf_file:
+        if not pdf_file.read(1024).lstrip().startswith(b'%PDF-'):
+            raise ValueError("File is not a PDF (missing %PDF header)")
+
+        pdf_file.seek(0, os.SEEK_END)
+        pdf_file.seek(max(0, pdf_file.tell() - PDF_TRAILER_SEARCH_BYTES))
+        if b'%%EOF' not in pdf_file.read():
+            raise ValueError("File is not a complete PDF (missing %%EOF)")
+
+        # Reading from the open handle keeps PyPDF2 from copying the file into memory;
+        # only the cross-reference table and page tree are parsed
+        pdf_file.seek(0)
+        try:
+            return len(PdfReader(pdf_file).pages)
+        except Exception as e:
+            raise ValueError(f"File is not a valid PDF: {e}")
+
+class ChunkedUploadStore:
+    """
+    In-progress uploads, each a preallocated <id>.part file plus a <id>.json state file
+
+    Methods are called on the eventlet hub. Locks are only ever tried without blocking, and
+    disk work runs in the engine pool, so a slow client never stalls other requests.
+    """
+
+    def __init__(self, upload_dir, max_upload_bytes=MAX_UPLOAD_BYTES,
+                 max_pending_uploads=MAX_PENDING_UPLOADS, max_pending_bytes=MAX_PENDING_BYTES):
+        self.upload_dir = upload_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.max_pending_uploads = max_pending_uploads
+        self.max_pending_bytes = max_pending_bytes
+        os.makedirs(upload_dir, exist_ok=True)
+
+        # Only held for dictionary updates, never across I/O
+        self._lock = threading.Lock()
+        # upload id -> lock held while a chunk of that upload is written
+        self._upload_locks = {}
+        # upload id -> running SHA-256 of the bytes up to the confirmed offset
+        self._digests = {}
+        # upload id -> bytes preallocated, including uploads left by a previous run
+        self._reserved = {}
+        for name in os.listdir(upload_dir):
+            if name.endswith('.json'):
+                upload = self.get(name[:-len('.json')])
+                if upload is not None:
+                    self._reserved[upload['upload_id']] = upload['size']
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.part")
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.json")
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def _save_state(self, upload):
+        # Written to a temporary name and renamed, so a crash never leaves a torn state file
+        temp_path = self._state_path(upload['upload_id']) + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(upload, state_file)
+        os.replace(temp_path, self._state_path(upload['upload_id']))
+
+    def _reserve(self, upload_id, size):
+        """Account for a new upload's space, False when it does not fit in the limits"""
+        with self._lock:
+            if (len(self._reserved) < self.max_pending_uploads
+                    and sum(self._reserved.values()) + size <= self.max_pending_bytes):
+                self._reserved[upload_id] = size
+                return True
+        return False
+
+    def _preallocate(self, upload):
+        fd = os.open(self._data_path(upload['upload_id']), os.O_CREAT | os.O_WRONLY, 0o644)
+        try:
+            # Reserve the blocks up front, so the upload cannot run out of disk halfway
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, upload['size'])
+            else:
+                os.ftruncate(fd, upload['size'])
+        finally:
+            os.close(fd)
+        self._save_state(upload)
+
+    def create(self, filename, size):
+        """
+        Start an upload of size bytes and preallocate its file
+
+        Raises:
+            ValueError: If size is outside 1..max_upload_bytes
+            UploadCapacityError: If too many uploads or bytes are already in progress
+        """
+        if size <= 0 or size > self.max_upload_bytes:
+            raise ValueError(f"Upload size must be between 1 and {self.max_upload_bytes} bytes")
+
+        upload = {
+            'upload_id': str(uuid.uuid4()),
+            'filename': filename,
+            'size': size,
+            'offset': 0
+        }
+
+        if not self._reserve(upload['upload_id'], size):
+            # Make room by dropping abandoned uploads, then try once more
+            run_engine(self.discard_stale)
+            if not self._reserve(upload['upload_id'], size):
+                raise UploadCapacityError("Too many uploads in progress, try again later")
+
+        try:
+            run_engine(self._preallocate, upload)
+        except Exception as e:
+            self.discard(upload['upload_id'])
+            raise e
+
+        self._digests[upload['upload_id']] = hashlib.sha256()
+        return upload
+
+    def get(self, upload_id):
+        """Return the state of an upload, or None if it is unknown"""
+        try:
+            # Ids come from URLs and name files, only accept the UUIDs handed out by create()
+            if str(uuid.UUID(upload_id)) != upload_id:
+                return None
+            with open(self._state_path(upload_id)) as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """
+        Write length bytes from stream at offset
+
+        Returns:
+            dict: The upload state after the chunk
+
+        Raises:
+            UploadOffsetError: If offset is not the confirmed offset
+            UploadBusyError: If another chunk of the upload is being written
+        """
+        upload_lock = self._upload_lock(upload_id)
+        # Never wait: the holder may be suspended on a socket read of the same hub
+        if not upload_lock.acquire(blocking=False):
+            raise UploadBusyError(upload_id)
+        try:
+            upload = self.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if offset != upload['offset']:
+                raise UploadOffsetError(upload['offset'], offset)
+            if offset + length > upload['size']:
+                raise ValueError("Chunk extends past the declared upload size")
+
+            digest = self._digests.get(upload_id)
+            written = 0
+            data_file = run_engine(open, self._data_path(upload_id), 'r+b')
+            try:
+                data_file.seek(offset)
+                while written < length:
+                    # Read on the hub, where the socket read is green, and write in the pool
+                    buffer = stream.read(min(WRITE_BUFFER_SIZE, length - written))
+                    if not buffer:
+                        break
+                    run_engine(data_file.write, buffer)
+                    if digest is not None:
+                        digest.update(buffer)
+                    written += len(buffer)
+            finally:
+                run_engine(data_file.close)
+                # Only the bytes that arrived are confirmed, a dropped connection resumes from here
+                upload['offset'] = offset + written
+                run_engine(self._save_state, upload)
+            return upload
+        finally:
+            upload_lock.release()
+
+    def finish(self, upload_id):
+        """
+        Validate a fully received upload and hand its file over to the caller
+
+        The upload is forgotten once it is finished, so a repeated finish raises KeyError.
+
+        Returns:
+            tuple: (path of the received file, SHA-256 hex digest, number of pages)
+
+        Raises:
+            KeyError: If the upload is unknown or already finished
+            UploadBusyError: If a chunk is being written or another finish is running
+            ValueError: If bytes are missing or the file is not a valid PDF
+        """
+        upload_lock = self._upload_lock(upload_id)
+        if not upload_lock.acquire(blocking=False):
+            raise UploadBusyError(upload_id)
+        try:
+            upload = self.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if upload['offset'] != upload['size']:
+                raise ValueError(f"Upload incomplete: {upload['offset']} of {upload['size']} bytes received")
+
+            data_path = self._data_path(upload_id)
+            num_pages = run_engine(validate_pdf, data_path)
+
+            digest = self._digests.get(upload_id)
+            if digest is None:
+                # The running hash was lost with a restart, hash the file once instead
+                digest = run_engine(self._hash_file, data_path)
+
+            # Moved out of the upload's names before it is forgotten, the caller owns the file now
+            received_path = os.path.join(self.upload_dir, f"{upload_id}.pdf")
+            run_engine(os.replace, data_path, received_path)
+            run_engine(self.discard, upload_id)
+            return received_path, digest.hexdigest(), num_pages
+        finally:
+            upload_lock.release()
+
+    def _hash_file(self, data_path):
+        digest = hashlib.sha256()
+        with open(data_path, 'rb') as data_file:
+            for buffer in iter(lambda: data_file.read(WRITE_BUFFER_SIZE), b''):
+                digest.update(buffer)
+        return digest
+
+    def discard(self, upload_id):
+        """Forget an upload and remove whatever is left of its files"""
+        self._digests.pop(upload_id, None)
+        for path in (self._data_path(upload_id), self._state_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+            self._reserved.pop(upload_id, None)
+
+    def discard_stale(self, max_age=STALE_UPLOAD_SECONDS):
+        """Discard uploads that have not received a chunk for max_age seconds"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            upload_ids = list(self._reserved)
+        for upload_id in upload_ids:
+            try:
+                if os.path.getmtime(self._state_path(upload_id)) < cutoff:
+                    self.discard(upload_id)
+            except FileNotFoundError:
+                self.discard(upload_id)
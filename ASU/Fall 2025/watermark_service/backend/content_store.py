@@ -0,0 +1,155 @@
+"""
+Content-addressed store for uploaded PDFs
+Uploads are hashed while they are written, kept once as <sha256>.pdf, and handed to sessions
+as hard links, so the filesystem's link count is the reference count of each stored file.
+Metadata computed from stored content is kept next to it as <sha256>.json.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+# Bytes copied at a time when storing a file that was not streamed into the store
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class HashingWriter:
+    """Temporary file in the store that hashes every byte written to it"""
+
+    def __init__(self, store_dir):
+        fd, self.path = tempfile.mkstemp(dir=store_dir, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def close(self):
+        """Close the file, deleting it unless it was committed to the store"""
+        self._file.close()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # read, seek, tell and friends go straight to the underlying file
+        return getattr(self._file, name)
+
+class ContentStore:
+    """Uploaded files stored once per content hash"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        # Keeps a blob from being removed between the existence check and linking a new handle
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.store_dir, f"{sha256}.pdf")
+
+    def metadata_path(self, sha256):
+        return os.path.join(self.store_dir, f"{sha256}.json")
+
+    def save_metadata(self, sha256, metadata):
+        """Record metadata of stored content, replacing the file atomically for concurrent readers"""
+        fd, temp_path = tempfile.mkstemp(dir=self.store_dir, suffix='.part')
+        with os.fdopen(fd, 'w') as metadata_file:
+            json.dump(metadata, metadata_file, separators=(',', ':'))
+        os.replace(temp_path, self.metadata_path(sha256))
+
+    def load_metadata(self, sha256):
+        """Metadata recorded for stored content, or None"""
+        try:
+            with open(self.metadata_path(sha256)) as metadata_file:
+                return json.load(metadata_file)
+        except FileNotFoundError:
+            return None
+
+    def new_writer(self):
+        """Writable file that hashes an upload while it streams in"""
+        return HashingWriter(self.store_dir)
+
+    def commit(self, writer, handle_path):
+        """
+        Move a finished upload into the store and link handle_path to it
+
+        Returns:
+            tuple: (sha256, True when the content was already stored)
+        """
+        sha256 = writer.hexdigest()
+        blob_path = self.blob_path(sha256)
+        writer.flush()
+
+        with self._lock:
+            duplicate = os.path.exists(blob_path)
+            if not duplicate:
+                writer.committed = True
+                os.replace(writer.path, blob_path)
+            os.link(blob_path, handle_path)
+        # Duplicates are dropped here, when close() removes the temporary file
+        writer.close()
+
+        return sha256, duplicate
+
+    def store_file(self, source, handle_path):
+        """Store the contents of a readable binary file object, see commit()"""
+        writer = self.new_writer()
+        try:
+            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                writer.write(chunk)
+        except Exception as e:
+            writer.close()
+            raise e
+        return self.commit(writer, handle_path)
+
+    def adopt(self, file_path, sha256, handle_path):
+        """Move an already hashed file into the store and link handle_path to it, see commit()"""
+        blob_path = self.blob_path(sha256)
+        with self._lock:
+            duplicate = os.path.exists(blob_path)
+            if duplicate:
+                os.remove(file_path)
+            else:
+                os.replace(file_path, blob_path)
+            os.link(blob_path, handle_path)
+        return sha256, duplicate
+
+    def release_handle(self, sha256, handle_path):
+        """Remove a session's handle, and the stored content once no handle is left"""
+        blob_path = self.blob_path(sha256)
+        with self._lock:
+            if os.path.exists(handle_path):
+                os.remove(handle_path)
+            try:
+                # Only the store's own link remains
+                if os.stat(blob_path).st_nlink <= 1:
+                    os.remove(blob_path)
+                    if os.path.exists(self.metadata_path(sha256)):
+                        os.remove(self.metadata_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def refcount(self, sha256):
+        """Number of handles pointing at stored content"""
+        try:
+            return os.stat(self.blob_path(sha256)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def stats(self):
+        """Stored files and their total size"""
+        entries = 0
+        size_bytes = 0
+        with os.scandir(self.store_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith('.pdf'):
+                    entries += 1
+                    size_bytes += entry.stat().st_size
+        return {'entries': entries, 'size_bytes': size_bytes}
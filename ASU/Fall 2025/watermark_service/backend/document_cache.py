@@ -0,0 +1,103 @@
+"""
+Cache of parsed PDF documents
+Keeps recently used PdfReaders so pdf-info, previews, tiles and watermark jobs do not re-read and
+re-parse the whole file. The cache is bounded by an estimate of the memory the readers hold.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from PyPDF2 import PdfReader
+
+# Parsed documents kept in memory
+DEFAULT_MAX_DOCUMENTS = 16
+DEFAULT_MAX_BYTES = int(os.environ.get('DOCUMENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# A reader holds the file's bytes, plus about this much per page once the page tree is flattened
+PAGE_OVERHEAD_BYTES = 6 * 1024
+
+class CachedDocument:
+    """A parsed document and the lock that serializes reads from it"""
+
+    def __init__(self, reader, size):
+        self.reader = reader
+        # Estimated memory held by the reader
+        self.size = size
+        # PdfReader seeks a shared stream while it resolves objects, one reader at a time
+        self.lock = threading.Lock()
+
+class DocumentCache:
+    """Least recently used PdfReaders, bounded by count and estimated memory"""
+
+    def __init__(self, max_documents=DEFAULT_MAX_DOCUMENTS, max_bytes=DEFAULT_MAX_BYTES, parse_timer=None):
+        """
+        Args:
+            parse_timer: Called with the seconds each parse took, e.g. to record a metric
+        """
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.parse_timer = parse_timer
+        self._documents = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pdf_path, key=None):
+        """
+        Return the CachedDocument for a file, parsing it on first use
+
+        Args:
+            pdf_path (str): The file to parse on a miss
+            key (tuple): Identifies this version of the file, e.g. (file_id, sha256). Its first
+                item names the document for invalidate(). Defaults to the path, size and mtime.
+        """
+        if key is None:
+            stat = os.stat(pdf_path)
+            key = (pdf_path, stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        # Parse outside the lock so other documents stay available meanwhile
+        start_time = time.perf_counter()
+        reader = PdfReader(pdf_path)
+        document = CachedDocument(reader, os.path.getsize(pdf_path) + len(reader.pages) * PAGE_OVERHEAD_BYTES)
+        if self.parse_timer is not None:
+            self.parse_timer(time.perf_counter() - start_time)
+
+        with self._lock:
+            previous = self._documents.pop(key, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._documents[key] = document
+            self._size += document.size
+            # The newest document stays even if it alone is over the limit, it is in use
+            while len(self._documents) > 1 and (
+                len(self._documents) > self.max_documents or self._size > self.max_bytes
+            ):
+                _, evicted = self._documents.popitem(last=False)
+                self._size -= evicted.size
+        return document
+
+    def invalidate(self, name):
+        """Drop every cached version of a document, by path or by the first item of its key"""
+        with self._lock:
+            for key in [key for key in self._documents if key[0] == name]:
+                self._size -= self._documents.pop(key).size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self._documents),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,71 @@
+"""
+Document metadata computed once per upload
+Page count, byte size, encryption state and the geometry of every page, recorded when an upload
+finishes so pdf-info, tiles and watermark jobs do not walk the page tree again.
+
+Records are compact JSON: each distinct page geometry is listed once, and pages refer to them
+as runs of [count, geometry index], so a uniform 2,000-page document is a single run.
+"""
+
+import os
+from page_geometry import PageGeometry, page_geometry
+
+# Bump when the record layout changes, older records are recomputed
+METADATA_VERSION = 1
+
+def analyze_document(reader, pdf_path):
+    """Metadata record of a parsed document"""
+    geometries = []
+    geometry_index = {}
+    page_runs = []
+
+    for page in reader.pages:
+        geometry = page_geometry(page)
+        index = geometry_index.get(geometry)
+        if index is None:
+            index = geometry_index[geometry] = len(geometries)
+            geometries.append([list(geometry.mediabox), list(geometry.cropbox), geometry.rotation])
+        if page_runs and page_runs[-1][1] == index:
+            page_runs[-1][0] += 1
+        else:
+            page_runs.append([1, index])
+
+    return {
+        'version': METADATA_VERSION,
+        'num_pages': len(reader.pages),
+        'byte_size': os.path.getsize(pdf_path),
+        'encrypted': bool(reader.is_encrypted),
+        'geometries': geometries,
+        'page_runs': page_runs
+    }
+
+def _geometry(entry):
+    mediabox, cropbox, rotation = entry
+    return PageGeometry(mediabox=tuple(mediabox), cropbox=tuple(cropbox), rotation=rotation)
+
+def page_geometry_at(metadata, page_number):
+    """Geometry of a 1-indexed page, or None when it is out of range"""
+    if not 1 <= page_number <= metadata['num_pages']:
+        return None
+    for count, index in metadata['page_runs']:
+        if page_number <= count:
+            return _geometry(metadata['geometries'][index])
+        page_number -= count
+
+def page_geometries(metadata):
+    """Geometry of every page, in page order"""
+    geometries = [_geometry(entry) for entry in metadata['geometries']]
+    return [geometries[index] for count, index in metadata['page_runs'] for _ in range(count)]
+
+def pdf_info(metadata):
+    """The fields returned by PDFWatermarker.get_pdf_info, plus byte size and encryption state"""
+    mediabox = metadata['geometries'][0][0] if metadata['geometries'] else [0, 0, 0, 0]
+    return {
+        'num_pages': metadata['num_pages'],
+        'page_size': {
+            'width': mediabox[2] - mediabox[0],
+            'height': mediabox[3] - mediabox[1]
+        },
+        'byte_size': metadata['byte_size'],
+        'encrypted': metadata['encrypted']
+    }
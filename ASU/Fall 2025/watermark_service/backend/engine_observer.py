@@ -0,0 +1,66 @@
+"""
+Observers of PDFWatermarker work
+The engine reports finished spans of work with their timings and sizes to an observer, instead of
+printing progress. Without an observer the engine only checks for None where a span ends.
+
+Spans, with the fields passed along:
+    document  operation, pages, watermarked_pages, stamp_mode, output_mode, parallel,
+              input_bytes, output_bytes
+    parse     pages
+    layout    lines, font_size
+    overlay   watermarks, bytes (the overlay PDF, including its layout time)
+    page      page, watermarks (adding one page to the output and stamping it)
+    merge     pages, watermarked_pages, overlays (all page spans of one job)
+    write     bytes
+"""
+
+import sys
+
+class EngineObserver:
+    """Receives spans and messages from PDFWatermarker, override the methods you need"""
+
+    def on_span(self, name, seconds, **fields):
+        """A span of engine work finished"""
+
+    def on_message(self, message):
+        """A progress message, e.g. a fallback the engine took"""
+
+class PrintObserver(EngineObserver):
+    """Prints spans and messages, for debugging the engine from a console"""
+
+    def __init__(self, stream=None, spans=None):
+        """
+        Args:
+            stream: Where to print, defaults to stdout
+            spans (set): Span names to print, defaults to all (page spans print once per page)
+        """
+        self.stream = stream
+        self.spans = spans
+
+    def on_span(self, name, seconds, **fields):
+        if self.spans is None or name in self.spans:
+            details = ' '.join(f"{key}={value}" for key, value in fields.items())
+            print(f"[{name}] {seconds * 1000:.2f}ms {details}", file=self.stream or sys.stdout)
+
+    def on_message(self, message):
+        print(message, file=self.stream or sys.stdout)
+
+# Spans reported by StageTimerObserver, and the stage each one is reported as
+STAGE_SPANS = {
+    'parse': 'parse',
+    'layout': 'layout',
+    'overlay': 'overlay_render',
+    'merge': 'merge',
+    'write': 'write'
+}
+
+class StageTimerObserver(EngineObserver):
+    """Reports the duration of each engine stage to timer(stage, seconds), e.g. to record a metric"""
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def on_span(self, name, seconds, **fields):
+        stage = STAGE_SPANS.get(name)
+        if stage is not None:
+            self.timer(stage, seconds)
@@ -0,0 +1,42 @@
+"""
+Runs blocking PDF engine work off the eventlet hub
+The servers run Socket.IO on eventlet, where every request and heartbeat shares one OS thread.
+Engine calls are CPU work plus blocking file I/O, so they are handed to eventlet's pool of native
+threads and the calling greenthread waits without stalling the others.
+"""
+
+import os
+
+try:
+    from eventlet import tpool
+except ImportError:
+    tpool = None
+
+# Native threads running engine calls, 0 runs them on the calling greenthread
+ENGINE_POOL_SIZE = int(os.environ.get('ENGINE_POOL_SIZE', 4))
+
+if tpool is not None:
+    # Only takes effect before the pool's first use
+    tpool.set_num_threads(ENGINE_POOL_SIZE)
+    # Exceptions are re-raised to the caller, which reports them
+    tpool.QUIET = True
+
+def run_engine(func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) in the engine pool and return its result
+
+    Exceptions raised by func are raised here. Anything func locks must only be locked inside
+    engine calls, a lock held by a pool thread would block the hub if a greenthread waited on it.
+    """
+    if tpool is None:
+        return func(*args, **kwargs)
+    return tpool.execute(func, *args, **kwargs)
+
+def iterate_in_engine_pool(iterator):
+    """Yield the items of a blocking iterator, advancing it in the engine pool"""
+    done = object()
+    while True:
+        item = run_engine(next, iterator, done)
+        if item is done:
+            return
+        yield item
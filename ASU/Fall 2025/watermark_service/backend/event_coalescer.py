@@ -0,0 +1,119 @@
+"""
+Server-side coalescing of watermark update events
+Position and property updates are collected per (session, watermark) and flushed at a fixed
+rate, so each session receives at most one batched broadcast per tick however fast clients send.
+"""
+
+import os
+import threading
+import traceback
+
+# Broadcast ticks per second
+COALESCE_RATE_HZ = float(os.environ.get('WATERMARK_UPDATE_RATE_HZ', 30))
+
+class UpdateCoalescer:
+    """Latest pending update of each watermark, flushed once per tick"""
+
+    def __init__(self, flush_updates, rate=COALESCE_RATE_HZ):
+        """
+        Args:
+            flush_updates (callable): Called as flush_updates(file_id, updates) once per tick for
+                each session with pending updates, updates being a list of deltas
+            rate (float): Ticks per second
+        """
+        self.flush_updates = flush_updates
+        self.interval = 1.0 / rate
+        # file_id -> {watermark_id: delta}, dicts keep watermarks in first-update order
+        self._pending = {}
+        # (file_id, watermark_id, client_id, field) -> highest sequence number accepted from that client
+        self._last_seq = {}
+        self._lock = threading.Lock()
+        self.tick = 0
+        self.received = 0
+        self.stale = 0
+        self.broadcasts = 0
+
+    def submit(self, file_id, watermark_id, client_id=None, seq=None, position=None, properties=None):
+        """
+        Record an update for the next tick
+
+        A field (the position or a property) carrying a sequence number no higher than one already
+        accepted for it from the same client is stale and dropped. A newer position replaces a
+        pending one, properties merge.
+
+        Returns:
+            bool: False if the whole update was stale
+        """
+        properties = dict(properties or {})
+        with self._lock:
+            self.received += 1
+            if seq is not None:
+                if position is not None and not self._accept((file_id, watermark_id, client_id, 'position'), seq):
+                    position = None
+                for name in list(properties):
+                    if not self._accept((file_id, watermark_id, client_id, ('properties', name)), seq):
+                        del properties[name]
+                if position is None and not properties:
+                    self.stale += 1
+                    return False
+
+            delta = self._pending.setdefault(file_id, {}).setdefault(watermark_id, {'watermark_id': watermark_id})
+            if position is not None:
+                delta['position'] = position
+            if properties:
+                delta.setdefault('properties', {}).update(properties)
+            if seq is not None:
+                delta['seq'] = seq
+            return True
+
+    def _accept(self, seq_key, seq):
+        if seq <= self._last_seq.get(seq_key, float('-inf')):
+            return False
+        self._last_seq[seq_key] = seq
+        return True
+
+    def flush(self):
+        """Hand every session's pending updates to flush_updates, returns the number of sessions flushed"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if pending:
+                self.tick += 1
+
+        for file_id, deltas in pending.items():
+            try:
+                self.flush_updates(file_id, list(deltas.values()))
+            except Exception:
+                # A failing session must not stop broadcasts for the others
+                traceback.print_exc()
+        with self._lock:
+            self.broadcasts += len(pending)
+        return len(pending)
+
+    def run(self, sleep, stop_event=None):
+        """Flush every tick until stop_event is set, sleep being the server's cooperative sleep"""
+        while stop_event is None or not stop_event.is_set():
+            sleep(self.interval)
+            self.flush()
+
+    def forget_client(self, client_id):
+        """Drop the sequence numbers of a disconnected client"""
+        with self._lock:
+            for seq_key in [key for key in self._last_seq if key[2] == client_id]:
+                del self._last_seq[seq_key]
+
+    def forget_session(self, file_id):
+        """Drop pending updates and sequence numbers of a closed session"""
+        with self._lock:
+            self._pending.pop(file_id, None)
+            for seq_key in [key for key in self._last_seq if key[0] == file_id]:
+                del self._last_seq[seq_key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate_hz': 1.0 / self.interval,
+                'ticks': self.tick,
+                'received': self.received,
+                'stale': self.stale,
+                'broadcasts': self.broadcasts
+            }
@@ -0,0 +1,30 @@
+"""
+Font metrics for watermark text layout
+Measures text straight from ReportLab's glyph-width tables, without a canvas or any file I/O
+"""
+
+from functools import lru_cache
+from reportlab.pdfbase import pdfmetrics
+
+# Widths are measured once at this size and scaled linearly to every other size
+UNIT_FONT_SIZE = 1000
+
+# Upper bound on the number of cached (text, font) measurements
+MAX_CACHED_WIDTHS = 16384
+
+@lru_cache(maxsize=MAX_CACHED_WIDTHS)
+def _unit_width(text, font_name):
+    """Width of text at UNIT_FONT_SIZE, read from the font's glyph-width table"""
+    return pdfmetrics.stringWidth(text, font_name, UNIT_FONT_SIZE)
+
+def text_width(text, font_name, font_size):
+    """Get the width of text in points for the given font and size"""
+    return _unit_width(text, font_name) * font_size / UNIT_FONT_SIZE
+
+def cache_info():
+    """Return hit/miss statistics of the width cache"""
+    return _unit_width.cache_info()
+
+def clear_cache():
+    """Drop all cached measurements"""
+    _unit_width.cache_clear()
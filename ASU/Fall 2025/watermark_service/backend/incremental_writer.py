@@ -0,0 +1,142 @@
+"""
+Incremental-update PDF writer
+Appends new and modified objects plus a new xref section to a copy of the original file,
+so write cost scales with the objects that changed rather than the size of the document
+"""
+
+import os
+import shutil
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject
+)
+
+# How far from the end of the file to look for the startxref keyword
+STARTXREF_SEARCH_BYTES = 2048
+
+def find_startxref(pdf_path):
+    """Return the byte offset of the last cross-reference section of a PDF file"""
+    with open(pdf_path, 'rb') as pdf_file:
+        pdf_file.seek(0, os.SEEK_END)
+        file_size = pdf_file.tell()
+        pdf_file.seek(max(0, file_size - STARTXREF_SEARCH_BYTES))
+        tail = pdf_file.read()
+
+    keyword_index = tail.rfind(b'startxref')
+    if keyword_index == -1:
+        raise ValueError(f"No startxref found in {pdf_path}")
+
+    return int(tail[keyword_index + len(b'startxref'):].split()[0])
+
+class IncrementalWriter:
+    """Collects new and modified objects for a PdfReader's document and appends them as an update"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._next_number = int(reader.trailer['/Size'])
+        # object number -> (generation, object)
+        self._objects = {}
+        # (id(source pdf), object number) -> reference in this document
+        self._imported = {}
+
+    def _add_object(self, obj):
+        """Add a new object and return its indirect reference"""
+        reference = IndirectObject(self._next_number, 0, self)
+        self._next_number += 1
+        self._objects[reference.idnum] = (0, obj)
+        return reference
+
+    def get_object(self, reference):
+        """Resolve a reference to an object added to this update"""
+        return self._objects[reference.idnum][1]
+
+    def update_object(self, reference, obj):
+        """Replace an existing object of the original document"""
+        self._objects[reference.idnum] = (reference.generation, obj)
+
+    def import_object(self, obj):
+        """Copy an object from another PDF, adding every object it references to this update"""
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is self.reader or obj.pdf is self:
+                return obj
+
+            key = (id(obj.pdf), obj.idnum)
+            reference = self._imported.get(key)
+            if reference is None:
+                # Reserve the number first so reference cycles terminate
+                reference = self._add_object(None)
+                self._imported[key] = reference
+                self._objects[reference.idnum] = (0, self.import_object(obj.get_object()))
+            return reference
+
+        if isinstance(obj, StreamObject):
+            copy = obj.__class__()
+            copy._data = obj._data
+            for key, value in obj.items():
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            for key, value in obj.items():
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.import_object(value) for value in obj)
+
+        return obj
+
+    def write(self, input_path, output_path):
+        """Write the original document followed by this update to output_path"""
+        previous_xref = find_startxref(input_path)
+
+        if not (os.path.exists(output_path) and os.path.samefile(input_path, output_path)):
+            # copyfile lets the kernel copy the bytes (sendfile/copy_file_range)
+            shutil.copyfile(input_path, output_path)
+
+        with open(output_path, 'r+b') as output_file:
+            output_file.seek(-1, os.SEEK_END)
+            if output_file.read(1) not in (b'\n', b'\r'):
+                output_file.write(b'\n')
+
+            # Objects
+            offsets = {}
+            for number in sorted(self._objects):
+                generation, obj = self._objects[number]
+                offsets[number] = output_file.tell()
+                output_file.write(f"{number} {generation} obj\n".encode())
+                obj.write_to_stream(output_file, None)
+                output_file.write(b"\nendobj\n")
+
+            # Cross-reference section, one subsection per run of consecutive numbers
+            xref_offset = output_file.tell()
+            output_file.write(b"xref\n")
+            numbers = sorted(offsets)
+            run_start = 0
+            for index in range(1, len(numbers) + 1):
+                if index == len(numbers) or numbers[index] != numbers[index - 1] + 1:
+                    run = numbers[run_start:index]
+                    output_file.write(f"{run[0]} {len(run)}\n".encode())
+                    for number in run:
+                        generation = self._objects[number][0]
+                        output_file.write(f"{offsets[number]:010d} {generation:05d} n\r\n".encode())
+                    run_start = index
+
+            # Trailer pointing back at the original cross-reference section
+            trailer = DictionaryObject({
+                NameObject('/Size'): NumberObject(max(self._next_number, int(self.reader.trailer['/Size']))),
+                NameObject('/Root'): self.reader.trailer.raw_get('/Root'),
+                NameObject('/Prev'): NumberObject(previous_xref)
+            })
+            for key in ('/Info', '/ID'):
+                if key in self.reader.trailer:
+                    trailer[NameObject(key)] = self.reader.trailer.raw_get(key)
+
+            output_file.write(b"trailer\n")
+            trailer.write_to_stream(output_file, None)
+            output_file.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
@@ -0,0 +1,441 @@
+"""
+Job queue for watermark requests
+The API enqueues jobs and returns immediately, worker processes consume them (see worker.py).
+Brokers are pluggable: an in-process queue for development, SQLite for a single host, and Redis.
+
+A claimed job is leased to its worker for JOB_LEASE_SECONDS and the worker renews the lease with
+heartbeat() while it runs. When a worker dies, its lease runs out and the next dequeue() puts the
+job back in the queue, or fails it after MAX_JOB_ATTEMPTS claims.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+
+# Job states, in the order a job moves through them
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# How long finished jobs are kept for polling clients
+JOB_RESULT_TTL = 24 * 60 * 60
+
+# Seconds a claimed job stays with its worker without a heartbeat
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 60))
+
+# Claims of a job before it is failed, so a job that kills its workers is not retried forever
+MAX_JOB_ATTEMPTS = 3
+
+# Error of jobs whose workers stopped MAX_JOB_ATTEMPTS times
+WORKER_LOST_ERROR = 'The worker stopped while processing the job'
+
+def _new_job(payload, dedupe_key=None):
+    now = time.time()
+    return {
+        'id': str(uuid.uuid4()),
+        'status': JOB_QUEUED,
+        'payload': payload,
+        'result': None,
+        'error': None,
+        'dedupe_key': dedupe_key,
+        'attempts': 0,
+        'lease_expires_at': None,
+        'created_at': now,
+        'updated_at': now
+    }
+
+def job_in_progress(job, now=None):
+    """Whether a job is queued, or running on a worker whose lease has not run out"""
+    if job['status'] == JOB_QUEUED:
+        return True
+    return job['status'] == JOB_RUNNING and (job['lease_expires_at'] or 0) >= (now or time.time())
+
+class MemoryJobQueue:
+    """Jobs held in this process, for development and tests (workers must be threads of the same process)"""
+
+    def __init__(self, lease_seconds=JOB_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self._queue = queue.Queue()
+        self._jobs = {}
+        # Ids of running jobs, and dedupe key -> id of the job in progress for it
+        self._running = set()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, payload, dedupe_key=None):
+        """
+        Add a job and return its id
+
+        Args:
+            dedupe_key (str): Identifies what the job produces, see find_pending()
+        """
+        job = _new_job(payload, dedupe_key)
+        with self._lock:
+            self._jobs[job['id']] = job
+            if dedupe_key is not None:
+                self._pending[dedupe_key] = job['id']
+        self._queue.put(job['id'])
+        return job['id']
+
+    def find_pending(self, dedupe_key):
+        """The job in progress that was enqueued with dedupe_key, or None"""
+        with self._lock:
+            job = self._jobs.get(self._pending.get(dedupe_key))
+            return dict(job) if job is not None and job_in_progress(job) else None
+
+    def dequeue(self, timeout=1.0):
+        """Claim the oldest queued job, waiting up to timeout seconds, or return None"""
+        self._requeue_expired()
+        try:
+            job_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            job = self._jobs[job_id]
+            now = time.time()
+            job.update({'status': JOB_RUNNING, 'attempts': job['attempts'] + 1,
+                        'lease_expires_at': now + self.lease_seconds, 'updated_at': now})
+            self._running.add(job_id)
+            return dict(job)
+
+    def heartbeat(self, job_id):
+        """Renew the lease of a running job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] == JOB_RUNNING:
+                job['lease_expires_at'] = time.time() + self.lease_seconds
+
+    def _requeue_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id in self._running if self._jobs[job_id]['lease_expires_at'] < now]
+        for job_id in expired:
+            with self._lock:
+                job = self._jobs[job_id]
+                self._running.discard(job_id)
+                if job['attempts'] < MAX_JOB_ATTEMPTS:
+                    job.update({'status': JOB_QUEUED, 'lease_expires_at': None, 'updated_at': now})
+                    self._queue.put(job_id)
+                    continue
+            self.fail(job_id, WORKER_LOST_ERROR)
+
+    def complete(self, job_id, result):
+        self._finish(job_id, JOB_DONE, result=result)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, JOB_FAILED, error=error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update({'status': status, 'result': result, 'error': error,
+                        'lease_expires_at': None, 'updated_at': time.time()})
+            self._running.discard(job_id)
+            if self._pending.get(job['dedupe_key']) == job_id:
+                del self._pending[job['dedupe_key']]
+
+    def get(self, job_id):
+        """Return a copy of a job, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+class SQLiteJobQueue:
+    """Jobs stored in a SQLite database shared by the API and workers on one host"""
+
+    # Polling interval while waiting for a job, SQLite has no blocking pop
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, db_path, lease_seconds=JOB_LEASE_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    dedupe_key TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            # Databases created before jobs had leases
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, definition in (('dedupe_key', 'TEXT'), ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+                                       ('lease_expires_at', 'REAL')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key)')
+
+    def _connect(self):
+        """One connection per thread, in WAL mode so readers do not block the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, payload, dedupe_key=None):
+        job = _new_job(payload, dedupe_key)
+        self._connect().execute(
+            'INSERT INTO jobs (id, status, payload, dedupe_key, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job['id'], job['status'], json.dumps(payload), dedupe_key, job['created_at'], job['updated_at'])
+        )
+        return job['id']
+
+    def find_pending(self, dedupe_key):
+        row = self._connect().execute(
+            '''SELECT id FROM jobs WHERE dedupe_key = ?
+               AND (status = ? OR (status = ? AND lease_expires_at >= ?))
+               ORDER BY created_at DESC LIMIT 1''',
+            (dedupe_key, JOB_QUEUED, JOB_RUNNING, time.time())
+        ).fetchone()
+        return self.get(row['id']) if row is not None else None
+
+    def dequeue(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        conn = self._connect()
+        while True:
+            # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same job
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                # Jobs of workers that stopped go back to the queue, ahead of newer jobs
+                conn.execute(
+                    '''UPDATE jobs SET status = ?, lease_expires_at = NULL, updated_at = ?
+                       WHERE status = ? AND lease_expires_at < ? AND attempts < ?''',
+                    (JOB_QUEUED, now, JOB_RUNNING, now, MAX_JOB_ATTEMPTS)
+                )
+                conn.execute(
+                    '''UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ?
+                       WHERE status = ? AND lease_expires_at < ?''',
+                    (JOB_FAILED, WORKER_LOST_ERROR, now, JOB_RUNNING, now)
+                )
+                row = conn.execute(
+                    'SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1', (JOB_QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        '''UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?,
+                           updated_at = ? WHERE id = ?''',
+                        (JOB_RUNNING, now + self.lease_seconds, now, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except Exception as e:
+                conn.execute('ROLLBACK')
+                raise e
+
+            if row is not None:
+                return self.get(row['id'])
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    def heartbeat(self, job_id):
+        self._connect().execute(
+            'UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ?',
+            (time.time() + self.lease_seconds, job_id, JOB_RUNNING)
+        )
+
+    def complete(self, job_id, result):
+        self._finish(job_id, JOB_DONE, result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        self._finish(job_id, JOB_FAILED, error=error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        conn = self._connect()
+        conn.execute(
+            '''UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires_at = NULL, updated_at = ?
+               WHERE id = ?''',
+            (status, result, error, time.time(), job_id)
+        )
+        # Drop finished jobs nobody polled for
+        conn.execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+            (JOB_DONE, JOB_FAILED, time.time() - JOB_RESULT_TTL)
+        )
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+class RedisJobQueue:
+    """
+    Jobs stored in Redis: a list of queued ids, one hash per job, a list of claimed ids and a
+    sorted set of their lease expiry times
+    """
+
+    def __init__(self, redis_url, namespace='watermark', lease_seconds=JOB_LEASE_SECONDS):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required for redis:// job queues (pip install redis)")
+
+        self._redis_module = redis
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        self.queue_key = f"{namespace}:jobs:queue"
+        self.processing_key = f"{namespace}:jobs:processing"
+        self.leases_key = f"{namespace}:jobs:leases"
+        self.pending_prefix = f"{namespace}:jobs:pending:"
+        self.job_prefix = f"{namespace}:job:"
+
+    def enqueue(self, payload, dedupe_key=None):
+        job = _new_job(payload, dedupe_key)
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.job_prefix + job['id'], mapping={
+            'status': job['status'],
+            'payload': json.dumps(payload),
+            'dedupe_key': dedupe_key or '',
+            'attempts': 0,
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        })
+        if dedupe_key is not None:
+            # Expires with unpolled results, so a key whose job was lost is not kept forever
+            pipeline.set(self.pending_prefix + dedupe_key, job['id'], ex=JOB_RESULT_TTL)
+        pipeline.lpush(self.queue_key, job['id'])
+        pipeline.execute()
+        return job['id']
+
+    def find_pending(self, dedupe_key):
+        job_id = self.redis.get(self.pending_prefix + dedupe_key)
+        job = self.get(job_id) if job_id is not None else None
+        return job if job is not None and job_in_progress(job) else None
+
+    def dequeue(self, timeout=1.0):
+        self._requeue_expired()
+        # Moved atomically to the processing list, so a worker that stops right after the pop
+        # cannot lose the job. The timeout is in whole seconds, 0 would block forever
+        job_id = self.redis.brpoplpush(self.queue_key, self.processing_key, timeout=max(1, int(timeout)))
+        if job_id is None:
+            return None
+        now = time.time()
+        pipeline = self.redis.pipeline()
+        pipeline.zadd(self.leases_key, {job_id: now + self.lease_seconds})
+        pipeline.hincrby(self.job_prefix + job_id, 'attempts', 1)
+        pipeline.hset(self.job_prefix + job_id, mapping={
+            'status': JOB_RUNNING, 'lease_expires_at': now + self.lease_seconds, 'updated_at': now
+        })
+        pipeline.execute()
+        return self.get(job_id)
+
+    def heartbeat(self, job_id):
+        expires_at = time.time() + self.lease_seconds
+        # xx: a job already taken back from this worker stays with the queue
+        if self.redis.zadd(self.leases_key, {job_id: expires_at}, xx=True, ch=True):
+            self.redis.hset(self.job_prefix + job_id, 'lease_expires_at', expires_at)
+
+    def _requeue_expired(self):
+        now = time.time()
+        # Claimed ids without a lease belong to a worker that stopped between the pop and the lease
+        for job_id in self.redis.lrange(self.processing_key, 0, -1):
+            self.redis.zadd(self.leases_key, {job_id: now + self.lease_seconds}, nx=True)
+
+        for job_id in self.redis.zrangebyscore(self.leases_key, '-inf', now):
+            # Whoever removes the lease takes the job back, other API and worker processes skip it
+            if not self.redis.zrem(self.leases_key, job_id):
+                continue
+            job = self.get(job_id)
+            if job is None or job['status'] not in (JOB_QUEUED, JOB_RUNNING):
+                # Finished by its worker after the lease ran out
+                self.redis.lrem(self.processing_key, 0, job_id)
+            elif job['attempts'] < MAX_JOB_ATTEMPTS:
+                pipeline = self.redis.pipeline()
+                pipeline.hset(self.job_prefix + job_id, mapping={
+                    'status': JOB_QUEUED, 'lease_expires_at': '', 'updated_at': now
+                })
+                pipeline.lrem(self.processing_key, 0, job_id)
+                # The consuming end of the queue, the job runs next
+                pipeline.rpush(self.queue_key, job_id)
+                pipeline.execute()
+            else:
+                self.fail(job_id, WORKER_LOST_ERROR)
+
+    def complete(self, job_id, result):
+        self._finish(job_id, {'status': JOB_DONE, 'result': json.dumps(result)})
+
+    def fail(self, job_id, error):
+        self._finish(job_id, {'status': JOB_FAILED, 'error': error})
+
+    def _finish(self, job_id, fields):
+        fields.update({'lease_expires_at': '', 'updated_at': time.time()})
+        dedupe_key = self.redis.hget(self.job_prefix + job_id, 'dedupe_key')
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.job_prefix + job_id, mapping=fields)
+        pipeline.expire(self.job_prefix + job_id, JOB_RESULT_TTL)
+        pipeline.lrem(self.processing_key, 0, job_id)
+        pipeline.zrem(self.leases_key, job_id)
+        pipeline.execute()
+        if dedupe_key:
+            # Only if no later job has taken the key over
+            pending_key = self.pending_prefix + dedupe_key
+            with self.redis.pipeline() as pipeline:
+                try:
+                    pipeline.watch(pending_key)
+                    if pipeline.get(pending_key) == job_id:
+                        pipeline.multi()
+                        pipeline.delete(pending_key)
+                        pipeline.execute()
+                    else:
+                        pipeline.unwatch()
+                except self._redis_module.WatchError:
+                    pass
+
+    def get(self, job_id):
+        fields = self.redis.hgetall(self.job_prefix + job_id)
+        if not fields:
+            return None
+        return {
+            'id': job_id,
+            'status': fields['status'],
+            'payload': json.loads(fields['payload']),
+            'result': json.loads(fields['result']) if fields.get('result') else None,
+            'error': fields.get('error'),
+            'dedupe_key': fields.get('dedupe_key') or None,
+            'attempts': int(fields.get('attempts', 0)),
+            'lease_expires_at': float(fields['lease_expires_at']) if fields.get('lease_expires_at') else None,
+            'created_at': float(fields['created_at']),
+            'updated_at': float(fields['updated_at'])
+        }
+
+def default_queue_url():
+    """JOB_QUEUE_URL if set, otherwise Redis when REDIS_URL is provisioned, otherwise in-process"""
+    return os.environ.get('JOB_QUEUE_URL') or os.environ.get('REDIS_URL') or 'memory://'
+
+def create_job_queue(url=None):
+    """
+    Create a job queue from a URL
+
+    Args:
+        url (str): 'memory://', 'sqlite:///path/to/jobs.db' or 'redis://host:port/db',
+            defaults to default_queue_url()
+    """
+    url = url or default_queue_url()
+    if url.startswith('memory://'):
+        return MemoryJobQueue()
+    if url.startswith('sqlite:///'):
+        return SQLiteJobQueue(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobQueue(url)
+    raise ValueError(f"Unsupported job queue URL: {url}")
@@ -0,0 +1,63 @@
+"""
+Page geometry for watermark overlays
+Describes a page by its mediabox, cropbox and /Rotate, and maps the page as displayed onto PDF user space
+"""
+
+from collections import namedtuple
+
+# Boxes are (left, bottom, right, top) tuples, rotation is 0, 90, 180 or 270
+PageGeometry = namedtuple('PageGeometry', ['mediabox', 'cropbox', 'rotation'])
+
+# Page size the preset watermark positions were designed for (US letter)
+REFERENCE_PAGE_SIZE = (612.0, 792.0)
+
+def _box_tuple(box):
+    return (float(box.left), float(box.bottom), float(box.right), float(box.top))
+
+def page_geometry(page):
+    """Get the geometry of a PyPDF2 page"""
+    return PageGeometry(
+        mediabox=_box_tuple(page.mediabox),
+        cropbox=_box_tuple(page.cropbox),
+        rotation=int(page.rotation or 0) % 360
+    )
+
+def geometry_from_size(page_width, page_height):
+    """Geometry of an unrotated page with its origin at (0, 0)"""
+    box = (0.0, 0.0, float(page_width), float(page_height))
+    return PageGeometry(mediabox=box, cropbox=box, rotation=0)
+
+def overlay_page_size(geometry):
+    """Canvas size for an overlay, large enough to cover the mediabox in user space"""
+    return (geometry.mediabox[2], geometry.mediabox[3])
+
+def display_size(geometry):
+    """Width and height of the visible page as a viewer shows it"""
+    left, bottom, right, top = geometry.cropbox
+    width, height = right - left, top - bottom
+    if geometry.rotation in (90, 270):
+        return height, width
+    return width, height
+
+def display_transform(geometry):
+    """
+    Matrix (a, b, c, d, e, f) mapping displayed page coordinates to PDF user space
+
+    Displayed coordinates have their origin at the bottom-left corner of the page as
+    viewed, after the cropbox and the clockwise /Rotate are applied.
+    """
+    left, bottom, right, top = geometry.cropbox
+    width, height = right - left, top - bottom
+
+    if geometry.rotation == 90:
+        return (0, 1, -1, 0, left + width, bottom)
+    if geometry.rotation == 180:
+        return (-1, 0, 0, -1, left + width, bottom + height)
+    if geometry.rotation == 270:
+        return (0, -1, 1, 0, left, bottom + height)
+    return (1, 0, 0, 1, left, bottom)
+
+def scale_reference_point(x, y, display_width, display_height):
+    """Scale a point laid out for the reference page size to the displayed page size"""
+    reference_width, reference_height = REFERENCE_PAGE_SIZE
+    return x * display_width / reference_width, y * display_height / reference_height
@@ -0,0 +1,204 @@
+"""
+Raster previews of the watermark layer
+Renders watermarks alone into transparent PNG tiles with Pillow, laid out by the same code as the
+PDF overlay, so clients can composite them over their own page rendering.
+"""
+
+import io
+import os
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import reportlab
+from PIL import Image, ImageDraw, ImageFont
+from font_metrics import text_width
+from page_geometry import display_size
+
+# Tiles are square, in pixels
+TILE_SIZE = 256
+
+# Zoom levels served, 1.0 is 72 pixels per inch
+ZOOM_LEVELS = (0.5, 1.0, 1.5, 2.0, 3.0, 4.0)
+
+# Bytes of PNG data kept by the tile cache
+DEFAULT_TILE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Request keys remembered by the tile cache, see TileCache.lookup()
+DEFAULT_TILE_CACHE_REQUESTS = 65536
+
+# Bitstream Vera Bold ships with ReportLab and stands in for Helvetica-Bold. Each line is scaled
+# horizontally to its Helvetica-Bold width, so line extents match the PDF output.
+RASTER_FONT_PATH = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'VeraBd.ttf')
+
+# Transparent margin around each rendered line, in pixels
+LINE_PADDING = 2
+
+@lru_cache(maxsize=64)
+def _raster_font(pixel_size):
+    return ImageFont.truetype(RASTER_FONT_PATH, pixel_size)
+
+@lru_cache(maxsize=512)
+def _line_mask(line, pixel_size):
+    """Coverage mask of one line of text, with the baseline start at (LINE_PADDING, LINE_PADDING + ascent)"""
+    font = _raster_font(pixel_size)
+    ascent, descent = font.getmetrics()
+    width = math.ceil(font.getlength(line))
+    mask = Image.new('L', (width + 2 * LINE_PADDING, ascent + descent + 2 * LINE_PADDING), 0)
+    ImageDraw.Draw(mask).text((LINE_PADDING, LINE_PADDING + ascent), line, fill=255, font=font, anchor='ls')
+    return mask, ascent, font.getlength(line)
+
+def _empty_tile_png():
+    buffer = io.BytesIO()
+    Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+EMPTY_TILE_PNG = _empty_tile_png()
+
+def tile_grid(geometry, zoom):
+    """Number of tile columns and rows covering the displayed page at a zoom level"""
+    page_width, page_height = display_size(geometry)
+    return math.ceil(page_width * zoom / TILE_SIZE), math.ceil(page_height * zoom / TILE_SIZE)
+
+class WatermarkRasterizer:
+    """Draws the watermark layer of a page into PNG tiles"""
+
+    def __init__(self, watermarker):
+        self.watermarker = watermarker
+
+    def _draw_line(self, tile, layout, line_index, page_height, zoom, origin):
+        """Composite one line of a laid out watermark onto a tile, if it overlaps it"""
+        line = layout['lines'][line_index]
+        font_size = layout['font_size']
+        pixel_size = max(1, round(font_size * zoom))
+        mask, ascent, raster_width = _line_mask(line, pixel_size)
+        if raster_width <= 0:
+            return
+
+        # Horizontal scale from the raster font's width to Helvetica-Bold's
+        target_width = text_width(line, layout['font_name'], font_size) * zoom
+        scale = target_width / raster_width
+
+        theta = math.radians(layout['rotation'])
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        x, y = layout['x'], layout['y']
+        baseline_offset = line_index * font_size
+        origin_x, origin_y = origin
+
+        # Skip lines whose rotated box misses the tile
+        mask_width, mask_height = mask.size
+        corners = []
+        for mask_x in (0, mask_width):
+            for mask_y in (0, mask_height):
+                local_x = (mask_x - LINE_PADDING) * scale / zoom
+                local_y = (LINE_PADDING + ascent - mask_y) / zoom - baseline_offset
+                page_x = x + cos_t * local_x - sin_t * local_y
+                page_y = y + sin_t * local_x + cos_t * local_y
+                corners.append((page_x * zoom - origin_x, (page_height - page_y) * zoom - origin_y))
+        if (max(c[0] for c in corners) < 0 or min(c[0] for c in corners) > TILE_SIZE or
+                max(c[1] for c in corners) < 0 or min(c[1] for c in corners) > TILE_SIZE):
+            return
+
+        # Affine map from tile pixels back to mask pixels: tile -> page -> unrotated line -> mask
+        delta_x0 = origin_x / zoom - x
+        delta_y0 = page_height - origin_y / zoom - y
+        local_x0 = cos_t * delta_x0 + sin_t * delta_y0
+        local_y0 = -sin_t * delta_x0 + cos_t * delta_y0
+        coefficients = (
+            cos_t / scale, -sin_t / scale, LINE_PADDING + local_x0 * zoom / scale,
+            sin_t, cos_t, LINE_PADDING + ascent - (local_y0 + baseline_offset) * zoom
+        )
+        coverage = mask.transform((TILE_SIZE, TILE_SIZE), Image.AFFINE, coefficients, resample=Image.BILINEAR)
+
+        opacity = layout['opacity']
+        alpha = coverage.point(lambda value: round(value * opacity))
+        red, green, blue = (round(channel * 255) for channel in layout['rgb_color'])
+        layer = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (red, green, blue, 0))
+        layer.putalpha(alpha)
+        tile.alpha_composite(layer)
+
+    def render_tile(self, watermarks, geometry, zoom, tile_x, tile_y):
+        """
+        Render one tile of the watermark layer
+
+        Tile (0, 0) is the top-left corner of the page as displayed.
+
+        Returns:
+            bytes: PNG image data
+        """
+        page_width, page_height = display_size(geometry)
+        origin = (tile_x * TILE_SIZE, tile_y * TILE_SIZE)
+
+        tile = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+        for watermark in watermarks:
+            layout = self.watermarker.layout_watermark(watermark, page_width, page_height)
+            for line_index in range(len(layout['lines'])):
+                self._draw_line(tile, layout, line_index, page_height, zoom, origin)
+
+        # Nothing drawn, skip the encoder
+        if tile.getbbox() is None:
+            return EMPTY_TILE_PNG
+
+        buffer = io.BytesIO()
+        tile.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+class TileCache:
+    """
+    Least recently used PNG tiles, bounded by their total size
+
+    Tiles are keyed by what they show, so pages with the same geometry and watermarks share them.
+    Computing that key needs the page geometry, so put() can also remember the key for a request
+    key built from the request alone, which lookup() resolves without it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_TILE_CACHE_BYTES, max_requests=DEFAULT_TILE_CACHE_REQUESTS):
+        self.max_bytes = max_bytes
+        self.max_requests = max_requests
+        self._tiles = OrderedDict()
+        self._requests = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            png = self._tiles.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def lookup(self, request_key):
+        """The tile last put() for a request key, or None (not counted as a miss, get() follows)"""
+        with self._lock:
+            key = self._requests.get(request_key)
+            png = self._tiles.get(key) if key is not None else None
+            if png is None:
+                return None
+            self._requests.move_to_end(request_key)
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png, request_key=None):
+        with self._lock:
+            if request_key is not None:
+                self._requests[request_key] = key
+                self._requests.move_to_end(request_key)
+                if len(self._requests) > self.max_requests:
+                    self._requests.popitem(last=False)
+            if key in self._tiles:
+                return
+            self._tiles[key] = png
+            self._size += len(png)
+            while self._size > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {'tiles': len(self._tiles), 'size_bytes': self._size, 'hits': self.hits, 'misses': self.misses}
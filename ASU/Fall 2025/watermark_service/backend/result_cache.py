@@ -0,0 +1,169 @@
+"""
+Content-addressed cache of watermarked PDFs
+Outputs are keyed by the input's SHA-256, the canonical watermark spec and the engine version,
+and kept in a size-bounded directory that evicts the least recently used entries.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from watermark_service import ENGINE_VERSION, WATERMARK_DEFAULTS
+
+# Bytes read at a time when hashing a file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache', 'results')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def file_sha256(file_path):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def canonical_spec(watermarks, stamp_mode='merge', output_mode='rewrite'):
+    """
+    JSON text describing what an output looks like, independent of watermark ids,
+    key order and whether defaults were spelled out
+    """
+    canonical_watermarks = []
+    for watermark in watermarks:
+        fields = {field: watermark.get(field, default) for field, default in WATERMARK_DEFAULTS.items()}
+        fields['target_pages'] = watermark.get('target_pages', [1])
+        canonical_watermarks.append(fields)
+
+    return json.dumps({
+        'watermarks': canonical_watermarks,
+        'stamp_mode': stamp_mode,
+        'output_mode': output_mode
+    }, sort_keys=True, separators=(',', ':'))
+
+def result_key(input_sha256, watermarks, stamp_mode='merge', output_mode='rewrite'):
+    """Cache key for watermarking the input with this hash using the given spec"""
+    digest = hashlib.sha256()
+    digest.update(input_sha256.encode())
+    digest.update(b'\0')
+    digest.update(canonical_spec(watermarks, stamp_mode, output_mode).encode())
+    digest.update(b'\0')
+    digest.update(ENGINE_VERSION.encode())
+    return digest.hexdigest()
+
+def copy_atomic(source_path, target_path):
+    """
+    Copy source_path to target_path through a temporary file in the target's directory
+
+    Entries are never hard-linked: the engine rewrites output paths in place, which would
+    rewrite a cache entry sharing the inode. The rename also leaves readers of the old
+    target_path with the file they opened.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        # copyfile lets the kernel copy the bytes (sendfile/copy_file_range)
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, target_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise e
+
+class ResultCache:
+    """
+    Watermarked outputs stored as <key>.pdf in one directory
+
+    The directory is the source of truth, so the API and worker processes can share it.
+    Recency is the file's mtime, refreshed on every hit.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key):
+        """Return the cached output path for key, or None"""
+        entry_path = self._entry_path(key)
+        try:
+            # Marks the entry as most recently used
+            os.utime(entry_path)
+            size = os.path.getsize(entry_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += size
+        return entry_path
+
+    def put(self, key, output_path):
+        """Store a finished output under key, then evict down to max_bytes"""
+        # A copy, so a later job writing to output_path cannot change the entry
+        copy_atomic(output_path, self._entry_path(key))
+
+        self._evict()
+
+    def _entries(self):
+        """(mtime, size, path) of every cache entry"""
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith('.pdf'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Evicted by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self.max_bytes:
+            return
+
+        for _, size, entry_path in sorted(entries):
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= self.max_bytes:
+                break
+
+    def stats(self):
+        """Hit ratio and bytes saved since this process started, plus the current cache size"""
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'entries': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes
+            }
+
+def create_result_cache():
+    """Result cache configured by RESULT_CACHE_DIR and RESULT_CACHE_MAX_BYTES"""
+    return ResultCache(
+        os.environ.get('RESULT_CACHE_DIR', DEFAULT_CACHE_DIR),
+        int(os.environ.get('RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    )
@@ -0,0 +1,431 @@
+"""
+Session store for uploaded files and their watermarks
+Sessions must be visible to every API replica, so an upload handled by one replica can be
+watermarked through another. Stores are pluggable like the job queue: in-process for development,
+SQLite for replicas on one host, and Redis.
+
+Sessions are plain JSON-serializable dicts. Reads return copies, changes are written back with
+save() or applied atomically with modify(), whose returned session is only for reading.
+
+A session's 'watermarks' dict (id to record, see watermark_index.py) is stored one record per key,
+so modify_watermarks() reads and writes only the records it changes. save() and modify() rewrite
+every record and are meant for creating a session, not for edits made while it is open.
+"""
+
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Seconds a Redis session outlives its last write, so abandoned sessions expire (and are
+# evictable under volatile-lru) instead of filling the instance
+SESSION_TTL = int(os.environ.get('SESSION_TTL_SECONDS', 24 * 60 * 60))
+
+def _split_session(session):
+    """A session's fields without its watermarks, and its watermarks"""
+    fields = {key: value for key, value in session.items() if key != 'watermarks'}
+    return fields, session.get('watermarks', {})
+
+class MemorySessionStore:
+    """Sessions held in this process, for development and tests (one replica only)"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, file_id, watermarks=True):
+        """
+        Return a copy of a session, or None if it is unknown
+
+        Args:
+            watermarks (bool): Whether to load the session's watermarks, which a large session
+                is mostly made of (without them the session has no 'watermarks' key)
+        """
+        with self._lock:
+            session = self._sessions.get(file_id)
+            if session is None:
+                return None
+            if not watermarks:
+                return copy.deepcopy(_split_session(session)[0])
+            return copy.deepcopy(session)
+
+    def save(self, file_id, session):
+        with self._lock:
+            self._sessions[file_id] = copy.deepcopy(session)
+
+    def delete(self, file_id):
+        with self._lock:
+            self._sessions.pop(file_id, None)
+
+    def modify(self, file_id, mutate):
+        """
+        Apply mutate(session) to a stored session atomically
+
+        Returns:
+            dict: The updated session, or None if it is unknown (mutate is not called)
+        """
+        with self._lock:
+            session = self._sessions.get(file_id)
+            if session is None:
+                return None
+            mutate(session)
+            # Shallow, a deep copy of thousands of watermarks would dominate each update
+            return dict(session)
+
+    def modify_watermarks(self, file_id, watermark_ids, mutate):
+        """
+        Apply mutate(records) to some watermarks of a stored session atomically
+
+        records holds the stored records of those watermark_ids that exist. Records mutate adds
+        are appended to the session, records it removes are deleted, and changed ones keep their place.
+
+        Returns:
+            dict: The session without its watermarks, or None if it is unknown (mutate is not called)
+        """
+        with self._lock:
+            session = self._sessions.get(file_id)
+            if session is None:
+                return None
+            watermarks = session['watermarks']
+            records = {
+                watermark_id: watermarks[watermark_id]
+                for watermark_id in watermark_ids if watermark_id in watermarks
+            }
+            loaded = set(records)
+            mutate(records)
+            for watermark_id in loaded - set(records):
+                del watermarks[watermark_id]
+            watermarks.update(records)
+            return _split_session(session)[0]
+
+    def __contains__(self, file_id):
+        with self._lock:
+            return file_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __getitem__(self, file_id):
+        session = self.get(file_id)
+        if session is None:
+            raise KeyError(file_id)
+        return session
+
+    def __setitem__(self, file_id, session):
+        self.save(file_id, session)
+
+    def __delitem__(self, file_id):
+        self.delete(file_id)
+
+class SQLiteSessionStore(MemorySessionStore):
+    """Sessions stored in a SQLite database shared by the replicas on one host"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        # One row per watermark, seq keeps the order they were added in
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS watermarks (
+                seq INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                watermark_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                UNIQUE (session_id, watermark_id)
+            )
+        ''')
+
+    def _connect(self):
+        """One connection per thread, in WAL mode so readers do not block the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, begin='BEGIN IMMEDIATE'):
+        """
+        Run statements in one transaction, BEGIN IMMEDIATE takes the write lock up front so
+        concurrent edits from other replicas are not lost
+        """
+        conn = self._connect()
+        conn.execute(begin)
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            raise e
+
+    def _load(self, conn, file_id, watermarks=True):
+        row = conn.execute('SELECT data FROM sessions WHERE id = ?', (file_id,)).fetchone()
+        if row is None:
+            return None
+        session = json.loads(row[0])
+        if watermarks:
+            session['watermarks'] = {
+                watermark_id: json.loads(data) for watermark_id, data in conn.execute(
+                    'SELECT watermark_id, data FROM watermarks WHERE session_id = ? ORDER BY seq', (file_id,)
+                )
+            }
+        return session
+
+    def _store(self, conn, file_id, session):
+        fields, watermarks = _split_session(session)
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)',
+            (file_id, json.dumps(fields), time.time())
+        )
+        conn.execute('DELETE FROM watermarks WHERE session_id = ?', (file_id,))
+        conn.executemany(
+            'INSERT INTO watermarks (session_id, watermark_id, data) VALUES (?, ?, ?)',
+            [(file_id, watermark_id, json.dumps(record)) for watermark_id, record in watermarks.items()]
+        )
+
+    def get(self, file_id, watermarks=True):
+        # A read transaction, so the session and its watermarks come from one snapshot
+        with self._transaction('BEGIN') as conn:
+            return self._load(conn, file_id, watermarks)
+
+    def save(self, file_id, session):
+        with self._transaction() as conn:
+            self._store(conn, file_id, session)
+
+    def delete(self, file_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (file_id,))
+            conn.execute('DELETE FROM watermarks WHERE session_id = ?', (file_id,))
+
+    def modify(self, file_id, mutate):
+        with self._transaction() as conn:
+            session = self._load(conn, file_id)
+            if session is not None:
+                mutate(session)
+                self._store(conn, file_id, session)
+        return session
+
+    def modify_watermarks(self, file_id, watermark_ids, mutate):
+        with self._transaction() as conn:
+            session = self._load(conn, file_id, watermarks=False)
+            if session is None:
+                return None
+            records = {}
+            for watermark_id in watermark_ids:
+                row = conn.execute(
+                    'SELECT data FROM watermarks WHERE session_id = ? AND watermark_id = ?', (file_id, watermark_id)
+                ).fetchone()
+                if row is not None:
+                    records[watermark_id] = json.loads(row[0])
+            loaded = set(records)
+            mutate(records)
+            conn.executemany(
+                'DELETE FROM watermarks WHERE session_id = ? AND watermark_id = ?',
+                [(file_id, watermark_id) for watermark_id in loaded - set(records)]
+            )
+            # An existing row keeps its seq, so an updated watermark keeps its place
+            conn.executemany(
+                '''INSERT INTO watermarks (session_id, watermark_id, data) VALUES (?, ?, ?)
+                   ON CONFLICT (session_id, watermark_id) DO UPDATE SET data = excluded.data''',
+                [(file_id, watermark_id, json.dumps(record)) for watermark_id, record in records.items()]
+            )
+            conn.execute('UPDATE sessions SET updated_at = ? WHERE id = ?', (time.time(), file_id))
+        return session
+
+    def __contains__(self, file_id):
+        return self._connect().execute('SELECT 1 FROM sessions WHERE id = ?', (file_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+def _ordered_records(records, order):
+    """Decoded watermark records in their stored order, records missing from it (the order key
+    was evicted on its own) follow in hash order"""
+    ordered = {watermark_id: json.loads(records[watermark_id]) for watermark_id in order if watermark_id in records}
+    for watermark_id, data in records.items():
+        if watermark_id not in ordered:
+            ordered[watermark_id] = json.loads(data)
+    return ordered
+
+class RedisSessionStore(MemorySessionStore):
+    """
+    Sessions stored in Redis: the session's fields as one JSON string, its watermark records in a
+    hash with one field per watermark, and their order in a sorted set
+    """
+
+    def __init__(self, redis_url, namespace='watermark', session_ttl=SESSION_TTL):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required for redis:// session stores (pip install redis)")
+
+        self._redis_module = redis
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.session_prefix = f"{namespace}:session:"
+        self.namespace = namespace
+        self.session_ttl = session_ttl
+
+    def _keys(self, file_id):
+        """Keys of a session's fields, watermark records, watermark order and order counter"""
+        return (
+            self.session_prefix + file_id,
+            f"{self.namespace}:watermarks:{file_id}",
+            f"{self.namespace}:watermark_order:{file_id}",
+            f"{self.namespace}:watermark_seq:{file_id}"
+        )
+
+    def _queue_store(self, pipeline, file_id, session):
+        session_key, records_key, order_key, seq_key = self._keys(file_id)
+        fields, watermarks = _split_session(session)
+        pipeline.set(session_key, json.dumps(fields))
+        pipeline.delete(records_key, order_key)
+        if watermarks:
+            pipeline.hset(records_key, mapping={
+                watermark_id: json.dumps(record) for watermark_id, record in watermarks.items()
+            })
+            pipeline.zadd(order_key, {watermark_id: seq for seq, watermark_id in enumerate(watermarks)})
+        pipeline.set(seq_key, len(watermarks))
+        self._queue_expire(pipeline, file_id)
+
+    def _queue_expire(self, pipeline, file_id):
+        """Every write restarts the TTL of all of a session's keys"""
+        for key in self._keys(file_id):
+            pipeline.expire(key, self.session_ttl)
+
+    def get(self, file_id, watermarks=True):
+        session_key, records_key, order_key, _ = self._keys(file_id)
+        if not watermarks:
+            data = self.redis.get(session_key)
+            return json.loads(data) if data is not None else None
+
+        with self.redis.pipeline() as pipeline:
+            pipeline.get(session_key)
+            pipeline.hgetall(records_key)
+            pipeline.zrange(order_key, 0, -1)
+            data, records, order = pipeline.execute()
+        if data is None:
+            return None
+        session = json.loads(data)
+        session['watermarks'] = _ordered_records(records, order)
+        return session
+
+    def save(self, file_id, session):
+        with self.redis.pipeline() as pipeline:
+            self._queue_store(pipeline, file_id, session)
+            pipeline.execute()
+
+    def delete(self, file_id):
+        self.redis.delete(*self._keys(file_id))
+
+    def _watch_session(self, keys, transaction):
+        """
+        Run transaction(pipeline, session_fields) with optimistic locking: it is retried if another
+        replica wrote a watched key meanwhile
+
+        Returns:
+            The transaction's result, or None if the session is unknown
+        """
+        with self.redis.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(*keys)
+                    data = pipeline.get(keys[0])
+                    if data is None:
+                        pipeline.unwatch()
+                        return None
+                    return transaction(pipeline, json.loads(data))
+                except self._redis_module.WatchError:
+                    continue
+
+    def modify(self, file_id, mutate):
+        session_key, records_key, order_key, _ = self._keys(file_id)
+
+        def transaction(pipeline, session):
+            order = pipeline.zrange(order_key, 0, -1)
+            records = pipeline.hgetall(records_key)
+            session['watermarks'] = _ordered_records(records, order)
+            mutate(session)
+            pipeline.multi()
+            self._queue_store(pipeline, file_id, session)
+            pipeline.execute()
+            return session
+
+        return self._watch_session((session_key, records_key, order_key), transaction)
+
+    def modify_watermarks(self, file_id, watermark_ids, mutate):
+        session_key, records_key, order_key, seq_key = self._keys(file_id)
+        # Ids come from clients, redis-py rejects None
+        watermark_ids = [watermark_id for watermark_id in watermark_ids if watermark_id is not None]
+
+        def transaction(pipeline, session):
+            values = pipeline.hmget(records_key, watermark_ids) if watermark_ids else []
+            records = {
+                watermark_id: json.loads(value)
+                for watermark_id, value in zip(watermark_ids, values) if value is not None
+            }
+            loaded = set(records)
+            mutate(records)
+            removed = loaded - set(records)
+            added = [watermark_id for watermark_id in records if watermark_id not in loaded]
+            # Taken outside the transaction, a retry only leaves a gap in the order
+            first_seq = pipeline.incrby(seq_key, len(added)) - len(added) if added else 0
+
+            pipeline.multi()
+            if removed:
+                pipeline.hdel(records_key, *removed)
+                pipeline.zrem(order_key, *removed)
+            if records:
+                pipeline.hset(records_key, mapping={
+                    watermark_id: json.dumps(record) for watermark_id, record in records.items()
+                })
+            if added:
+                pipeline.zadd(order_key, {
+                    watermark_id: first_seq + offset for offset, watermark_id in enumerate(added)
+                })
+            self._queue_expire(pipeline, file_id)
+            pipeline.execute()
+            return session
+
+        # Watching the records hash retries when any watermark of the session changed, which the
+        # update coalescer keeps to one write per session per tick
+        return self._watch_session((session_key, records_key), transaction)
+
+    def __contains__(self, file_id):
+        return bool(self.redis.exists(self.session_prefix + file_id))
+
+    def __len__(self):
+        # Walks the namespace's keys, meant for occasional use such as a metrics scrape
+        return sum(1 for _ in self.redis.scan_iter(match=self.session_prefix + '*', count=1000))
+
+def default_store_url():
+    """SESSION_STORE_URL if set, otherwise Redis when REDIS_URL is provisioned, otherwise in-process"""
+    return os.environ.get('SESSION_STORE_URL') or os.environ.get('REDIS_URL') or 'memory://'
+
+def create_session_store(url=None):
+    """
+    Create a session store from a URL
+
+    Args:
+        url (str): 'memory://', 'sqlite:///path/to/sessions.db' or 'redis://host:port/db',
+            defaults to default_store_url()
+    """
+    url = url or default_store_url()
+    if url.startswith('memory://'):
+        return MemorySessionStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSessionStore(url)
+    raise ValueError(f"Unsupported session store URL: {url}")
@@ -10,6 +10,8 @@ class WatermarkRealtimeClient {
         
         this.watermarks = [];
         this.watermarkCounter = 0;
+        // Increases with every update sent, so the server can drop ones that arrive late
+        this.updateSeq = 0;
         
         this.init();
     }
@@ -50,11 +52,6 @@ class WatermarkRealtimeClient {
             this.renderWatermarks();
         });
         
-        this.socket.on('watermark_position_updated', (data) => {
-            console.log('Watermark position updated:', data);
-            this.updateWatermarkPosition(data.watermark_id, data.position);
-        });
-        
         this.socket.on('watermark_added', (data) => {
             console.log('Watermark added:', data);
             this.watermarks.push(data.watermark);
@@ -67,9 +64,19 @@ class WatermarkRealtimeClient {
             this.renderWatermarks();
         });
         
-        this.socket.on('watermark_properties_updated', (data) => {
-            console.log('Watermark properties updated:', data);
-            this.updateWatermarkProperties(data.watermark_id, data.properties);
+        // The server coalesces position and property changes into one batch per tick
+        this.socket.on('watermark_updates', (data) => {
+            data.updates.forEach(update => {
+                const watermark = this.watermarks.find(w => w.id === update.watermark_id);
+                if (!watermark) {
+                    return;
+                }
+                Object.assign(watermark, update.properties || {});
+                if (update.position !== undefined) {
+                    watermark.position = update.position;
+                }
+            });
+            this.renderWatermarks();
         });
     }
     
@@ -181,7 +188,8 @@ class WatermarkRealtimeClient {
             this.socket.emit('update_watermark_position', {
                 file_id: this.currentFileId,
                 watermark_id: watermarkId,
-                position: position
+                position: position,
+                seq: ++this.updateSeq
             });
         }
     }
@@ -191,7 +199,8 @@ class WatermarkRealtimeClient {
             this.socket.emit('update_watermark_properties', {
                 file_id: this.currentFileId,
                 watermark_id: watermarkId,
-                properties: properties
+                properties: properties,
+                seq: ++this.updateSeq
             });
         }
     }
@@ -0,0 +1,88 @@
+"""
+Text layout for watermarks
+Word wrapping over prefix sums of cached word widths and binary-search font size fitting
+"""
+
+import math
+from font_metrics import text_width, UNIT_FONT_SIZE
+
+# Smallest font size the layout will shrink text to
+MIN_FONT_SIZE = 8
+
+class WordMetrics:
+    """Unit-size word widths of a text, measured once and reused for every font size"""
+
+    def __init__(self, text, font_name):
+        self.words = text.split()
+        self.space_width = text_width(' ', font_name, UNIT_FONT_SIZE)
+
+        # prefix_widths[i] is the total width of the first i words
+        self.prefix_widths = [0.0]
+        for word in self.words:
+            self.prefix_widths.append(self.prefix_widths[-1] + text_width(word, font_name, UNIT_FONT_SIZE))
+
+    def line_width(self, start, end, font_size):
+        """Width of words[start:end] joined by single spaces at the given font size"""
+        unit_width = self.prefix_widths[end] - self.prefix_widths[start] + (end - start - 1) * self.space_width
+        return unit_width * font_size / UNIT_FONT_SIZE
+
+    def wrap(self, max_width, font_size):
+        """Greedily break the words into lines no wider than max_width, in one pass"""
+        lines = []
+        if not self.words:
+            return lines
+
+        line_start = 0
+        for index in range(1, len(self.words)):
+            if self.line_width(line_start, index + 1, font_size) > max_width:
+                # A single word wider than max_width stays on its own line
+                lines.append(' '.join(self.words[line_start:index]))
+                line_start = index
+
+        lines.append(' '.join(self.words[line_start:]))
+        return lines
+
+def wrap_text(text, max_width, font_name, font_size):
+    """Wrap text to fit within the specified width"""
+    return WordMetrics(text, font_name).wrap(max_width, font_size)
+
+def fit_text(text, max_width, max_height, font_name, initial_font_size=24):
+    """
+    Find the largest font size that fits text within the given bounds
+
+    Candidate sizes step down by 1 from initial_font_size while above MIN_FONT_SIZE,
+    and are binary searched since text only gets wider and taller as the size grows.
+
+    Returns:
+        tuple: (font_size, lines) where lines is [text] when it fits on a single line
+    """
+    metrics = WordMetrics(text, font_name)
+    single_line_width = text_width(text, font_name, UNIT_FONT_SIZE)
+
+    def layout(font_size):
+        """Return the lines for font_size if they fit, otherwise None"""
+        if single_line_width * font_size / UNIT_FONT_SIZE <= max_width:
+            return [text] if font_size <= max_height else None
+        lines = metrics.wrap(max_width, font_size)
+        return lines if len(lines) * font_size <= max_height else None
+
+    # Number of candidate sizes strictly above the minimum
+    num_candidates = max(0, math.ceil(initial_font_size - MIN_FONT_SIZE))
+
+    # Find the smallest step (largest size) whose layout fits
+    low, high = 0, num_candidates
+    best = None
+    while low < high:
+        step = (low + high) // 2
+        lines = layout(initial_font_size - step)
+        if lines is not None:
+            best = (initial_font_size - step, lines)
+            high = step
+        else:
+            low = step + 1
+
+    if best is not None:
+        return best
+
+    # Nothing fits, use the minimum font size and wrap
+    return MIN_FONT_SIZE, metrics.wrap(max_width, MIN_FONT_SIZE)
@@ -0,0 +1,105 @@
+"""
+File id to path index for the legacy server
+The legacy server keeps uploads as <file_id>_<name> and results as watermarked_<file_id>.pdf in flat
+directories. Finding them by listing a directory costs a walk over every stored file, so paths are
+recorded in a SQLite table as they are written. The table is rebuilt from the directories at
+startup, so files written or removed while the server was down are picked up.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+# File ids are uuid4 strings
+FILE_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+class UploadIndex:
+    """Paths of the upload and output files of each file id"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                kind TEXT NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS files_by_id ON files (file_id, kind)')
+
+    def _connect(self):
+        """One connection per thread, in WAL mode so readers do not block the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, file_id, path, kind='upload'):
+        """Record a file written for file_id, kind is 'upload' or 'output'"""
+        self._connect().execute(
+            'INSERT OR REPLACE INTO files (path, file_id, kind) VALUES (?, ?, ?)',
+            (path, file_id, kind)
+        )
+
+    def find_upload(self, file_id):
+        """
+        Path of the uploaded file for file_id
+
+        Returns:
+            str: The path, or None if there is no upload or it was removed from disk
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT path FROM files WHERE file_id = ? AND kind = 'upload' LIMIT 1", (file_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row[0]):
+            conn.execute('DELETE FROM files WHERE path = ?', (row[0],))
+            return None
+        return row[0]
+
+    def paths(self, file_id):
+        """All recorded (path, kind) pairs of file_id"""
+        return self._connect().execute(
+            'SELECT path, kind FROM files WHERE file_id = ?', (file_id,)
+        ).fetchall()
+
+    def remove(self, file_id):
+        self._connect().execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+
+    def rebuild(self, upload_dir, output_dir):
+        """
+        Replace the index with the files found in the upload and output directories
+
+        Returns:
+            int: The number of files indexed
+        """
+        entries = []
+        for entry in os.scandir(upload_dir):
+            match = FILE_ID_PATTERN.match(entry.name)
+            if match and entry.name[match.end():match.end() + 1] == '_' and entry.is_file():
+                entries.append((entry.path, match.group(), 'upload'))
+        for entry in os.scandir(output_dir):
+            match = FILE_ID_PATTERN.search(entry.name)
+            if match and entry.is_file():
+                entries.append((entry.path, match.group(), 'output'))
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM files')
+            conn.executemany('INSERT OR REPLACE INTO files (path, file_id, kind) VALUES (?, ?, ?)', entries)
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            raise e
+        return len(entries)
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM files').fetchone()[0]
@@ -0,0 +1,67 @@
+"""
+Id-indexed watermark storage for sessions
+A session's watermarks are a dict from watermark id to record. Dicts keep insertion order, in
+memory and through JSON, so iteration follows the order watermarks were added, like the list
+they replace, while lookup, update and removal by id are O(1).
+
+Records are compact: the id is the key rather than a field, and fields equal to the engine
+defaults are left out and filled back in when a watermark is read.
+"""
+
+import uuid
+from watermark_service import WATERMARK_DEFAULTS
+
+_MISSING = object()
+
+def _is_default(field, value):
+    default = WATERMARK_DEFAULTS.get(field, _MISSING)
+    return default is not _MISSING and type(default) is type(value) and default == value
+
+def compact_record(watermark):
+    """Record stored for a watermark: no id, no fields equal to their default"""
+    return {
+        field: value for field, value in watermark.items()
+        if field != 'id' and not _is_default(field, value)
+    }
+
+def expand_record(watermark_id, record):
+    """Full watermark dict from a stored record"""
+    return {'id': watermark_id, **WATERMARK_DEFAULTS, **record}
+
+def add_watermark(watermarks, watermark):
+    """
+    Add a watermark, or replace the one with the same id in place
+
+    Returns:
+        str: The watermark's id, generated if it had none
+    """
+    watermark_id = watermark.get('id') or str(uuid.uuid4())
+    watermarks[watermark_id] = compact_record(watermark)
+    return watermark_id
+
+def update_watermark(watermarks, watermark_id, fields):
+    """Change fields of a watermark, returns False if there is no watermark with that id"""
+    record = watermarks.get(watermark_id)
+    if record is None:
+        return False
+    for field, value in fields.items():
+        if field == 'id':
+            continue
+        if _is_default(field, value):
+            record.pop(field, None)
+        else:
+            record[field] = value
+    return True
+
+def remove_watermark(watermarks, watermark_id):
+    """Remove a watermark, returns False if there is no watermark with that id"""
+    return watermarks.pop(watermark_id, None) is not None
+
+def get_watermark(watermarks, watermark_id):
+    """A full watermark dict, or None"""
+    record = watermarks.get(watermark_id)
+    return expand_record(watermark_id, record) if record is not None else None
+
+def watermark_list(watermarks):
+    """Full watermark dicts in the order they were added"""
+    return [expand_record(watermark_id, record) for watermark_id, record in watermarks.items()]
@@ -1,15 +1,93 @@
 import os
-from PyPDF2 import PdfReader, PdfWriter
+import io
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PyPDF2 import PdfReader, PdfWriter, PageObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.colors import HexColor
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import tempfile
+from font_metrics import text_width as measure_text_width
+import text_layout
+from xobject_stamper import XObjectStamper
+from incremental_writer import IncrementalWriter
+from page_geometry import (
+    page_geometry,
+    geometry_from_size,
+    overlay_page_size,
+    display_size,
+    display_transform,
+    scale_reference_point
+)
 import math
 
+# Bump whenever a change to the engine changes the bytes it writes, so cached outputs are not reused
+ENGINE_VERSION = '2.0'
+
+# Default values for every watermark field that affects how an overlay is drawn
+WATERMARK_DEFAULTS = {
+    'text': '',
+    'position': 'center',
+    'font_size': 24,
+    'color': '#000000',
+    'opacity': 0.5,
+    'rotation': 0,
+    'custom_x': 300,
+    'custom_y': 400
+}
+
+# How overlays are applied to pages:
+# - 'merge' copies the overlay content and resources into every page
+# - 'xobject' stores the overlay once as a Form XObject that each page invokes with Do
+STAMP_MODES = ('merge', 'xobject')
+
+# How the output file is produced:
+# - 'rewrite' serializes every object of the document into a new file
+# - 'incremental' copies the input and appends only new and modified objects
+OUTPUT_MODES = ('rewrite', 'incremental')
+
+# Worker processes used to stamp page chunks in parallel (1 disables parallel stamping)
+DEFAULT_WORKERS = int(os.environ.get('WATERMARK_WORKERS', 1))
+
+# Worker processes running batch items, at least 2 so one large file does not hold up the rest
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', max(2, os.cpu_count() or 1)))
+
+# Documents with fewer pages are always stamped in the calling process
+PARALLEL_MIN_PAGES = 200
+
+# Chunks handed to each worker, so a slow chunk does not leave the other workers idle
+CHUNKS_PER_WORKER = 2
+
+# Observer of watermarkers created without one, see set_default_observer()
+_default_observer = None
+
+def set_default_observer(observer):
+    """
+    Report the work of every PDFWatermarker created without an observer to this one, or to none
+
+    Watermarkers in worker processes have no observer, their chunks and batch items are not reported.
+    """
+    global _default_observer
+    _default_observer = observer
+
 class PDFWatermarker:
-    def __init__(self):
+    def __init__(self, workers=None, parallel_min_pages=PARALLEL_MIN_PAGES, observer=None, batch_workers=None):
+        """
+        Args:
+            workers (int): Worker processes for page-parallel stamping, defaults to
+                the WATERMARK_WORKERS environment variable or 1
+            batch_workers (int): Worker processes for watermark_batch(), defaults to the
+                BATCH_WORKERS environment variable or the CPU count (1 runs batches serially)
+            parallel_min_pages (int): Smallest document stamped in parallel
+            observer (EngineObserver): Receives spans and progress messages, defaults to the
+                observer passed to set_default_observer(), see engine_observer.py
+        """
+        self.workers = DEFAULT_WORKERS if workers is None else max(1, int(workers))
+        self.batch_workers = BATCH_WORKERS if batch_workers is None else max(1, int(batch_workers))
+        self.parallel_min_pages = parallel_min_pages
+        self.observer = _default_observer if observer is None else observer
         self.supported_positions = {
             'top-left': (50, 750),
             'top-center': (300, 750),
@@ -22,6 +100,76 @@ class PDFWatermarker:
             'bottom-right': (550, 50)
         }
     
+    def _span(self, name, start_time, **fields):
+        """Report a span that started at start_time (time.perf_counter()), if there is an observer"""
+        if self.observer is not None:
+            self.observer.on_span(name, time.perf_counter() - start_time, **fields)
+    
+    def _message(self, message):
+        if self.observer is not None:
+            self.observer.on_message(message)
+    
+    def normalize_watermark(self, watermark):
+        """Return the render-relevant fields of a watermark as a hashable tuple"""
+        return tuple(
+            (field, repr(watermark.get(field, default)))
+            for field, default in WATERMARK_DEFAULTS.items()
+        )
+    
+    def _overlay_key(self, watermarks, geometry):
+        """Build the overlay cache key for a watermark set drawn on a page with the given geometry"""
+        return (
+            tuple(self.normalize_watermark(watermark) for watermark in watermarks),
+            geometry
+        )
+    
+    def _get_overlay_page(self, overlay_cache, watermarks, geometry):
+        """Return the overlay page for a watermark set, rendering it only on first use"""
+        key = self._overlay_key(watermarks, geometry)
+        watermark_page = overlay_cache.get(key)
+        
+        if watermark_page is None:
+            start_time = time.perf_counter()
+            # Read combined watermark PDF straight from its in-memory buffer
+            watermark_buffer = self.create_overlay_pdf(watermarks, geometry)
+            watermark_reader = PdfReader(watermark_buffer)
+            watermark_page = watermark_reader.pages[0]
+            
+            overlay_cache[key] = watermark_page
+            if self.observer is not None:
+                self._span('overlay', start_time, watermarks=len(watermarks),
+                           bytes=watermark_buffer.getbuffer().nbytes)
+        
+        return watermark_page
+    
+    def _create_stamper(self, writer, stamp_mode):
+        """Return the XObject stamper for a writer, or None when overlays are merged"""
+        if stamp_mode not in STAMP_MODES:
+            raise ValueError(f"Unsupported stamp mode: {stamp_mode}")
+        return XObjectStamper(writer) if stamp_mode == 'xobject' else None
+    
+    def _add_stamped_page(self, writer, stamper, page, watermark_page):
+        """Add a page to the writer with the overlay drawn on top, if there is one"""
+        if watermark_page is not None and stamper is None:
+            # Merge into a copy of the page dictionary, so the reader's page is left as it was
+            # and a cached reader can be stamped again
+            page_copy = PageObject(page.pdf, page.indirect_reference)
+            page_copy.update(page)
+            page = page_copy
+            page.merge_page(watermark_page)
+        
+        writer_page = writer.add_page(page)
+        
+        if watermark_page is not None and stamper is not None:
+            stamper.stamp(writer_page, watermark_page)
+        
+        return writer_page
+    
+    def resolve_preset_position(self, position, page_width, page_height):
+        """Scale a preset position, laid out for a letter page, to the given page size"""
+        x, y = self.supported_positions[position]
+        return scale_reference_point(x, y, page_width, page_height)
+    
     def hex_to_rgb(self, hex_color):
         """Convert hex color to RGB tuple"""
         hex_color = hex_color.lstrip('#')
@@ -29,80 +177,28 @@ class PDFWatermarker:
     
     def wrap_text(self, text, max_width, font_name, font_size):
         """Wrap text to fit within specified width"""
-        words = text.split()
-        lines = []
-        current_line = []
-        
-        for word in words:
-            test_line = ' '.join(current_line + [word])
-            test_width = self._get_text_width(test_line, font_name, font_size)
-            
-            if test_width <= max_width:
-                current_line.append(word)
-            else:
-                if current_line:
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
-                else:
-                    # Single word is too long, break it
-                    lines.append(word)
-        
-        if current_line:
-            lines.append(' '.join(current_line))
-        
-        return lines
+        return text_layout.wrap_text(text, max_width, font_name, font_size)
     
     def _get_text_width(self, text, font_name, font_size):
-        """Get text width using a temporary canvas"""
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.close()
-        temp_canvas = canvas.Canvas(temp_file.name)
-        temp_canvas.setFont(font_name, font_size)
-        width = temp_canvas.stringWidth(text, font_name, font_size)
-        # Clean up temporary file
-        try:
-            os.unlink(temp_file.name)
-        except:
-            pass
-        return width
+        """Get text width from cached font metrics"""
+        return measure_text_width(text, font_name, font_size)
     
     def calculate_optimal_font_size(self, text, max_width, max_height, font_name, initial_font_size=24):
-        """Calculate optimal font size to fit text within bounds"""
-        font_size = initial_font_size
-        
-        # Try to find the largest font size that fits
-        while font_size > 8:  # Minimum font size
-            # Check if text fits in width
-            text_width = self._get_text_width(text, font_name, font_size)
-            
-            if text_width <= max_width:
-                # Check if text fits in height (single line)
-                if font_size <= max_height:
-                    return font_size
-                else:
-                    font_size -= 1
-            else:
-                # Text is too wide, try wrapping
-                wrapped_lines = self.wrap_text(text, max_width, font_name, font_size)
-                total_height = len(wrapped_lines) * font_size
-                
-                if total_height <= max_height:
-                    return font_size, wrapped_lines
-                else:
-                    font_size -= 1
+        """
+        Calculate optimal font size to fit text within bounds
         
-        # If we get here, use minimum font size and wrap
-        wrapped_lines = self.wrap_text(text, max_width, font_name, 8)
-        return 8, wrapped_lines
+        Returns:
+            tuple: (font_size, wrapped_lines), with wrapped_lines == [text] when no wrapping is needed
+        """
+        return text_layout.fit_text(text, max_width, max_height, font_name, initial_font_size)
     
     def create_watermark_pdf(self, text, position, font_size, color, opacity, rotation, page_width, page_height):
-        """Create a watermark PDF with the specified text and properties"""
-        # Create temporary file for watermark
-        watermark_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        watermark_file.close()
+        """Create a watermark PDF with the specified text and properties, returned as an in-memory buffer"""
+        # Render the watermark into memory instead of a temporary file
+        watermark_buffer = io.BytesIO()
         
         # Create canvas for watermark
-        c = canvas.Canvas(watermark_file.name, pagesize=(page_width, page_height))
+        c = canvas.Canvas(watermark_buffer, pagesize=(page_width, page_height))
         
         # Set transparency
         c.setFillAlpha(opacity)
@@ -113,7 +209,7 @@ class PDFWatermarker:
         
         # Calculate text position
         if position in self.supported_positions:
-            x, y = self.supported_positions[position]
+            x, y = self.resolve_preset_position(position, page_width, page_height)
         elif position == 'custom':
             # Custom position - this function doesn't handle custom_x/y
             # so default to center
@@ -133,26 +229,20 @@ class PDFWatermarker:
         
         # Calculate optimal font size and text wrapping
         font_name = "Helvetica-Bold"
-        optimal_result = self.calculate_optimal_font_size(text, available_width, available_height, font_name, font_size)
-        
-        if isinstance(optimal_result, tuple):
-            # Text needs to be wrapped
-            adjusted_font_size, wrapped_lines = optimal_result
-        else:
-            # Text fits in single line
-            adjusted_font_size = optimal_result
-            wrapped_lines = [text]
+        adjusted_font_size, wrapped_lines = self.calculate_optimal_font_size(
+            text, available_width, available_height, font_name, font_size
+        )
         
         # Set font with adjusted size
         c.setFont(font_name, adjusted_font_size)
         
         # Calculate final text dimensions
         if len(wrapped_lines) == 1:
-            text_width = c.stringWidth(wrapped_lines[0], font_name, adjusted_font_size)
+            text_width = self._get_text_width(wrapped_lines[0], font_name, adjusted_font_size)
             text_height = adjusted_font_size
         else:
             # For wrapped text, calculate total width and height
-            text_width = max(c.stringWidth(line, font_name, adjusted_font_size) for line in wrapped_lines)
+            text_width = max(self._get_text_width(line, font_name, adjusted_font_size) for line in wrapped_lines)
             text_height = len(wrapped_lines) * adjusted_font_size
         
         # Adjust position to center the text within available space
@@ -192,97 +282,123 @@ class PDFWatermarker:
                     c.drawString(x, line_y, line)
         
         c.save()
-        return watermark_file.name
+        watermark_buffer.seek(0)
+        return watermark_buffer
     
     def create_multiple_watermarks_pdf(self, watermarks, page_width, page_height):
-        """Create a watermark PDF with multiple watermarks"""
-        # Create temporary file for watermark
-        watermark_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        watermark_file.close()
+        """Create a watermark PDF with multiple watermarks, returned as an in-memory buffer"""
+        return self.create_overlay_pdf(watermarks, geometry_from_size(page_width, page_height))
+    
+    def layout_watermark(self, watermark, page_width, page_height):
+        """
+        Position, size and wrap a watermark on a displayed page of the given size
+        
+        Shared by the PDF overlay and the raster previews, so both place text identically.
+        
+        Returns:
+            dict: lines, x and y of the first baseline, font_name, font_size,
+                rgb_color, opacity and rotation (degrees counterclockwise around x, y)
+        """
+        text = watermark.get('text', '')
+        position = watermark.get('position', 'center')
+        font_size = watermark.get('font_size', 24)
+        color = watermark.get('color', '#000000')
+        opacity = watermark.get('opacity', 0.5)
+        rotation = watermark.get('rotation', 0)
+        
+        # Calculate text position
+        if position in self.supported_positions:
+            x, y = self.resolve_preset_position(position, page_width, page_height)
+        elif position == 'custom':
+            # Custom position from custom_x and custom_y
+            x = float(watermark.get('custom_x', 300))
+            # PDF coordinates start from bottom-left, but we need to adjust for text baseline
+            y = page_height - float(watermark.get('custom_y', 400)) - font_size
+        else:
+            # Try to parse as comma-separated coordinates
+            try:
+                coords = position.split(',')
+                x, y = float(coords[0]), float(coords[1])
+            except:
+                x, y = 300, 400  # Default to center
+        
+        # Calculate available space for text (with margins)
+        margin = 20
+        available_width = page_width - 2 * margin
+        available_height = page_height - 2 * margin
+        
+        # Calculate optimal font size and text wrapping
+        font_name = "Helvetica-Bold"
+        adjusted_font_size, wrapped_lines = self.calculate_optimal_font_size(
+            text, available_width, available_height, font_name, font_size
+        )
+        
+        # Calculate final text dimensions
+        if len(wrapped_lines) == 1:
+            text_width = self._get_text_width(wrapped_lines[0], font_name, adjusted_font_size)
+            text_height = adjusted_font_size
+        else:
+            # For wrapped text, calculate total width and height
+            text_width = max(self._get_text_width(line, font_name, adjusted_font_size) for line in wrapped_lines)
+            text_height = len(wrapped_lines) * adjusted_font_size
+        
+        # Adjust position to center the text within available space
+        if position in self.supported_positions:
+            # For preset positions, adjust to ensure text fits
+            if x + text_width > page_width - margin:
+                x = page_width - text_width - margin
+            if y + text_height > page_height - margin:
+                y = page_height - text_height - margin
+            if x < margin:
+                x = margin
+            if y < margin:
+                y = margin
+        
+        return {
+            'lines': wrapped_lines,
+            'x': x,
+            'y': y,
+            'font_name': font_name,
+            'font_size': adjusted_font_size,
+            'rgb_color': self.hex_to_rgb(color),
+            'opacity': opacity,
+            'rotation': rotation
+        }
+    
+    def create_overlay_pdf(self, watermarks, geometry):
+        """
+        Create a watermark PDF with multiple watermarks for a page geometry, returned as an in-memory buffer
+        
+        Watermarks are laid out on the page as displayed (cropbox and /Rotate applied)
+        and mapped back onto the page's user space.
+        """
+        # Render the watermarks into memory instead of a temporary file
+        watermark_buffer = io.BytesIO()
         
         # Create canvas for watermark
-        c = canvas.Canvas(watermark_file.name, pagesize=(page_width, page_height))
+        c = canvas.Canvas(watermark_buffer, pagesize=overlay_page_size(geometry))
+        
+        # Draw in displayed page coordinates
+        c.transform(*display_transform(geometry))
+        page_width, page_height = display_size(geometry)
         
         # Apply each watermark
-        for i, watermark in enumerate(watermarks):
-            print(f"Processing watermark {i+1}: {watermark}")  # Debug print
-            text = watermark.get('text', '')
-            position = watermark.get('position', 'center')
-            font_size = watermark.get('font_size', 24)
-            color = watermark.get('color', '#000000')
-            opacity = watermark.get('opacity', 0.5)
-            rotation = watermark.get('rotation', 0)
-            
-            # Set transparency for this watermark
-            c.setFillAlpha(opacity)
-            
-            # Convert hex color to RGB
-            rgb_color = self.hex_to_rgb(color)
-            c.setFillColorRGB(*rgb_color)
-            
-            # Calculate text position
-            if position in self.supported_positions:
-                x, y = self.supported_positions[position]
-            elif position == 'custom':
-                # Custom position from custom_x and custom_y
-                x = float(watermark.get('custom_x', 300))
-                # PDF coordinates start from bottom-left, but we need to adjust for text baseline
-                y = page_height - float(watermark.get('custom_y', 400)) - font_size
-                print(f"Custom position: x={x}, y={y}, custom_x={watermark.get('custom_x')}, custom_y={watermark.get('custom_y')}, page_height={page_height}, font_size={font_size}")  # Debug print
-            else:
-                # Try to parse as comma-separated coordinates
-                try:
-                    coords = position.split(',')
-                    x, y = float(coords[0]), float(coords[1])
-                    print(f"Parsed position: x={x}, y={y}")  # Debug print
-                except:
-                    x, y = 300, 400  # Default to center
-                    print(f"Default position: x={x}, y={y}")  # Debug print
-            
-            # Calculate available space for text (with margins)
-            margin = 20
-            available_width = page_width - 2 * margin
-            available_height = page_height - 2 * margin
-            
-            # Calculate optimal font size and text wrapping
-            font_name = "Helvetica-Bold"
-            optimal_result = self.calculate_optimal_font_size(text, available_width, available_height, font_name, font_size)
-            
-            if isinstance(optimal_result, tuple):
-                # Text needs to be wrapped
-                adjusted_font_size, wrapped_lines = optimal_result
-                print(f"Text wrapped into {len(wrapped_lines)} lines with font size {adjusted_font_size}")
-            else:
-                # Text fits in single line
-                adjusted_font_size = optimal_result
-                wrapped_lines = [text]
-                print(f"Text fits in single line with font size {adjusted_font_size}")
+        for watermark in watermarks:
+            start_time = time.perf_counter()
+            layout = self.layout_watermark(watermark, page_width, page_height)
+            if self.observer is not None:
+                self._span('layout', start_time, lines=len(layout['lines']), font_size=layout['font_size'])
+            x, y = layout['x'], layout['y']
+            wrapped_lines = layout['lines']
+            adjusted_font_size = layout['font_size']
+            rotation = layout['rotation']
+            
+            # Set transparency and color for this watermark
+            c.setFillAlpha(layout['opacity'])
+            c.setFillColorRGB(*layout['rgb_color'])
             
             # Set font with adjusted size
-            c.setFont(font_name, adjusted_font_size)
-            
-            # Calculate final text dimensions
-            if len(wrapped_lines) == 1:
-                text_width = c.stringWidth(wrapped_lines[0], font_name, adjusted_font_size)
-                text_height = adjusted_font_size
-            else:
-                # For wrapped text, calculate total width and height
-                text_width = max(c.stringWidth(line, font_name, adjusted_font_size) for line in wrapped_lines)
-                text_height = len(wrapped_lines) * adjusted_font_size
-            
-            # Adjust position to center the text within available space
-            if position in self.supported_positions:
-                # For preset positions, adjust to ensure text fits
-                if x + text_width > page_width - margin:
-                    x = page_width - text_width - margin
-                if y + text_height > page_height - margin:
-                    y = page_height - text_height - margin
-                if x < margin:
-                    x = margin
-                if y < margin:
-                    y = margin
-            
-            print(f"Final position: x={x}, y={y}, text_width={text_width}, text_height={text_height}, font_size={adjusted_font_size}")  # Debug print
+            c.setFont(layout['font_name'], adjusted_font_size)
             
             # Draw the text (single line or wrapped)
             if rotation != 0:
@@ -309,7 +425,8 @@ class PDFWatermarker:
                         c.drawString(x, line_y, line)
         
         c.save()
-        return watermark_file.name
+        watermark_buffer.seek(0)
+        return watermark_buffer
     
     def add_watermark(self, input_path, output_path, text, position='center', 
                      font_size=24, color='#000000', opacity=0.5, rotation=0):
@@ -335,7 +452,133 @@ class PDFWatermarker:
             'rotation': rotation
         }])
 
-    def add_multiple_watermarks(self, input_path, output_path, watermarks):
+    def _write_incremental_update(self, reader, input_path, output_path, page_watermarks, geometries=None):
+        """Stamp the watermarked pages and append them to a copy of the input as an incremental update"""
+        writer = IncrementalWriter(reader)
+        stamper = XObjectStamper(writer, copy_on_write=True)
+        overlay_cache = {}
+        observer = self.observer
+        merge_time = 0.0
+        
+        # Only pages that carry watermarks are touched
+        for page_num in sorted(page_watermarks):
+            page = reader.pages[page_num - 1]
+            geometry = geometries[page_num - 1] if geometries else page_geometry(page)
+            watermark_page = self._get_overlay_page(overlay_cache, page_watermarks[page_num], geometry)
+            start_time = time.perf_counter()
+            stamper.stamp(page, watermark_page)
+            writer.update_object(page.indirect_reference, page)
+            if observer is not None:
+                page_time = time.perf_counter() - start_time
+                merge_time += page_time
+                observer.on_span('page', page_time, page=page_num, watermarks=len(page_watermarks[page_num]))
+        
+        if observer is not None:
+            observer.on_span('merge', merge_time, pages=len(page_watermarks),
+                             watermarked_pages=len(page_watermarks), overlays=len(overlay_cache))
+        
+        # The unchanged pages are copied with the rest of the input
+        start_time = time.perf_counter()
+        writer.write(input_path, output_path)
+        if observer is not None:
+            self._span('write', start_time, bytes=os.path.getsize(output_path))
+    
+    def _stamp_pages(self, reader, writer, stamper, page_watermarks, start, end, geometries=None):
+        """
+        Add pages start..end-1 (0-indexed) of reader to writer, stamping the watermarked ones
+        
+        geometries, when given, holds the PageGeometry of every page of the document
+        """
+        # Overlays rendered for this job, shared by every page with the same
+        # watermark set and geometry (mediabox, cropbox, /Rotate)
+        overlay_cache = {}
+        observer = self.observer
+        merge_time = 0.0
+        
+        # Process each page
+        for page_index in range(start, end):
+            page_num = page_index + 1  # Convert to 1-indexed
+            page = reader.pages[page_index]
+            
+            # Check if this page has watermarks
+            if page_num in page_watermarks:
+                geometry = geometries[page_index] if geometries else page_geometry(page)
+                watermark_page = self._get_overlay_page(overlay_cache, page_watermarks[page_num], geometry)
+            else:
+                watermark_page = None
+            
+            # Add page to writer (with or without watermarks)
+            start_time = time.perf_counter()
+            self._add_stamped_page(writer, stamper, page, watermark_page)
+            if observer is not None:
+                page_time = time.perf_counter() - start_time
+                merge_time += page_time
+                observer.on_span('page', page_time, page=page_num,
+                                 watermarks=len(page_watermarks.get(page_num, ())))
+        
+        if observer is not None:
+            watermarked_pages = sum(1 for page_num in page_watermarks if start < page_num <= end)
+            observer.on_span('merge', merge_time, pages=end - start,
+                             watermarked_pages=watermarked_pages, overlays=len(overlay_cache))
+    
+    def render_page_chunk(self, input_path, page_watermarks, start, end, stamp_mode='merge'):
+        """
+        Stamp pages start..end-1 (0-indexed) of a PDF into a standalone document
+        
+        Returns:
+            bytes: The chunk as a PDF file
+        """
+        reader = PdfReader(input_path)
+        writer = PdfWriter()
+        self._stamp_pages(reader, writer, self._create_stamper(writer, stamp_mode),
+                          page_watermarks, start, end)
+        
+        chunk_buffer = io.BytesIO()
+        writer.write(chunk_buffer)
+        return chunk_buffer.getvalue()
+    
+    def _use_parallel(self, reader):
+        """Whether a document is large enough to be worth stamping in worker processes"""
+        return (
+            self.workers > 1
+            and len(reader.pages) >= self.parallel_min_pages
+            and not reader.is_encrypted
+        )
+    
+    def _write_parallel(self, input_path, output_path, page_watermarks, total_pages, stamp_mode):
+        """Stamp page chunks in worker processes and stitch them back together in page order"""
+        num_chunks = min(total_pages, self.workers * CHUNKS_PER_WORKER)
+        chunk_size = math.ceil(total_pages / num_chunks)
+        
+        futures = []
+        pool = get_process_pool(self.workers)
+        for start in range(0, total_pages, chunk_size):
+            end = min(start + chunk_size, total_pages)
+            # Each worker only needs the watermarks of its own pages
+            chunk_watermarks = {
+                page_num: page_watermarks[page_num]
+                for page_num in range(start + 1, end + 1)
+                if page_num in page_watermarks
+            }
+            futures.append(pool.submit(
+                _render_page_chunk, input_path, chunk_watermarks, start, end, stamp_mode
+            ))
+        
+        self._message(f"Stamping {total_pages} pages in {len(futures)} chunk(s) on {self.workers} worker(s)")
+        
+        writer = PdfWriter()
+        for future in futures:
+            for page in PdfReader(io.BytesIO(future.result())).pages:
+                writer.add_page(page)
+        
+        start_time = time.perf_counter()
+        with open(output_path, 'wb') as output_file:
+            writer.write(output_file)
+        if self.observer is not None:
+            self._span('write', start_time, bytes=os.path.getsize(output_path))
+    
+    def add_multiple_watermarks(self, input_path, output_path, watermarks, stamp_mode='merge',
+                                output_mode='rewrite', reader=None, page_geometries=None):
         """
         Add multiple watermarks to PDF file
         
@@ -351,19 +594,35 @@ class PDFWatermarker:
                 - opacity (float): Opacity (0.0 to 1.0)
                 - rotation (int): Rotation angle in degrees
                 - target_pages (list): List of page numbers (1-indexed) or 'all' for all pages
+            stamp_mode (str): 'merge' to copy overlays into each page, or 'xobject' to
+                share one Form XObject per overlay across all pages
+            output_mode (str): 'rewrite' to write a new file, or 'incremental' to append the
+                watermarked pages to a copy of the input (always stamps with Form XObjects)
+            reader (PdfReader): input_path already parsed, e.g. from a DocumentCache. It is not
+                modified, except by incremental output, which parses the file again.
+            page_geometries (list): PageGeometry of every page, e.g. from the metadata recorded
+                at upload, so overlays are planned without reading each page's boxes
         """
+        if stamp_mode not in STAMP_MODES:
+            raise ValueError(f"Unsupported stamp mode: {stamp_mode}")
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unsupported output mode: {output_mode}")
+        
+        document_start = time.perf_counter()
         try:
-            # Read input PDF
-            reader = PdfReader(input_path)
-            writer = PdfWriter()
-            
-            # Get first page to determine page size
-            first_page = reader.pages[0]
-            page_width = float(first_page.mediabox.width)
-            page_height = float(first_page.mediabox.height)
+            # Measured before an incremental update rewrites the file in place
+            input_bytes = os.path.getsize(input_path) if self.observer is not None else None
+            
+            # Read input PDF, unless it was parsed already
+            if reader is None or output_mode == 'incremental':
+                start_time = time.perf_counter()
+                reader = PdfReader(input_path)
+                # Flattening the page tree is part of parsing
+                self._span('parse', start_time, pages=len(reader.pages))
             total_pages = len(reader.pages)
             
-            print(f"PDF has {total_pages} pages")
+            if page_geometries is not None and len(page_geometries) != total_pages:
+                page_geometries = None
             
             # Group watermarks by target pages
             page_watermarks = {}  # page_num -> list of watermarks
@@ -383,52 +642,128 @@ class PDFWatermarker:
                         if page_num not in page_watermarks:
                             page_watermarks[page_num] = []
                         page_watermarks[page_num].append(watermark)
-                        print(f"Adding watermark '{watermark.get('text')}' to page {page_num}")
             
-            # Process each page
-            for page_index in range(total_pages):
-                page_num = page_index + 1  # Convert to 1-indexed
-                page = reader.pages[page_index]
-                
-                # Check if this page has watermarks
-                if page_num in page_watermarks:
-                    # Create watermark PDF for this specific page
-                    combined_watermark_path = self.create_multiple_watermarks_pdf(
-                        page_watermarks[page_num], page_width, page_height
-                    )
-                    
-                    # Read combined watermark PDF
-                    watermark_reader = PdfReader(combined_watermark_path)
-                    watermark_page = watermark_reader.pages[0]
-                    
-                    # Merge watermark with page
-                    page.merge_page(watermark_page)
-                    
-                    # Clean up temporary watermark file
-                    os.unlink(combined_watermark_path)
-                    
-                    print(f"Applied {len(page_watermarks[page_num])} watermark(s) to page {page_num}")
-                else:
-                    print(f"No watermarks for page {page_num}")
-                
-                # Add page to writer (with or without watermarks)
-                writer.add_page(page)
+            if output_mode == 'incremental' and reader.is_encrypted:
+                self._message("Encrypted input, falling back to rewriting the whole document")
+                output_mode = 'rewrite'
+            parallel = output_mode == 'rewrite' and self._use_parallel(reader)
             
-            # Write output PDF
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
+            if output_mode == 'incremental':
+                self._write_incremental_update(reader, input_path, output_path, page_watermarks,
+                                               page_geometries)
+            elif parallel:
+                self._write_parallel(input_path, output_path, page_watermarks, total_pages, stamp_mode)
+            else:
+                writer = PdfWriter()
+                self._stamp_pages(reader, writer, self._create_stamper(writer, stamp_mode),
+                                  page_watermarks, 0, total_pages, page_geometries)
+                
+                # Write output PDF
+                start_time = time.perf_counter()
+                with open(output_path, 'wb') as output_file:
+                    writer.write(output_file)
+                if self.observer is not None:
+                    self._span('write', start_time, bytes=os.path.getsize(output_path))
+            
+            if self.observer is not None:
+                self._span('document', document_start, operation='add_multiple_watermarks',
+                           pages=total_pages, watermarked_pages=len(page_watermarks),
+                           stamp_mode=stamp_mode, output_mode=output_mode, parallel=parallel,
+                           input_bytes=input_bytes, output_bytes=os.path.getsize(output_path))
             
             return True
             
         except Exception as e:
-            # Clean up temporary files if they exist
-            if 'combined_watermark_path' in locals():
-                try:
-                    os.unlink(combined_watermark_path)
-                except:
-                    pass
             raise e
     
+    def watermark_batch(self, items):
+        """
+        Watermark many files, yielding each item's result as soon as it finishes
+        
+        Items run on the batch pool when batch_workers > 1, with at most
+        CHUNKS_PER_WORKER items in flight per worker. A failing item produces an
+        error result and does not stop the rest of the batch.
+        
+        Args:
+            items (iterable): Dicts with 'input_path', 'output_path' and 'watermarks', and
+                optionally 'id', 'stamp_mode' and 'output_mode'
+        
+        Yields:
+            dict: id, success, output_path, elapsed and, for failed items, error
+        """
+        if self.batch_workers <= 1:
+            for index, item in enumerate(items):
+                yield _run_batch_item(self, index, item)
+            return
+        
+        pool = get_batch_pool(self.batch_workers)
+        max_in_flight = self.batch_workers * CHUNKS_PER_WORKER
+        pending = {}
+        item_iterator = enumerate(items)
+        
+        while True:
+            # Keep the pool fed without queuing the whole batch up front
+            for index, item in item_iterator:
+                pending[pool.submit(_run_worker_batch_item, index, item)] = (index, item)
+                if len(pending) >= max_in_flight:
+                    break
+            
+            if not pending:
+                return
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = pending.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # The worker itself failed, e.g. it was killed while processing the item
+                    yield _batch_error(index, item, e, 0.0)
+    
+    def targets_page(self, watermark, page_num, total_pages):
+        """Whether a watermark's target_pages include a page, without expanding 'all'"""
+        if not 1 <= page_num <= total_pages:
+            return False
+        target_pages = watermark.get('target_pages', [1])  # Default to first page only
+        if target_pages == 'all':
+            return True
+        if not isinstance(target_pages, list):
+            target_pages = [1]  # Default fallback
+        return page_num in target_pages
+    
+    def render_page_preview(self, reader, page_num, watermarks):
+        """
+        Render one page of a parsed document with its watermarks as a standalone PDF
+        
+        Work depends on the single page, not on the document length. The reader's
+        pages are not modified, so a cached reader can serve many previews.
+        
+        Args:
+            reader (PdfReader): Parsed input document
+            page_num (int): 1-indexed page to render
+            watermarks (list): Watermarks, only those targeting page_num are drawn
+        
+        Returns:
+            bytes: The one-page PDF
+        """
+        total_pages = len(reader.pages)
+        if not 1 <= page_num <= total_pages:
+            raise ValueError(f"Page {page_num} out of range (1-{total_pages})")
+        
+        page = reader.pages[page_num - 1]
+        page_watermarks = [w for w in watermarks if self.targets_page(w, page_num, total_pages)]
+        
+        writer = PdfWriter()
+        writer_page = writer.add_page(page)
+        if page_watermarks:
+            # Stamping the writer's copy leaves the cached reader untouched
+            watermark_page = self._get_overlay_page({}, page_watermarks, page_geometry(page))
+            XObjectStamper(writer, copy_on_write=True).stamp(writer_page, watermark_page)
+        
+        preview_buffer = io.BytesIO()
+        writer.write(preview_buffer)
+        return preview_buffer.getvalue()
+    
     def get_pdf_info(self, pdf_path):
         """Get basic information about a PDF file"""
         try:
@@ -444,9 +779,41 @@ class PDFWatermarker:
         except Exception as e:
             raise e
     
+    def create_diagonal_overlay_pdf(self, text, font_size, color, opacity, spacing, geometry):
+        """Create the diagonal watermark pattern for a page geometry, returned as an in-memory buffer"""
+        watermark_buffer = io.BytesIO()
+        
+        c = canvas.Canvas(watermark_buffer, pagesize=overlay_page_size(geometry))
+        c.transform(*display_transform(geometry))
+        page_width, page_height = display_size(geometry)
+        
+        c.setFillAlpha(opacity)
+        rgb_color = self.hex_to_rgb(color)
+        c.setFillColorRGB(*rgb_color)
+        c.setFont("Helvetica-Bold", font_size)
+        
+        # Calculate diagonal pattern
+        diagonal_length = math.sqrt(page_width**2 + page_height**2)
+        num_watermarks = int(diagonal_length / spacing) + 1
+        
+        for i in range(num_watermarks):
+            x = i * spacing
+            y = i * spacing
+            
+            if x < page_width and y < page_height:
+                c.saveState()
+                c.translate(x, y)
+                c.rotate(45)
+                c.drawString(0, 0, text)
+                c.restoreState()
+        
+        c.save()
+        watermark_buffer.seek(0)
+        return watermark_buffer
+    
     def add_diagonal_watermark(self, input_path, output_path, text, 
                              font_size=24, color='#000000', opacity=0.3, 
-                             spacing=100, start_position='top-left'):
+                             spacing=100, start_position='top-left', stamp_mode='merge'):
         """
         Add diagonal watermark across the entire page
         
@@ -459,67 +826,162 @@ class PDFWatermarker:
             opacity (float): Opacity
             spacing (int): Spacing between watermarks
             start_position (str): Starting position for diagonal pattern
+            stamp_mode (str): 'merge' or 'xobject', see add_multiple_watermarks
         """
+        document_start = time.perf_counter()
         try:
             # Read input PDF
             reader = PdfReader(input_path)
+            self._span('parse', document_start, pages=len(reader.pages))
             writer = PdfWriter()
+            stamper = self._create_stamper(writer, stamp_mode)
+            observer = self.observer
+            merge_time = 0.0
             
-            # Get page dimensions
-            first_page = reader.pages[0]
-            page_width = float(first_page.mediabox.width)
-            page_height = float(first_page.mediabox.height)
-            
-            # Create diagonal watermark pattern
-            watermark_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-            watermark_file.close()
+            # Diagonal overlays, one per distinct page geometry
+            overlay_cache = {}
             
-            c = canvas.Canvas(watermark_file.name, pagesize=(page_width, page_height))
-            c.setFillAlpha(opacity)
-            rgb_color = self.hex_to_rgb(color)
-            c.setFillColorRGB(*rgb_color)
-            c.setFont("Helvetica-Bold", font_size)
-            
-            # Calculate diagonal pattern
-            text_width = c.stringWidth(text, "Helvetica-Bold", font_size)
-            diagonal_length = math.sqrt(page_width**2 + page_height**2)
-            num_watermarks = int(diagonal_length / spacing) + 1
-            
-            for i in range(num_watermarks):
-                x = i * spacing
-                y = i * spacing
+            # Apply to all pages
+            for page_num, page in enumerate(reader.pages, 1):
+                geometry = page_geometry(page)
+                watermark_page = overlay_cache.get(geometry)
                 
-                if x < page_width and y < page_height:
-                    c.saveState()
-                    c.translate(x, y)
-                    c.rotate(45)
-                    c.drawString(0, 0, text)
-                    c.restoreState()
-            
-            c.save()
-            
-            # Read watermark PDF
-            watermark_reader = PdfReader(watermark_file.name)
-            watermark_page = watermark_reader.pages[0]
+                if watermark_page is None:
+                    start_time = time.perf_counter()
+                    watermark_buffer = self.create_diagonal_overlay_pdf(
+                        text, font_size, color, opacity, spacing, geometry
+                    )
+                    watermark_reader = PdfReader(watermark_buffer)
+                    watermark_page = watermark_reader.pages[0]
+                    overlay_cache[geometry] = watermark_page
+                    if observer is not None:
+                        self._span('overlay', start_time, watermarks=1, bytes=watermark_buffer.getbuffer().nbytes)
+                
+                start_time = time.perf_counter()
+                self._add_stamped_page(writer, stamper, page, watermark_page)
+                if observer is not None:
+                    page_time = time.perf_counter() - start_time
+                    merge_time += page_time
+                    observer.on_span('page', page_time, page=page_num, watermarks=1)
             
-            # Apply to all pages
-            for page in reader.pages:
-                page.merge_page(watermark_page)
-                writer.add_page(page)
+            if observer is not None:
+                observer.on_span('merge', merge_time, pages=len(reader.pages),
+                                 watermarked_pages=len(reader.pages), overlays=len(overlay_cache))
             
             # Write output PDF
+            start_time = time.perf_counter()
             with open(output_path, 'wb') as output_file:
                 writer.write(output_file)
             
-            # Clean up
-            os.unlink(watermark_file.name)
+            if observer is not None:
+                output_bytes = os.path.getsize(output_path)
+                self._span('write', start_time, bytes=output_bytes)
+                self._span('document', document_start, operation='add_diagonal_watermark',
+                           pages=len(reader.pages), watermarked_pages=len(reader.pages),
+                           stamp_mode=stamp_mode, output_mode='rewrite', parallel=False,
+                           input_bytes=os.path.getsize(input_path), output_bytes=output_bytes)
             
             return True
             
         except Exception as e:
-            if 'watermark_file' in locals():
-                try:
-                    os.unlink(watermark_file.name)
-                except:
-                    pass
             raise e
+
+# Process pool shared by every PDFWatermarker, kept alive so workers stay warm between jobs
+_process_pool = None
+_process_pool_workers = 0
+
+# Separate pool for batch items, so batches neither wait for nor starve page-parallel stamping
+_batch_pool = None
+_batch_pool_workers = 0
+
+# Watermarker of the current worker process, created once by the pool initializer
+_worker_watermarker = None
+
+def _init_worker():
+    """Import and warm up ReportLab and PyPDF2 once per worker process"""
+    global _worker_watermarker
+    _worker_watermarker = PDFWatermarker(workers=1)
+    # Renders a throwaway overlay so fonts and metrics are loaded before the first chunk arrives
+    _worker_watermarker._get_overlay_page({}, [{'text': 'warm up'}], geometry_from_size(*letter))
+
+def _render_page_chunk(input_path, page_watermarks, start, end, stamp_mode):
+    return _worker_watermarker.render_page_chunk(input_path, page_watermarks, start, end, stamp_mode)
+
+def _batch_error(index, item, error, elapsed):
+    return {
+        'id': item.get('id', index),
+        'success': False,
+        'output_path': item.get('output_path'),
+        'elapsed': elapsed,
+        'error': str(error)
+    }
+
+def _run_batch_item(watermarker, index, item):
+    """Watermark one batch item, turning any failure into an error result"""
+    start_time = time.perf_counter()
+    try:
+        watermarker.add_multiple_watermarks(
+            item['input_path'],
+            item['output_path'],
+            item['watermarks'],
+            stamp_mode=item.get('stamp_mode', 'merge'),
+            output_mode=item.get('output_mode', 'rewrite')
+        )
+    except Exception as e:
+        watermarker._message(f"Batch item {item.get('id', index)} failed: {e}")
+        return _batch_error(index, item, e, time.perf_counter() - start_time)
+    
+    return {
+        'id': item.get('id', index),
+        'success': True,
+        'output_path': item['output_path'],
+        'elapsed': time.perf_counter() - start_time
+    }
+
+def _run_worker_batch_item(index, item):
+    return _run_batch_item(_worker_watermarker, index, item)
+
+def _create_pool(workers):
+    # spawn avoids forking a server process that is running other threads
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker
+    )
+
+def get_process_pool(workers):
+    """Return the shared worker pool, recreating it when the worker count changes"""
+    global _process_pool, _process_pool_workers
+    if _process_pool is None or _process_pool_workers != workers:
+        _shutdown_page_pool()
+        _process_pool = _create_pool(workers)
+        _process_pool_workers = workers
+    return _process_pool
+
+def get_batch_pool(workers):
+    """Return the batch worker pool, recreating it when the worker count changes"""
+    global _batch_pool, _batch_pool_workers
+    if _batch_pool is None or _batch_pool_workers != workers:
+        _shutdown_batch_pool()
+        _batch_pool = _create_pool(workers)
+        _batch_pool_workers = workers
+    return _batch_pool
+
+def _shutdown_page_pool():
+    global _process_pool, _process_pool_workers
+    if _process_pool is not None:
+        _process_pool.shutdown()
+        _process_pool = None
+        _process_pool_workers = 0
+
+def _shutdown_batch_pool():
+    global _batch_pool, _batch_pool_workers
+    if _batch_pool is not None:
+        _batch_pool.shutdown()
+        _batch_pool = None
+        _batch_pool_workers = 0
+
+def shutdown_process_pool():
+    """Stop the shared worker pool and the batch pool, if they are running"""
+    _shutdown_page_pool()
+    _shutdown_batch_pool()
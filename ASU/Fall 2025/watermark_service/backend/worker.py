@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Watermark job worker
+Consumes jobs enqueued by the API and runs them through the PDF engine.
+
+Usage:
+    JOB_QUEUE_URL=sqlite:///jobs.db python worker.py
+    REDIS_URL=redis://localhost:6379/0 python worker.py
+"""
+
+import os
+import argparse
+import tempfile
+import threading
+import traceback
+from watermark_service import PDFWatermarker
+from document_metadata import page_geometries
+from job_queue import create_job_queue, default_queue_url
+from result_cache import create_result_cache
+
+def process_job(watermarker, job, result_cache=None, document_cache=None):
+    """Run one watermark job and return its result"""
+    payload = job['payload']
+    output_path = payload['output_path']
+    # The engine writes a private file that is moved into place when complete, so readers of
+    # output_path never see a partial file, whichever worker is writing it
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or '.', suffix='.pdf.tmp')
+    os.close(fd)
+    try:
+        _watermark_job_output(watermarker, payload, temp_path, document_cache)
+        # Later requests for the same input and spec are answered from the cache. The entry is
+        # copied from this job's own file, output_path may already be another writer's
+        if result_cache is not None and payload.get('cache_key'):
+            result_cache.put(payload['cache_key'], temp_path)
+        os.replace(temp_path, output_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise e
+
+    return {'output_path': output_path}
+
+def _watermark_job_output(watermarker, payload, output_path, document_cache):
+    options = {
+        'stamp_mode': payload.get('stamp_mode', 'merge'),
+        'output_mode': payload.get('output_mode', 'rewrite')
+    }
+    if payload.get('metadata'):
+        # Recorded at upload, the engine plans overlays without reading page boxes
+        options['page_geometries'] = page_geometries(payload['metadata'])
+
+    if document_cache is not None and payload.get('document_key'):
+        # Workers in the API process stamp the document the API has already parsed
+        document = document_cache.get(payload['input_path'], tuple(payload['document_key']))
+        with document.lock:
+            watermarker.add_multiple_watermarks(
+                payload['input_path'], output_path, payload['watermarks'],
+                reader=document.reader, **options
+            )
+    else:
+        watermarker.add_multiple_watermarks(
+            payload['input_path'], output_path, payload['watermarks'], **options
+        )
+
+def run_worker(job_queue, stop_event=None, poll_timeout=1.0, result_cache=None, document_cache=None):
+    """Process jobs until stop_event is set (forever when it is None)"""
+    # One engine per worker, so its warm state is reused across jobs
+    watermarker = PDFWatermarker()
+
+    while stop_event is None or not stop_event.is_set():
+        job = job_queue.dequeue(timeout=poll_timeout)
+        if job is None:
+            continue
+
+        print(f"Processing job {job['id']}")
+        done = threading.Event()
+        threading.Thread(target=_renew_lease, args=(job_queue, job['id'], done), daemon=True).start()
+        try:
+            result = process_job(watermarker, job, result_cache, document_cache)
+        except Exception as e:
+            traceback.print_exc()
+            job_queue.fail(job['id'], str(e))
+            print(f"Job {job['id']} failed: {e}")
+        else:
+            job_queue.complete(job['id'], result)
+            print(f"Job {job['id']} done")
+        finally:
+            done.set()
+
+def _renew_lease(job_queue, job_id, done):
+    # A few heartbeats per lease, so one slow write to the broker does not let the job be requeued
+    while not done.wait(job_queue.lease_seconds / 3):
+        try:
+            job_queue.heartbeat(job_id)
+        except Exception as e:
+            print(f"Could not renew the lease of job {job_id}: {e}")
+
+def start_worker_threads(job_queue, num_threads=1, result_cache=None, document_cache=None):
+    """Run workers as daemon threads of this process, needed for the in-process broker"""
+    stop_event = threading.Event()
+    for index in range(num_threads):
+        threading.Thread(
+            target=run_worker,
+            args=(job_queue, stop_event, 1.0, result_cache, document_cache),
+            name=f"watermark-worker-{index}",
+            daemon=True
+        ).start()
+    return stop_event
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watermark job worker')
+    parser.add_argument('--queue-url', default=default_queue_url(),
+                        help='sqlite:///path/to/jobs.db or redis://host:port/db')
+    args = parser.parse_args()
+
+    if args.queue_url.startswith('memory://'):
+        parser.error('The in-process queue cannot be shared with a separate worker, set JOB_QUEUE_URL or REDIS_URL')
+
+    print(f"Worker consuming jobs from {args.queue_url}")
+    run_worker(create_job_queue(args.queue_url), result_cache=create_result_cache())
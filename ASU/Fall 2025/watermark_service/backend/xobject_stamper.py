@@ -0,0 +1,119 @@
+"""
+Form XObject stamping for watermark overlays
+Registers each overlay once in the output document and stamps pages with a short Do invocation
+"""
+
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject
+)
+
+class XObjectStamper:
+    """Stamps overlay pages onto pages of a PdfWriter through shared Form XObjects"""
+
+    def __init__(self, writer, copy_on_write=False):
+        """
+        Args:
+            writer: PdfWriter, or IncrementalWriter when updating a document in place
+            copy_on_write (bool): Give each stamped page its own resource dictionaries
+                instead of adding entries to ones that may be shared with other pages
+        """
+        self.writer = writer
+        self.copy_on_write = copy_on_write
+        # id(overlay page) -> (XObject name, form reference, stamp stream reference)
+        self._forms = {}
+        # Saves the page's graphics state so its own transformations cannot leak into the overlay.
+        # Added with the first stamp, so a writer with no stamped page gets no unused object
+        self._save_state_ref = None
+
+    def _add_stream(self, data):
+        """Add a content stream to the writer and return its indirect reference"""
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        return self.writer._add_object(stream)
+
+    def _copy_resources(self, resources):
+        """Copy overlay resources, and every object they reference, into the writer"""
+        if hasattr(self.writer, 'import_object'):
+            return self.writer.import_object(resources)
+        return resources.clone(self.writer)
+    
+    def _register_form(self, overlay_page):
+        """Add overlay_page to the writer as a Form XObject, once per overlay"""
+        form_entry = self._forms.get(id(overlay_page))
+        if form_entry is not None:
+            return form_entry
+
+        name = f"/WmOverlay{len(self._forms)}"
+        mediabox = overlay_page.mediabox
+
+        form = DecodedStreamObject()
+        form.set_data(overlay_page.get_contents().get_data())
+        form = form.flate_encode()
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject([
+                FloatObject(mediabox.left),
+                FloatObject(mediabox.bottom),
+                FloatObject(mediabox.right),
+                FloatObject(mediabox.top)
+            ]),
+            # Fonts and graphics states are copied into the writer a single time
+            NameObject("/Resources"): self._copy_resources(overlay_page["/Resources"].get_object())
+        })
+        form_ref = self.writer._add_object(form)
+
+        # Restores the page's graphics state, then draws the overlay
+        stamp_ref = self._add_stream(f"Q\nq {name} Do Q\n".encode())
+
+        form_entry = (name, form_ref, stamp_ref)
+        self._forms[id(overlay_page)] = form_entry
+        return form_entry
+
+    def stamp(self, page, overlay_page):
+        """Draw overlay_page on top of a page that already belongs to the writer"""
+        name, form_ref, stamp_ref = self._register_form(overlay_page)
+
+        # Reference the form from the page's resources
+        if "/Resources" in page:
+            resources = page["/Resources"].get_object()
+        else:
+            resources = DictionaryObject()
+            page[NameObject("/Resources")] = resources
+        if self.copy_on_write:
+            resources = DictionaryObject(resources)
+            page[NameObject("/Resources")] = resources
+
+        if "/XObject" in resources:
+            xobjects = resources["/XObject"].get_object()
+        else:
+            xobjects = DictionaryObject()
+            resources[NameObject("/XObject")] = xobjects
+        if self.copy_on_write:
+            xobjects = DictionaryObject(xobjects)
+            resources[NameObject("/XObject")] = xobjects
+        xobjects[NameObject(name)] = form_ref
+
+        # Wrap the existing content in q/Q and append the shared stamp stream
+        if self._save_state_ref is None:
+            self._save_state_ref = self._add_stream(b"q\n")
+        contents = ArrayObject([self._save_state_ref])
+        if "/Contents" in page:
+            original_contents = page.raw_get("/Contents")
+            resolved_contents = original_contents.get_object()
+            if isinstance(resolved_contents, ArrayObject):
+                contents.extend(resolved_contents)
+            elif isinstance(original_contents, IndirectObject):
+                contents.append(original_contents)
+            else:
+                # Content streams inside an array must be indirect objects
+                contents.append(self.writer._add_object(resolved_contents))
+        contents.append(stamp_ref)
+        page[NameObject("/Contents")] = contents
+
+        return page
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Engine benchmark suite with regression gating
+Times every PDFWatermarker entry point on a synthetic corpus generated with ReportLab, records
+peak RSS and output size, writes the results as JSON and compares them against a stored baseline.
+
+Usage:
+    PYTHONPATH=backend python benchmark_suite.py --profile quick --output results.json
+    PYTHONPATH=backend python benchmark_suite.py --baseline benchmark_baseline.json
+    PYTHONPATH=backend python benchmark_suite.py --profile full --save-baseline benchmark_baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import statistics
+import tempfile
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker, ENGINE_VERSION
+from engine_observer import EngineObserver
+from benchmark_watermarks import create_benchmark_pdf, create_mixed_geometry_pdf
+
+# Bump when the result layout changes, results of another version are not compared
+RESULTS_VERSION = 1
+
+# Page counts of each document in the corpus
+PROFILES = {
+    'quick': (1, 10, 100),
+    'standard': (1, 100, 1000),
+    'full': (1, 100, 1000, 10000)
+}
+
+# Regressions beyond these fractions fail the comparison
+DEFAULT_THRESHOLDS = {
+    'max_slowdown': 0.25,
+    'max_rss_growth': 0.20,
+    'max_output_growth': 0.05,
+    # Timing changes smaller than this are noise, whatever the fraction
+    'min_seconds': 0.05
+}
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt "
+         "ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation "
+         "ullamco laboris nisi ut aliquip ex ea commodo consequat. ")
+
+DISCLAIMER = ("This document contains confidential information intended only for the named recipient "
+              "and must not be copied, forwarded or distributed without written permission. ") * 12
+
+def create_text_heavy_pdf(filename, num_pages):
+    """Create a test PDF whose pages are filled with body text, like a contract or a report"""
+    c = canvas.Canvas(filename, pagesize=letter)
+    line = (LOREM * 2)[:95]
+
+    for page_num in range(1, num_pages + 1):
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(72, 740, f"Section {page_num}")
+        text = c.beginText(72, 715)
+        text.setFont("Times-Roman", 10)
+        for line_num in range(56):
+            text.textLine(line[line_num % 7:] + line[:line_num % 7])
+        c.drawText(text)
+        c.showPage()
+
+    c.save()
+    return filename
+
+# Corpus documents, built by create(filename, num_pages)
+CORPUS = {
+    'uniform': create_benchmark_pdf,
+    'mixed': create_mixed_geometry_pdf,
+    'text': create_text_heavy_pdf
+}
+
+def corpus_document(corpus_dir, kind, num_pages):
+    """Path of a corpus document, generated on first use and reused by later runs"""
+    path = os.path.join(corpus_dir, f"{kind}_{num_pages}.pdf")
+    if not os.path.exists(path):
+        # Generated under a temporary name so an interrupted run leaves no truncated document
+        CORPUS[kind](path + '.tmp', num_pages)
+        os.replace(path + '.tmp', path)
+    return path
+
+def make_case_watermarks(kind):
+    """Watermark sets used by the cases"""
+    if kind == 'standard':
+        return [
+            {'text': 'CONFIDENTIAL', 'position': 'center', 'font_size': 48, 'rotation': 45,
+             'color': '#FF0000', 'opacity': 0.3, 'target_pages': 'all'},
+            {'text': 'INTERNAL USE ONLY', 'position': 'bottom-center', 'font_size': 14, 'target_pages': 'all'}
+        ]
+    if kind == 'many':
+        # Every preset plus custom positions, all on every page
+        positions = ['top-left', 'top-center', 'top-right', 'center-left', 'center', 'center-right',
+                     'bottom-left', 'bottom-center', 'bottom-right']
+        watermarks = [{'text': f'MARK {index + 1}', 'position': position, 'font_size': 18,
+                       'color': f'#{index * 25:02X}0080', 'target_pages': 'all'}
+                      for index, position in enumerate(positions)]
+        watermarks += [{'text': f'CUSTOM {index}', 'position': 'custom', 'custom_x': 100 + index * 120,
+                        'custom_y': 300, 'target_pages': 'all'} for index in range(3)]
+        return watermarks
+    if kind == 'long':
+        return [{'text': DISCLAIMER, 'position': 'center', 'font_size': 36, 'target_pages': 'all'}]
+    if kind == 'first_page':
+        return [{'text': 'RECEIVED', 'position': 'top-right', 'rotation': 15, 'target_pages': [1]}]
+    raise ValueError(f"Unknown watermark set: {kind}")
+
+# Each case runs one entry point on one corpus document. max_pages skips sizes the case
+# would spend minutes on without telling anything new.
+CASES = [
+    {'name': 'add_watermark', 'entry_point': 'add_watermark', 'corpus': 'uniform'},
+    {'name': 'multiple', 'entry_point': 'add_multiple_watermarks', 'corpus': 'uniform', 'watermarks': 'standard'},
+    {'name': 'multiple_xobject', 'entry_point': 'add_multiple_watermarks', 'corpus': 'uniform',
+     'watermarks': 'standard', 'options': {'stamp_mode': 'xobject'}},
+    {'name': 'incremental_first_page', 'entry_point': 'add_multiple_watermarks', 'corpus': 'uniform',
+     'watermarks': 'first_page', 'options': {'output_mode': 'incremental'}},
+    {'name': 'many_per_page', 'entry_point': 'add_multiple_watermarks', 'corpus': 'uniform', 'watermarks': 'many'},
+    {'name': 'long_text', 'entry_point': 'add_multiple_watermarks', 'corpus': 'text', 'watermarks': 'long'},
+    {'name': 'mixed_sizes', 'entry_point': 'add_multiple_watermarks', 'corpus': 'mixed', 'watermarks': 'standard'},
+    {'name': 'diagonal', 'entry_point': 'add_diagonal_watermark', 'corpus': 'uniform'},
+    {'name': 'diagonal_mixed_sizes', 'entry_point': 'add_diagonal_watermark', 'corpus': 'mixed'},
+    {'name': 'batch', 'entry_point': 'watermark_batch', 'corpus': 'uniform', 'watermarks': 'standard',
+     'max_pages': 1000},
+    {'name': 'page_preview', 'entry_point': 'render_page_preview', 'corpus': 'mixed', 'watermarks': 'standard'},
+    {'name': 'pdf_info', 'entry_point': 'get_pdf_info', 'corpus': 'uniform'}
+]
+
+# Items in a batch case, each a copy of the corpus document
+BATCH_ITEMS = 8
+
+class StageTotals(EngineObserver):
+    """Sums the time of each engine stage of a run"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def on_span(self, name, seconds, **fields):
+        # Document spans hold the whole run and page spans add up to merge
+        if name not in ('document', 'page'):
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _run_entry_point(watermarker, case, input_path, output_path, work_dir):
+    """Run a case once and return the bytes it produced, or (bytes, seconds) when only part of the run is timed"""
+    entry_point = case['entry_point']
+    options = case.get('options', {})
+
+    if entry_point == 'add_watermark':
+        watermarker.add_watermark(input_path, output_path, 'CONFIDENTIAL', rotation=45)
+    elif entry_point == 'add_multiple_watermarks':
+        watermarker.add_multiple_watermarks(input_path, output_path,
+                                            make_case_watermarks(case['watermarks']), **options)
+    elif entry_point == 'add_diagonal_watermark':
+        watermarker.add_diagonal_watermark(input_path, output_path, 'DRAFT', **options)
+    elif entry_point == 'watermark_batch':
+        items = [{
+            'id': index,
+            'input_path': input_path,
+            'output_path': os.path.join(work_dir, f"batch_{index}.pdf"),
+            'watermarks': make_case_watermarks(case['watermarks'])
+        } for index in range(BATCH_ITEMS)]
+        results = list(watermarker.watermark_batch(items))
+        assert all(result['success'] for result in results)
+        return sum(os.path.getsize(result['output_path']) for result in results)
+    elif entry_point == 'render_page_preview':
+        # The API previews pages of a document it has already parsed
+        reader = PdfReader(input_path)
+        page_num = (len(reader.pages) + 1) // 2
+        start_time = time.perf_counter()
+        preview = watermarker.render_page_preview(reader, page_num, make_case_watermarks(case['watermarks']))
+        return len(preview), time.perf_counter() - start_time
+    elif entry_point == 'get_pdf_info':
+        watermarker.get_pdf_info(input_path)
+        return 0
+    else:
+        raise ValueError(f"Unknown entry point: {entry_point}")
+
+    return os.path.getsize(output_path)
+
+def run_case(case, input_path, repeat=3):
+    """
+    Time a case in the calling process
+
+    Returns:
+        dict: seconds (best run), median_seconds, output_bytes, peak_rss_bytes and the
+            per-stage seconds of the best run
+    """
+    timings = []
+    best_stages = None
+    output_bytes = 0
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, "output.pdf")
+        for _ in range(repeat):
+            stages = StageTotals()
+            # Batches run serially here, so stage totals and peak RSS cover the whole case
+            watermarker = PDFWatermarker(workers=1, batch_workers=1, observer=stages)
+            start_time = time.perf_counter()
+            produced = _run_entry_point(watermarker, case, input_path, output_path, work_dir)
+            elapsed = time.perf_counter() - start_time
+            if isinstance(produced, tuple):
+                # Entry points that need setup time only their own call
+                produced, elapsed = produced
+            output_bytes = produced
+
+            if not timings or elapsed < min(timings):
+                best_stages = stages.seconds
+            timings.append(elapsed)
+
+    return {
+        'seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'output_bytes': output_bytes,
+        'peak_rss_bytes': _peak_rss_bytes(),
+        'stages': {stage: round(seconds, 6) for stage, seconds in sorted(best_stages.items())}
+    }
+
+def run_case_isolated(case, input_path, repeat=3):
+    """Run a case in a fresh process, so its peak RSS is its own"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(run_case, case, input_path, repeat).result()
+
+def run_suite(page_counts, corpus_dir, case_names=None, repeat=3, isolated=True):
+    """Run every case on every page count and return the results document"""
+    results = []
+
+    for num_pages in page_counts:
+        for case in CASES:
+            if case_names and case['name'] not in case_names:
+                continue
+            if num_pages > case.get('max_pages', num_pages):
+                continue
+
+            input_path = corpus_document(corpus_dir, case['corpus'], num_pages)
+            run = run_case_isolated if isolated else run_case
+            result = run(case, input_path, repeat)
+            result.update({
+                'case': case['name'],
+                'entry_point': case['entry_point'],
+                'pages': num_pages,
+                'input_bytes': os.path.getsize(input_path)
+            })
+            results.append(result)
+            print(f"{case['name']:>24} {num_pages:>7} {result['seconds']:>10.3f} "
+                  f"{result['peak_rss_bytes'] / 2**20:>10.1f} {result['output_bytes'] / 1024:>12.1f}")
+
+    return {
+        'version': RESULTS_VERSION,
+        'engine_version': ENGINE_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results
+    }
+
+def _result_key(result):
+    return f"{result['case']}/{result['pages']}"
+
+def host_mismatch(baseline, current):
+    """Describe how the baseline's host differs from the current one, None when they match"""
+    differences = [
+        f"{field} {baseline.get(field)} -> {current.get(field)}"
+        for field in ('platform', 'cpu_count') if baseline.get(field) != current.get(field)
+    ]
+    return ', '.join(differences) or None
+
+def compare_results(baseline, current, thresholds=None):
+    """
+    Compare results against a baseline
+
+    Times and peak RSS are only compared when the baseline was recorded on the same platform with
+    the same number of CPUs, see host_mismatch(). Output sizes are always compared.
+
+    Returns:
+        list: (case/pages key, message) per regression, empty when every case is within the thresholds
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    if baseline.get('version') != current.get('version'):
+        return [(None, f"Baseline has results version {baseline.get('version')}, expected {current.get('version')}")]
+
+    baseline_results = {_result_key(result): result for result in baseline['results']}
+    same_host = host_mismatch(baseline, current) is None
+    regressions = []
+
+    for result in current['results']:
+        key = _result_key(result)
+        previous = baseline_results.get(key)
+        if previous is None:
+            continue
+
+        if same_host:
+            slowdown = result['seconds'] - previous['seconds']
+            if slowdown > thresholds['min_seconds'] and slowdown > previous['seconds'] * thresholds['max_slowdown']:
+                regressions.append((key, f"{previous['seconds']:.3f}s -> {result['seconds']:.3f}s"))
+            if result['peak_rss_bytes'] > previous['peak_rss_bytes'] * (1 + thresholds['max_rss_growth']):
+                regressions.append((key, f"peak RSS {previous['peak_rss_bytes'] / 2**20:.1f} MB -> "
+                                         f"{result['peak_rss_bytes'] / 2**20:.1f} MB"))
+        if result['output_bytes'] > previous['output_bytes'] * (1 + thresholds['max_output_growth']):
+            regressions.append((key, f"output {previous['output_bytes']} B -> {result['output_bytes']} B"))
+
+    return regressions
+
+def rerun_regressed(current, regressions, corpus_dir, repeat):
+    """Run regressed cases again and replace their results, a noisy run rarely repeats"""
+    keys = {key for key, _ in regressions if key is not None}
+    for index, result in enumerate(current['results']):
+        if _result_key(result) in keys:
+            rerun = run_suite([result['pages']], corpus_dir, {result['case']}, repeat)
+            current['results'][index] = rerun['results'][0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PDF engine benchmark suite')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick',
+                        help='Document sizes to run: quick (1-100 pages), standard (1-1,000), full (1-10,000)')
+    parser.add_argument('--pages', help='Comma-separated page counts, overrides --profile')
+    parser.add_argument('--cases', help='Comma-separated case names, defaults to all')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the fastest is reported')
+    parser.add_argument('--corpus-dir', help='Keep generated documents here and reuse them across runs')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against these results and exit with 1 on a regression')
+    parser.add_argument('--save-baseline', help='Write the results as the new baseline to this file')
+    for name, default in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=default,
+                            help=f'Regression threshold (default: {default})')
+    args = parser.parse_args()
+
+    page_counts = [int(pages) for pages in args.pages.split(',')] if args.pages else PROFILES[args.profile]
+    case_names = set(args.cases.split(',')) if args.cases else None
+
+    print(f"{'case':>24} {'pages':>7} {'best (s)':>10} {'RSS (MB)':>10} {'output (KB)':>12}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = args.corpus_dir or temp_dir
+        os.makedirs(corpus_dir, exist_ok=True)
+        current = run_suite(page_counts, corpus_dir, case_names, args.repeat)
+
+        regressions = []
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            thresholds = {name: getattr(args, name) for name in DEFAULT_THRESHOLDS}
+            mismatch = host_mismatch(baseline, current)
+            if mismatch:
+                print(f"\nWarning: {args.baseline} was recorded on another host ({mismatch}), "
+                      f"only output sizes are compared. Record a baseline on this machine with --save-baseline")
+            regressions = compare_results(baseline, current, thresholds)
+            if regressions:
+                print(f"\nRunning {len(regressions)} regressed case(s) again")
+                rerun_regressed(current, regressions, corpus_dir, args.repeat)
+                regressions = compare_results(baseline, current, thresholds)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for key, message in regressions:
+                print(f"  {key}: {message}" if key else f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
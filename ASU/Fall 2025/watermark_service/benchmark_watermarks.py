@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the PDF watermark engine
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+from contextlib import contextmanager, redirect_stdout
+from watermark_service import PDFWatermarker, get_process_pool, get_batch_pool, shutdown_process_pool
+from watermark_index import add_watermark, update_watermark, remove_watermark, watermark_list
+from session_store import MemorySessionStore, create_session_store
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter, legal, A4, landscape
+
+# File system audit events counted by count_file_io
+FILE_IO_EVENTS = ('open', 'os.remove', 'tempfile.mkstemp')
+_file_io_counts = None
+# Audit hooks cannot be removed, so the hook is installed on first use rather than on import
+_file_io_hook_installed = False
+
+def _file_io_audit_hook(event, args):
+    if _file_io_counts is not None and event in FILE_IO_EVENTS:
+        _file_io_counts[event] += 1
+
+def count_file_io(func, *args, **kwargs):
+    """Run func and return the number of file opens, removes and temp files it caused"""
+    global _file_io_counts, _file_io_hook_installed
+    if not _file_io_hook_installed:
+        sys.addaudithook(_file_io_audit_hook)
+        _file_io_hook_installed = True
+    _file_io_counts = dict.fromkeys(FILE_IO_EVENTS, 0)
+    try:
+        with redirect_stdout(io.StringIO()):
+            func(*args, **kwargs)
+        return _file_io_counts
+    finally:
+        _file_io_counts = None
+
+def create_benchmark_pdf(filename, num_pages):
+    """Create a multi-page test PDF"""
+    c = canvas.Canvas(filename, pagesize=letter)
+
+    for page_num in range(1, num_pages + 1):
+        c.setFont("Helvetica", 16)
+        c.drawString(100, 750, f"Benchmark Document - Page {page_num}")
+        c.setFont("Helvetica", 12)
+        c.drawString(100, 700, "Lorem ipsum dolor sit amet, consectetur adipiscing elit.")
+        c.showPage()
+
+    c.save()
+    return filename
+
+# (page size, /Rotate) combinations found in scanned bundles
+MIXED_PAGE_GEOMETRIES = [
+    (letter, 0),
+    (A4, 0),
+    (legal, 0),
+    (landscape(A4), 0),
+    (letter, 90)
+]
+
+def create_mixed_geometry_pdf(filename, num_pages):
+    """Create a test PDF cycling through letter, A4, legal, landscape and rotated pages"""
+    c = canvas.Canvas(filename)
+
+    for page_num in range(1, num_pages + 1):
+        pagesize, rotation = MIXED_PAGE_GEOMETRIES[(page_num - 1) % len(MIXED_PAGE_GEOMETRIES)]
+        c.setPageSize(pagesize)
+        c.setPageRotation(rotation)
+        c.setFont("Helvetica", 16)
+        c.drawString(72, pagesize[1] - 72, f"Mixed Geometry Document - Page {page_num}")
+        c.showPage()
+
+    c.save()
+    return filename
+
+def make_watermarks(num_overlays, num_pages):
+    """Build watermarks that produce num_overlays distinct overlays over num_pages pages"""
+    watermarks = []
+
+    for i in range(num_overlays):
+        watermarks.append({
+            'text': f'CONFIDENTIAL {i + 1}',
+            'position': 'center',
+            'font_size': 36,
+            'color': '#FF0000',
+            'opacity': 0.3,
+            'rotation': 45,
+            # Each watermark covers its own slice of the document
+            'target_pages': [
+                page_num for page_num in range(1, num_pages + 1)
+                if (page_num - 1) % num_overlays == i
+            ]
+        })
+
+    return watermarks
+
+def run_watermark_job(input_file, output_file, watermarks):
+    """Run add_multiple_watermarks and return (elapsed seconds, overlays rendered)"""
+    watermarker = PDFWatermarker()
+    render_count = [0]
+    create_overlay = watermarker.create_overlay_pdf
+
+    def counting_create_overlay(*args, **kwargs):
+        render_count[0] += 1
+        return create_overlay(*args, **kwargs)
+
+    watermarker.create_overlay_pdf = counting_create_overlay
+
+    start_time = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        watermarker.add_multiple_watermarks(input_file, output_file, watermarks)
+    elapsed = time.perf_counter() - start_time
+
+    return elapsed, render_count[0]
+
+def benchmark_overlay_cache(page_counts=(10, 50, 200), overlay_counts=(1, 4)):
+    """Show overlay rendering cost scaling with distinct overlays rather than pages"""
+    print("Overlay cache benchmark")
+    print("=" * 60)
+    print(f"{'pages':>8} {'overlays':>10} {'renders':>10} {'total (s)':>12} {'ms/page':>10}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_file = os.path.join(work_dir, "benchmark_watermarked.pdf")
+
+        for num_pages in page_counts:
+            input_file = create_benchmark_pdf(
+                os.path.join(work_dir, f"benchmark_{num_pages}.pdf"), num_pages
+            )
+
+            for num_overlays in overlay_counts:
+                watermarks = make_watermarks(num_overlays, num_pages)
+                elapsed, renders = run_watermark_job(input_file, output_file, watermarks)
+                print(f"{num_pages:>8} {num_overlays:>10} {renders:>10} {elapsed:>12.3f} {elapsed / num_pages * 1000:>10.2f}")
+
+def benchmark_mixed_geometries(num_pages=200):
+    """Show overlay renders tracking distinct page geometries in a mixed-size document"""
+    print("\nMixed page geometry benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_mixed_geometry_pdf(os.path.join(work_dir, "benchmark_mixed.pdf"), num_pages)
+        output_file = os.path.join(work_dir, "benchmark_mixed_watermarked.pdf")
+
+        watermarks = [{'text': 'CONFIDENTIAL', 'position': 'bottom-right', 'target_pages': 'all'}]
+        elapsed, renders = run_watermark_job(input_file, output_file, watermarks)
+
+    print(f"Pages: {num_pages}, distinct geometries: {len(MIXED_PAGE_GEOMETRIES)}")
+    print(f"Overlays rendered: {renders}, total: {elapsed:.3f}s, {elapsed / num_pages * 1000:.2f} ms/page")
+
+def benchmark_overlay_file_io(num_pages=20):
+    """Show file system calls made per watermarked page when every page needs its own overlay"""
+    print("\nOverlay file I/O benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "benchmark_io.pdf"), num_pages)
+        output_file = os.path.join(work_dir, "benchmark_io_watermarked.pdf")
+
+        # One watermark per page so no overlay can be shared
+        watermarks = [{
+            'text': f'PAGE {page_num}',
+            'position': 'bottom-right',
+            'target_pages': [page_num]
+        } for page_num in range(1, num_pages + 1)]
+
+        counts = count_file_io(
+            PDFWatermarker().add_multiple_watermarks, input_file, output_file, watermarks
+        )
+
+    print(f"{'event':>18} {'total':>8} {'per page':>10}")
+    for event, total in counts.items():
+        print(f"{event:>18} {total:>8} {total / num_pages:>10.2f}")
+
+def benchmark_stamp_modes(page_counts=(50, 500)):
+    """Compare write time and output size of merge and Form XObject stamping"""
+    print("\nStamp mode benchmark")
+    print("=" * 60)
+    print(f"{'pages':>8} {'mode':>10} {'total (s)':>12} {'input (KB)':>12} {'output (KB)':>12} {'added B/page':>14}")
+
+    watermarks = [
+        {'text': 'CONFIDENTIAL', 'position': 'center', 'rotation': 45, 'target_pages': 'all'},
+        {'text': 'INTERNAL USE ONLY', 'position': 'bottom-center', 'target_pages': 'all'}
+    ]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_file = os.path.join(work_dir, "benchmark_stamped.pdf")
+
+        for num_pages in page_counts:
+            input_file = create_benchmark_pdf(
+                os.path.join(work_dir, f"benchmark_{num_pages}.pdf"), num_pages
+            )
+            input_size = os.path.getsize(input_file)
+
+            for stamp_mode in ('merge', 'xobject'):
+                start_time = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    PDFWatermarker().add_multiple_watermarks(
+                        input_file, output_file, watermarks, stamp_mode=stamp_mode
+                    )
+                elapsed = time.perf_counter() - start_time
+                output_size = os.path.getsize(output_file)
+
+                print(f"{num_pages:>8} {stamp_mode:>10} {elapsed:>12.3f} {input_size / 1024:>12.1f} "
+                      f"{output_size / 1024:>12.1f} {(output_size - input_size) / num_pages:>14.1f}")
+
+def benchmark_output_modes(page_counts=(200, 2000)):
+    """Compare bytes written by a full rewrite and an incremental update when stamping page 1"""
+    print("\nOutput mode benchmark")
+    print("=" * 60)
+    print(f"{'pages':>8} {'mode':>12} {'total (s)':>12} {'input (KB)':>12} {'written (KB)':>14}")
+
+    watermarks = [{'text': 'CONFIDENTIAL', 'position': 'center', 'rotation': 45, 'target_pages': [1]}]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_file = os.path.join(work_dir, "benchmark_output.pdf")
+
+        for num_pages in page_counts:
+            input_file = create_benchmark_pdf(
+                os.path.join(work_dir, f"benchmark_{num_pages}.pdf"), num_pages
+            )
+            input_size = os.path.getsize(input_file)
+
+            for output_mode in ('rewrite', 'incremental'):
+                start_time = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    PDFWatermarker().add_multiple_watermarks(
+                        input_file, output_file, watermarks, output_mode=output_mode
+                    )
+                elapsed = time.perf_counter() - start_time
+
+                # An incremental update serializes only what it appends
+                written = os.path.getsize(output_file)
+                if output_mode == 'incremental':
+                    written -= input_size
+
+                print(f"{num_pages:>8} {output_mode:>12} {elapsed:>12.3f} {input_size / 1024:>12.1f} {written / 1024:>14.1f}")
+
+@contextmanager
+def quiet_file_descriptor_stdout():
+    """Point file descriptor 1 at /dev/null, silencing worker processes as well as this one"""
+    sys.stdout.flush()
+    saved_stdout = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved_stdout, 1)
+            os.close(saved_stdout)
+
+def benchmark_parallel_pages(page_counts=(500, 2000), worker_counts=(1, 2, 4)):
+    """Speedup of page-parallel stamping over the serial path, per document size and worker count"""
+    print("\nParallel page benchmark")
+    print("=" * 60)
+    print(f"CPU cores available: {os.cpu_count()}")
+    print(f"{'pages':>8} {'workers':>8} {'total (s)':>12} {'speedup':>10}")
+
+    watermarks = [{'text': 'CONFIDENTIAL', 'position': 'center', 'rotation': 45, 'target_pages': 'all'}]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_file = os.path.join(work_dir, "benchmark_output.pdf")
+
+        for num_pages in page_counts:
+            input_file = create_benchmark_pdf(
+                os.path.join(work_dir, f"benchmark_{num_pages}.pdf"), num_pages
+            )
+
+            serial_time = None
+            for workers in worker_counts:
+                watermarker = PDFWatermarker(workers=workers, parallel_min_pages=1)
+                with quiet_file_descriptor_stdout():
+                    if workers > 1:
+                        # Start and warm the pool outside the timed run
+                        list(get_process_pool(workers).map(abs, range(workers)))
+
+                    start_time = time.perf_counter()
+                    watermarker.add_multiple_watermarks(input_file, output_file, watermarks)
+                    elapsed = time.perf_counter() - start_time
+
+                if serial_time is None:
+                    serial_time = elapsed
+                print(f"{num_pages:>8} {workers:>8} {elapsed:>12.3f} {serial_time / elapsed:>9.2f}x")
+
+    shutdown_process_pool()
+
+def benchmark_batch(num_items=40, num_pages=20, worker_counts=(1, 2, 4)):
+    """Batch throughput in files per second for each worker count"""
+    print("\nBatch benchmark")
+    print("=" * 60)
+    print(f"CPU cores available: {os.cpu_count()}")
+    print(f"{'items':>8} {'workers':>8} {'total (s)':>12} {'files/s':>10}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        items = []
+        for index in range(num_items):
+            input_file = create_benchmark_pdf(
+                os.path.join(work_dir, f"batch_{index}.pdf"), num_pages
+            )
+            items.append({
+                'input_path': input_file,
+                'output_path': os.path.join(work_dir, f"batch_output_{index}.pdf"),
+                'watermarks': [{'text': f'BATCH {index}', 'rotation': 45, 'target_pages': 'all'}]
+            })
+
+        for workers in worker_counts:
+            with quiet_file_descriptor_stdout():
+                if workers > 1:
+                    # Start and warm the pool outside the timed run
+                    list(get_batch_pool(workers).map(abs, range(workers)))
+
+                start_time = time.perf_counter()
+                results = list(PDFWatermarker(batch_workers=workers).watermark_batch(items))
+                elapsed = time.perf_counter() - start_time
+
+            assert all(result['success'] for result in results)
+            print(f"{num_items:>8} {workers:>8} {elapsed:>12.3f} {num_items / elapsed:>10.1f}")
+
+    shutdown_process_pool()
+
+def benchmark_text_layout(text_length=2000, iterations=20):
+    """Time font fitting for a long disclaimer watermark"""
+    print("\nText layout benchmark")
+    print("=" * 60)
+
+    words = ("This document contains confidential information intended only for the named recipient "
+             "and must not be copied or distributed ").split()
+    text = ' '.join(words[i % len(words)] for i in range(text_length // 6))[:text_length]
+    watermarker = PDFWatermarker()
+
+    counts = count_file_io(
+        watermarker.calculate_optimal_font_size, text, 572, 752, "Helvetica-Bold", 48
+    )
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        watermarker.calculate_optimal_font_size(text, 572, 752, "Helvetica-Bold", 48)
+    elapsed = (time.perf_counter() - start_time) / iterations
+
+    print(f"Text length: {len(text)} characters")
+    print(f"Fit time: {elapsed * 1000:.3f} ms per call")
+    print(f"File I/O events: {sum(counts.values())}")
+
+def make_session_watermark(index):
+    """A watermark as the frontend sends it, stamping a per-page identifier"""
+    return {
+        'id': f'watermark-{index}', 'text': f'COPY {index:05d}', 'position': 'bottom-right',
+        'font_size': 24, 'color': '#000000', 'opacity': 0.5, 'rotation': 0,
+        'custom_x': '', 'custom_y': '', 'target_pages': [index + 1]
+    }
+
+def benchmark_session_watermarks(counts=(100, 1000, 10000), operations=1000):
+    """Per-operation cost of session watermark updates, list scans against the id index"""
+    print("\nSession watermark storage benchmark")
+    print("=" * 60)
+    print(f"{'watermarks':>10} {'storage':>8} {'update (us)':>12} {'remove+add (us)':>16} {'list (ms)':>10} {'JSON (KB)':>10}")
+
+    for count in counts:
+        random.seed(count)
+        ids = [f'watermark-{random.randrange(count)}' for _ in range(operations)]
+
+        # The list the handlers used to scan
+        watermark_rows = [make_session_watermark(index) for index in range(count)]
+        start_time = time.perf_counter()
+        for watermark_id in ids:
+            for watermark in watermark_rows:
+                if watermark.get('id') == watermark_id:
+                    watermark['position'] = 'top-left'
+                    break
+        list_update = (time.perf_counter() - start_time) / operations
+        start_time = time.perf_counter()
+        for watermark_id in ids:
+            removed = next(w for w in watermark_rows if w.get('id') == watermark_id)
+            watermark_rows = [w for w in watermark_rows if w.get('id') != watermark_id]
+            watermark_rows.append(removed)
+        list_remove = (time.perf_counter() - start_time) / operations
+        start_time = time.perf_counter()
+        list(watermark_rows)
+        list_iterate = time.perf_counter() - start_time
+        print(f"{count:>10} {'list':>8} {list_update * 1e6:>12.2f} {list_remove * 1e6:>16.2f} "
+              f"{list_iterate * 1000:>10.3f} {len(json.dumps(watermark_rows)) / 1024:>10.1f}")
+
+        watermarks = {}
+        for index in range(count):
+            add_watermark(watermarks, make_session_watermark(index))
+        start_time = time.perf_counter()
+        for watermark_id in ids:
+            update_watermark(watermarks, watermark_id, {'position': 'top-left'})
+        index_update = (time.perf_counter() - start_time) / operations
+        start_time = time.perf_counter()
+        for watermark_id in ids:
+            removed = watermarks[watermark_id]
+            remove_watermark(watermarks, watermark_id)
+            watermarks[watermark_id] = removed
+        index_remove = (time.perf_counter() - start_time) / operations
+        start_time = time.perf_counter()
+        listed = watermark_list(watermarks)
+        index_iterate = time.perf_counter() - start_time
+        assert len(listed) == count
+        print(f"{count:>10} {'index':>8} {index_update * 1e6:>12.2f} {index_remove * 1e6:>16.2f} "
+              f"{index_iterate * 1000:>10.3f} {len(json.dumps(watermarks)) / 1024:>10.1f}")
+
+    benchmark_session_stores(counts)
+
+def benchmark_session_stores(counts=(100, 1000, 10000), operations=200):
+    """Cost of one watermark update through each session store, rewriting the session against one record"""
+    print("\nSession store update benchmark")
+    print("=" * 60)
+    print(f"{'watermarks':>10} {'store':>8} {'modify (us)':>12} {'modify_watermarks (us)':>23}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        stores = {
+            'memory': lambda: MemorySessionStore(),
+            'sqlite': lambda: create_session_store(f"sqlite:///{os.path.join(work_dir, 'sessions.db')}")
+        }
+        # Redis is only measured when one is provisioned
+        if os.environ.get('REDIS_URL'):
+            stores['redis'] = lambda: create_session_store(os.environ['REDIS_URL'])
+
+        for count in counts:
+            random.seed(count)
+            ids = [f'watermark-{random.randrange(count)}' for _ in range(operations)]
+            watermarks = {}
+            for index in range(count):
+                add_watermark(watermarks, make_session_watermark(index))
+
+            for name, create_store in stores.items():
+                store = create_store()
+                store['benchmark'] = {'watermarks': watermarks, 'room': 'session_benchmark'}
+
+                start_time = time.perf_counter()
+                for watermark_id in ids:
+                    store.modify('benchmark', lambda session: update_watermark(
+                        session['watermarks'], watermark_id, {'position': 'center'}
+                    ))
+                whole_session = (time.perf_counter() - start_time) / operations
+
+                start_time = time.perf_counter()
+                for watermark_id in ids:
+                    store.modify_watermarks('benchmark', [watermark_id], lambda records: update_watermark(
+                        records, watermark_id, {'position': 'top-left'}
+                    ))
+                one_record = (time.perf_counter() - start_time) / operations
+
+                del store['benchmark']
+                print(f"{count:>10} {name:>8} {whole_session * 1e6:>12.1f} {one_record * 1e6:>23.1f}")
+
+if __name__ == "__main__":
+    benchmark_overlay_cache()
+    benchmark_mixed_geometries()
+    benchmark_overlay_file_io()
+    benchmark_stamp_modes()
+    benchmark_output_modes()
+    benchmark_parallel_pages()
+    benchmark_batch()
+    benchmark_text_layout()
+    benchmark_session_watermarks()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { io } from 'socket.io-client';
 import { motion, AnimatePresence } from 'framer-motion';
 import { toast, Toaster } from 'react-hot-toast';
@@ -15,6 +15,9 @@ import DownloadSection from './components/DownloadSection';
 
 const API_BASE_URL = 'http://localhost:5001/api';
 const WS_URL = 'http://localhost:5001';
+// Watermark job polling backs off from the initial to the max delay (ms)
+const JOB_POLL_INITIAL_DELAY = 250;
+const JOB_POLL_MAX_DELAY = 2000;
 
 const AppContainer = styled.div`
   height: 100vh;
@@ -177,6 +180,8 @@ function App() {
   const [loadingMessage, setLoadingMessage] = useState('Processing...');
   const [outputFile, setOutputFile] = useState(null);
   const [pdfInfo, setPdfInfo] = useState(null);
+  // Increases with every update sent, so the server can drop ones that arrive late
+  const updateSeq = useRef(0);
 
   // Initialize WebSocket connection
   useEffect(() => {
@@ -199,15 +204,6 @@ function App() {
       setWatermarks(data.watermarks || []);
     });
 
-    newSocket.on('watermark_position_updated', (data) => {
-      console.log('Watermark position updated:', data);
-      setWatermarks(prev => prev.map(w => 
-        w.id === data.watermark_id 
-          ? { ...w, position: data.position }
-          : w
-      ));
-    });
-
     newSocket.on('watermark_added', (data) => {
       console.log('Watermark added:', data);
       // Check if watermark already exists
@@ -227,13 +223,20 @@ function App() {
       setWatermarks(prev => prev.filter(w => w.id !== data.watermark_id));
     });
 
-    newSocket.on('watermark_properties_updated', (data) => {
-      console.log('Watermark properties updated:', data);
-      setWatermarks(prev => prev.map(w => 
-        w.id === data.watermark_id 
-          ? { ...w, ...data.properties }
-          : w
-      ));
+    // The server coalesces position and property changes into one batch per tick
+    newSocket.on('watermark_updates', (data) => {
+      const updates = new Map(data.updates.map(update => [update.watermark_id, update]));
+      setWatermarks(prev => prev.map(w => {
+        const update = updates.get(w.id);
+        if (!update) {
+          return w;
+        }
+        const updated = { ...w, ...update.properties };
+        if (update.position !== undefined) {
+          updated.position = update.position;
+        }
+        return updated;
+      }));
     });
 
     setSocket(newSocket);
@@ -289,14 +292,29 @@ function App() {
 
   const updateWatermarkProperty = (watermarkId, property, value) => {
     if (socket && isConnected && currentFileId) {
+      updateSeq.current += 1;
       socket.emit('update_watermark_properties', {
         file_id: currentFileId,
         watermark_id: watermarkId,
-        properties: { [property]: value }
+        properties: { [property]: value },
+        seq: updateSeq.current
       });
     }
   };
 
+  const waitForJob = async (jobId) => {
+    let delay = JOB_POLL_INITIAL_DELAY;
+    for (;;) {
+      const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+      const job = await response.json();
+      if (!response.ok || job.status === 'done' || job.status === 'failed') {
+        return job;
+      }
+      await new Promise(resolve => setTimeout(resolve, delay));
+      delay = Math.min(delay * 2, JOB_POLL_MAX_DELAY);
+    }
+  };
+
   const applyWatermarks = async () => {
     if (!currentFileId || watermarks.length === 0) {
       toast.error('Please upload a file and add watermarks first.');
@@ -319,11 +337,20 @@ function App() {
 
       const data = await response.json();
 
-      if (data.success) {
-        setOutputFile(data.output_file);
-        toast.success(data.message || 'Watermarks applied successfully!');
-      } else {
+      if (!data.success) {
         toast.error(data.error || 'Failed to apply watermarks.');
+        return;
+      }
+
+      // Cached results come back immediately, otherwise the job runs in the
+      // background and is polled until it finishes
+      const job = data.job_id ? await waitForJob(data.job_id) : data;
+
+      if (job.status === 'done') {
+        setOutputFile(job.output_file);
+        toast.success(job.message || 'Watermarks applied successfully!');
+      } else {
+        toast.error(job.error || 'Failed to apply watermarks.');
       }
     } catch (error) {
       toast.error('Failed to apply watermarks. Please try again.');
@@ -125,6 +125,78 @@ const InstructionItem = styled.li`
   }
 `;
 
+// Files above this size use the resumable chunked upload API
+const SINGLE_REQUEST_UPLOAD_LIMIT = 15 * 1024 * 1024;
+// Attempts per chunk before giving up, each retry resumes from the server's offset
+const MAX_CHUNK_ATTEMPTS = 5;
+
+async function uploadInOneRequest(apiBaseUrl, file) {
+  const formData = new FormData();
+  formData.append('file', file);
+
+  const response = await fetch(`${apiBaseUrl}/upload`, {
+    method: 'POST',
+    body: formData
+  });
+  return response.json();
+}
+
+async function uploadInChunks(apiBaseUrl, file, onProgress) {
+  const createResponse = await fetch(`${apiBaseUrl}/uploads`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size })
+  });
+  const upload = await createResponse.json();
+  if (!upload.success) {
+    return upload;
+  }
+
+  const uploadUrl = `${apiBaseUrl}/uploads/${upload.upload_id}`;
+  let offset = upload.offset;
+  let attempts = 0;
+
+  while (offset < file.size) {
+    try {
+      const response = await fetch(uploadUrl, {
+        method: 'PATCH',
+        headers: {
+          'Content-Type': 'application/offset+octet-stream',
+          'Upload-Offset': String(offset)
+        },
+        body: file.slice(offset, offset + upload.chunk_size)
+      });
+      const data = await response.json();
+      if (response.status === 409 && data.busy) {
+        // An earlier attempt of this chunk is still being written, back off and resume
+        throw new Error(data.error);
+      }
+      if (response.ok || response.status === 409) {
+        // On 409 the server reports the offset it actually has
+        offset = data.offset;
+        attempts = 0;
+        onProgress(offset);
+        continue;
+      }
+      throw new Error(data.error || 'Chunk upload failed');
+    } catch (error) {
+      attempts += 1;
+      if (attempts >= MAX_CHUNK_ATTEMPTS) {
+        throw error;
+      }
+      // Resume from whatever the server kept of the interrupted chunk
+      await new Promise(resolve => setTimeout(resolve, 1000 * attempts));
+      const status = await (await fetch(uploadUrl)).json();
+      if (status.success) {
+        offset = status.offset;
+      }
+    }
+  }
+
+  const completeResponse = await fetch(`${uploadUrl}/complete`, { method: 'POST' });
+  return completeResponse.json();
+}
+
 function FileUpload({ onFileUploaded, apiBaseUrl, showLoading, hideLoading }) {
   const onDrop = useCallback(async (acceptedFiles) => {
     const file = acceptedFiles[0];
@@ -137,16 +209,12 @@ function FileUpload({ onFileUploaded, apiBaseUrl, showLoading, hideLoading }) {
 
     showLoading('Uploading file...');
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     try {
-      const response = await fetch(`${apiBaseUrl}/upload`, {
-        method: 'POST',
-        body: formData
-      });
-
-      const data = await response.json();
+      const data = file.size > SINGLE_REQUEST_UPLOAD_LIMIT
+        ? await uploadInChunks(apiBaseUrl, file, (offset) => {
+            showLoading(`Uploading file... ${Math.floor((offset / file.size) * 100)}%`);
+          })
+        : await uploadInOneRequest(apiBaseUrl, file);
 
       if (data.success) {
         onFileUploaded(data.file_id, data.filename);
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for batch watermarking
+"""
+
+import os
+import time
+import tempfile
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker, get_batch_pool, shutdown_process_pool
+from benchmark_watermarks import create_benchmark_pdf
+
+def make_batch(work_dir, num_items):
+    """Build batch items over small PDFs, with one corrupt input in the middle"""
+    items = []
+    for index in range(num_items):
+        input_file = os.path.join(work_dir, f"input_{index}.pdf")
+        if index == num_items // 2:
+            with open(input_file, 'wb') as corrupt_file:
+                corrupt_file.write(b"not a pdf")
+        else:
+            create_benchmark_pdf(input_file, 2)
+        items.append({
+            'id': f"item-{index}",
+            'input_path': input_file,
+            'output_path': os.path.join(work_dir, f"output_{index}.pdf"),
+            'watermarks': [{'text': f'BATCH {index}', 'target_pages': 'all'}]
+        })
+    return items
+
+def check_results(items, results):
+    assert sorted(result['id'] for result in results) == sorted(item['id'] for item in items)
+    for item, result in zip(items, sorted(results, key=lambda result: int(result['id'].split('-')[1]))):
+        if item['id'] == items[len(items) // 2]['id']:
+            assert not result['success'] and result['error']
+        else:
+            assert result['success']
+            assert f"BATCH {item['id'].split('-')[1]}" in PdfReader(item['output_path']).pages[1].extract_text()
+
+def test_serial_batch_reports_every_item():
+    """A corrupt file fails on its own while the rest of the batch is watermarked"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        items = make_batch(work_dir, 5)
+        results = list(PDFWatermarker(batch_workers=1).watermark_batch(items))
+        check_results(items, results)
+        print("✓ Serial batch watermarked 4 files and reported 1 failure")
+
+def test_pooled_batch_reports_every_item():
+    """Batch items run on the worker pool and stream back in completion order"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        items = make_batch(work_dir, 9)
+        try:
+            results = list(PDFWatermarker(batch_workers=2).watermark_batch(iter(items)))
+        finally:
+            shutdown_process_pool()
+        check_results(items, results)
+        print("✓ Pooled batch watermarked 8 files and reported 1 failure")
+
+def test_batch_items_run_concurrently():
+    """A small file finishes while a large file queued ahead of it is still being watermarked"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        items = []
+        for name, num_pages in (('large', 600), ('small', 1)):
+            items.append({
+                'id': name,
+                'input_path': create_benchmark_pdf(os.path.join(work_dir, f"{name}.pdf"), num_pages),
+                'output_path': os.path.join(work_dir, f"{name}_output.pdf"),
+                'watermarks': [{'text': 'CONCURRENT', 'rotation': 45, 'target_pages': 'all'}]
+            })
+        watermarker = PDFWatermarker(batch_workers=2)
+        assert PDFWatermarker().batch_workers >= 2
+        try:
+            # Start both workers before the batch so neither item waits for a process to spawn
+            list(get_batch_pool(2).map(time.sleep, [0.2, 0.2]))
+            results = list(watermarker.watermark_batch(items))
+        finally:
+            shutdown_process_pool()
+
+        assert [result['id'] for result in results] == ['small', 'large']
+        # Serially the small item would only start once the large one had finished
+        assert all(result['success'] for result in results)
+        print("✓ Small batch item completed before the large item submitted ahead of it")
+
+if __name__ == "__main__":
+    test_serial_batch_reports_every_item()
+    test_pooled_batch_reports_every_item()
+    test_batch_items_run_concurrently()
+    print("\n🎉 Batch tests completed successfully!")
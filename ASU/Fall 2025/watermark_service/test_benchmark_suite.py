@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script for the engine benchmark suite
+"""
+
+import os
+import copy
+import tempfile
+from PyPDF2 import PdfReader
+from benchmark_suite import CASES, corpus_document, run_case, compare_results, host_mismatch, RESULTS_VERSION
+
+def make_results(**overrides):
+    result = {'case': 'multiple', 'pages': 100, 'seconds': 1.0, 'peak_rss_bytes': 100 * 2**20, 'output_bytes': 50000}
+    result.update(overrides)
+    return {'version': RESULTS_VERSION, 'results': [result]}
+
+def test_compare_flags_regressions():
+    """Slowdowns, memory and output growth beyond the thresholds are regressions"""
+    baseline = make_results()
+    assert compare_results(baseline, make_results(seconds=1.2)) == []
+    assert compare_results(baseline, make_results(seconds=1.3))[0][0] == 'multiple/100'
+    assert len(compare_results(baseline, make_results(peak_rss_bytes=130 * 2**20, output_bytes=60000))) == 2
+    assert compare_results(baseline, make_results(seconds=1.3), {'max_slowdown': 0.5}) == []
+
+    # Small absolute changes are noise, cases missing from the baseline are not compared
+    tiny = make_results(seconds=0.01)
+    assert compare_results(tiny, make_results(seconds=0.03)) == []
+    assert compare_results(baseline, make_results(case='new_case', seconds=9.0)) == []
+
+    other_version = copy.deepcopy(baseline)
+    other_version['version'] = RESULTS_VERSION + 1
+    assert len(compare_results(other_version, make_results())) == 1
+    print("✓ Comparison flags regressions beyond the thresholds and ignores noise")
+
+def test_compare_skips_timings_from_another_host():
+    """Times and memory of a baseline from another machine are not compared, output sizes are"""
+    baseline = make_results()
+    baseline.update({'platform': 'Linux-x86_64', 'cpu_count': 1})
+    current = make_results(seconds=3.0, peak_rss_bytes=300 * 2**20)
+    current.update({'platform': 'Linux-x86_64', 'cpu_count': 8})
+
+    assert host_mismatch(baseline, current) == 'cpu_count 1 -> 8'
+    assert compare_results(baseline, current) == []
+    current['results'][0]['output_bytes'] = 60000
+    assert len(compare_results(baseline, current)) == 1
+
+    current['cpu_count'] = 1
+    assert host_mismatch(baseline, current) is None
+    assert len(compare_results(baseline, current)) == 3
+    print("✓ Timings of a baseline from another host are skipped")
+
+def test_cases_run_on_the_corpus():
+    """Every case runs on a small corpus and reports its time, memory and output size"""
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        mixed = corpus_document(corpus_dir, 'mixed', 5)
+        assert len({tuple(page.mediabox) for page in PdfReader(mixed).pages}) > 1
+        assert corpus_document(corpus_dir, 'mixed', 5) == mixed
+
+        for case in CASES:
+            result = run_case(case, corpus_document(corpus_dir, case['corpus'], 2), repeat=1)
+            assert result['seconds'] > 0 and result['peak_rss_bytes'] > 0
+            if case['entry_point'] != 'get_pdf_info':
+                assert result['output_bytes'] > 0, case['name']
+        assert sorted(os.listdir(corpus_dir)) == ['mixed_2.pdf', 'mixed_5.pdf', 'text_2.pdf', 'uniform_2.pdf']
+        print(f"✓ All {len(CASES)} benchmark cases run on the synthetic corpus")
+
+if __name__ == "__main__":
+    test_compare_flags_regressions()
+    test_compare_skips_timings_from_another_host()
+    test_cases_run_on_the_corpus()
+    print("\n🎉 Benchmark suite tests completed successfully!")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test script for resumable chunked uploads
+"""
+
+import io
+import os
+import hashlib
+import tempfile
+import eventlet
+from chunked_upload import ChunkedUploadStore, UploadOffsetError, UploadBusyError, UploadCapacityError
+from benchmark_watermarks import create_benchmark_pdf
+
+class DroppedConnection(io.BytesIO):
+    """Request body that stops after a number of bytes, like a dropped connection"""
+
+    def __init__(self, data, cutoff):
+        super().__init__(data[:cutoff])
+
+def test_upload_resumes_after_dropped_chunk():
+    """Only received bytes are confirmed, and the client resumes from that offset"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        data = open(create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 50), 'rb').read()
+        store = ChunkedUploadStore(os.path.join(work_dir, 'partial'))
+        upload = store.create('input.pdf', len(data))
+        upload_id = upload['upload_id']
+
+        # The file is preallocated at full size before any chunk arrives
+        assert os.path.getsize(store._data_path(upload_id)) == len(data)
+
+        chunk_size = len(data) // 3
+        store.write_chunk(upload_id, 0, io.BytesIO(data[:chunk_size]), chunk_size)
+        upload = store.write_chunk(
+            upload_id, chunk_size, DroppedConnection(data[chunk_size:], 100), chunk_size
+        )
+        assert upload['offset'] == chunk_size + 100
+
+        try:
+            store.write_chunk(upload_id, chunk_size, io.BytesIO(data[chunk_size:]), chunk_size)
+            assert False, "Stale offset accepted"
+        except UploadOffsetError as e:
+            assert e.offset == chunk_size + 100
+
+        # A new store object stands in for a restarted server
+        store = ChunkedUploadStore(os.path.join(work_dir, 'partial'))
+        offset = store.get(upload_id)['offset']
+        store.write_chunk(upload_id, offset, io.BytesIO(data[offset:]), len(data) - offset)
+
+        data_path, sha256, num_pages = store.finish(upload_id)
+        assert sha256 == hashlib.sha256(data).hexdigest()
+        assert num_pages == 50
+        with open(data_path, 'rb') as data_file:
+            assert data_file.read() == data
+
+        # The file now belongs to the caller, the upload itself is gone
+        assert store.get(upload_id) is None
+        try:
+            store.finish(upload_id)
+            assert False, "Upload finished twice"
+        except KeyError:
+            pass
+        assert os.listdir(store.upload_dir) == [os.path.basename(data_path)]
+        print("✓ Interrupted upload resumed and finished with the right content")
+
+def test_incomplete_or_invalid_uploads_are_rejected():
+    """finish() refuses missing bytes and files that are not PDFs"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ChunkedUploadStore(os.path.join(work_dir, 'partial'))
+        upload_id = store.create('fake.pdf', 20)['upload_id']
+
+        def finish_error():
+            try:
+                store.finish(upload_id)
+            except ValueError as e:
+                return str(e)
+            return None
+
+        store.write_chunk(upload_id, 0, io.BytesIO(b'x' * 10), 10)
+        assert 'incomplete' in finish_error()
+        store.write_chunk(upload_id, 10, io.BytesIO(b'x' * 10), 10)
+        assert 'not a PDF' in finish_error()
+
+        store.discard(upload_id)
+        assert os.listdir(store.upload_dir) == []
+        assert store.get('../' + upload_id) is None
+        print("✓ Incomplete and non-PDF uploads rejected")
+
+class SlowStream(io.BytesIO):
+    """Request body whose first read waits on the hub until released, like a slow client"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.release = eventlet.event.Event()
+
+    def read(self, size=-1):
+        self.release.wait()
+        return super().read(size)
+
+def test_concurrent_chunk_is_rejected_not_blocked():
+    """A retry that overtakes its own chunk gets UploadBusyError at once instead of waiting"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ChunkedUploadStore(os.path.join(work_dir, 'partial'))
+        upload_id = store.create('input.pdf', 20)['upload_id']
+
+        # Both requests are greenthreads of one hub, as in the server
+        slow = SlowStream(b'a' * 10)
+        writer = eventlet.spawn(store.write_chunk, upload_id, 0, slow, 10)
+        eventlet.sleep(0.05)
+        with eventlet.Timeout(2):
+            try:
+                store.write_chunk(upload_id, 0, io.BytesIO(b'b' * 10), 10)
+                assert False, "Concurrent chunk accepted"
+            except UploadBusyError:
+                pass
+        slow.release.send()
+        assert writer.wait()['offset'] == 10
+
+        # The first chunk landed, the upload continues normally
+        assert store.write_chunk(upload_id, 10, io.BytesIO(b'c' * 10), 10)['offset'] == 20
+        print("✓ Concurrent chunk for the same upload rejected without blocking")
+
+def test_finish_is_rejected_while_busy():
+    """finish() does not wait for a chunk in progress or another finish of the same upload"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        data = open(create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 5), 'rb').read()
+        store = ChunkedUploadStore(os.path.join(work_dir, 'partial'))
+        upload_id = store.create('input.pdf', len(data))['upload_id']
+
+        slow = SlowStream(data)
+        writer = eventlet.spawn(store.write_chunk, upload_id, 0, slow, len(data))
+        eventlet.sleep(0.05)
+        with eventlet.Timeout(2):
+            try:
+                store.finish(upload_id)
+                assert False, "Finished during a chunk"
+            except UploadBusyError:
+                pass
+        slow.release.send()
+        writer.wait()
+
+        # The first finish holds the upload while it validates in the engine pool
+        first = eventlet.spawn(store.finish, upload_id)
+        eventlet.sleep(0)
+        try:
+            store.finish(upload_id)
+            assert False, "Finished twice at once"
+        except UploadBusyError:
+            pass
+        data_path, sha256, _ = first.wait()
+        assert sha256 == hashlib.sha256(data).hexdigest() and os.path.exists(data_path)
+        print("✓ Finish rejected while a chunk or another finish is in progress")
+
+def test_preallocations_are_capped():
+    """Uploads in progress are limited in number and total preallocated bytes"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        upload_dir = os.path.join(work_dir, 'partial')
+        store = ChunkedUploadStore(upload_dir, max_pending_uploads=2, max_pending_bytes=1000)
+
+        def capacity_error(size):
+            try:
+                store.create('input.pdf', size)
+            except UploadCapacityError:
+                return True
+            return False
+
+        first = store.create('input.pdf', 600)['upload_id']
+        assert capacity_error(600)
+        store.create('input.pdf', 300)
+        assert capacity_error(10)
+
+        # Limits survive a restart, and discarding an upload frees its share
+        store = ChunkedUploadStore(upload_dir, max_pending_uploads=2, max_pending_bytes=1000)
+        assert capacity_error(10)
+        store.discard(first)
+        assert not capacity_error(600)
+
+        # Abandoned uploads are dropped when space is needed
+        stale = os.path.join(upload_dir, f"{first}.json")
+        for upload_id in list(store._reserved):
+            os.utime(store._state_path(upload_id), (0, 0))
+        assert not capacity_error(900)
+        assert len(os.listdir(upload_dir)) == 2 and not os.path.exists(stale)
+        print("✓ Preallocations capped by count and bytes, stale uploads reclaimed")
+
+if __name__ == "__main__":
+    test_upload_resumes_after_dropped_chunk()
+    test_incomplete_or_invalid_uploads_are_rejected()
+    test_concurrent_chunk_is_rejected_not_blocked()
+    test_finish_is_rejected_while_busy()
+    test_preallocations_are_capped()
+    print("\n🎉 Chunked upload tests completed successfully!")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed upload store
+"""
+
+import io
+import os
+import hashlib
+import tempfile
+from content_store import ContentStore
+
+PDF_BYTES = b"%PDF-1.4\n" + b"brochure " * 10000
+
+def stream_upload(store, handle_path, data, chunk_size=4096):
+    """Write data the way the request parser does, chunk by chunk"""
+    writer = store.new_writer()
+    for start in range(0, len(data), chunk_size):
+        writer.write(data[start:start + chunk_size])
+    writer.seek(0)
+    return store.commit(writer, handle_path)
+
+def test_duplicate_uploads_share_one_file():
+    """The same content uploaded twice is stored once, hashed while it streamed in"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ContentStore(os.path.join(work_dir, 'store'))
+        first = os.path.join(work_dir, 'first.pdf')
+        second = os.path.join(work_dir, 'second.pdf')
+
+        sha256, duplicate = stream_upload(store, first, PDF_BYTES)
+        assert sha256 == hashlib.sha256(PDF_BYTES).hexdigest() and not duplicate
+        assert stream_upload(store, second, PDF_BYTES) == (sha256, True)
+
+        assert os.path.samefile(first, second)
+        assert store.refcount(sha256) == 2
+        assert store.stats() == {'entries': 1, 'size_bytes': len(PDF_BYTES)}
+        # No temporary files left behind by the duplicate
+        assert os.listdir(store.store_dir) == [f"{sha256}.pdf"]
+        print("✓ Two uploads of the same content use one stored file")
+
+def test_stored_file_removed_with_last_handle():
+    """Releasing handles decrements the reference count, the last release frees the file"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ContentStore(os.path.join(work_dir, 'store'))
+        handles = [os.path.join(work_dir, f'{index}.pdf') for index in range(3)]
+        for handle in handles:
+            sha256, _ = store.store_file(io.BytesIO(PDF_BYTES), handle)
+
+        store.release_handle(sha256, handles[0])
+        store.release_handle(sha256, handles[1])
+        assert store.refcount(sha256) == 1
+        with open(handles[2], 'rb') as handle_file:
+            assert handle_file.read() == PDF_BYTES
+
+        store.release_handle(sha256, handles[2])
+        assert store.refcount(sha256) == 0
+        assert os.listdir(store.store_dir) == []
+        print("✓ Stored file removed when its last handle is released")
+
+def test_abandoned_upload_leaves_nothing():
+    """An upload that is never committed is deleted when the request closes it"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ContentStore(os.path.join(work_dir, 'store'))
+        writer = store.new_writer()
+        writer.write(PDF_BYTES)
+        writer.close()
+        assert os.listdir(store.store_dir) == []
+        print("✓ Abandoned upload removed")
+
+if __name__ == "__main__":
+    test_duplicate_uploads_share_one_file()
+    test_stored_file_removed_with_last_handle()
+    test_abandoned_upload_leaves_nothing()
+    print("\n🎉 Content store tests completed successfully!")
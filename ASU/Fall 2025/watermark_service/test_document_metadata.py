@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for document metadata recorded at upload
+"""
+
+import os
+import json
+import tempfile
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker
+from page_geometry import page_geometry
+from content_store import ContentStore
+from document_metadata import analyze_document, page_geometry_at, page_geometries, pdf_info
+from benchmark_watermarks import create_benchmark_pdf, create_mixed_geometry_pdf, quiet_file_descriptor_stdout
+
+def test_metadata_matches_page_tree():
+    """Every page's recorded geometry is the one read from the page tree"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_mixed_geometry_pdf(os.path.join(work_dir, "mixed.pdf"), 12)
+        reader = PdfReader(input_file)
+        metadata = json.loads(json.dumps(analyze_document(reader, input_file)))
+
+        expected = [page_geometry(page) for page in reader.pages]
+        assert page_geometries(metadata) == expected
+        assert [page_geometry_at(metadata, number) for number in range(1, 13)] == expected
+        assert page_geometry_at(metadata, 0) is None and page_geometry_at(metadata, 13) is None
+
+        info = pdf_info(metadata)
+        engine_info = PDFWatermarker().get_pdf_info(input_file)
+        assert info['num_pages'] == engine_info['num_pages'] and info['page_size'] == engine_info['page_size']
+        assert info['byte_size'] == os.path.getsize(input_file) and info['encrypted'] is False
+        print("✓ Recorded metadata matches the page tree")
+
+def test_uniform_document_is_one_run():
+    """Pages sharing a geometry are stored as a single run"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "uniform.pdf"), 500)
+        metadata = analyze_document(PdfReader(input_file), input_file)
+        assert metadata['page_runs'] == [[500, 0]] and len(metadata['geometries']) == 1
+        assert len(json.dumps(metadata)) < 300
+        print("✓ A uniform 500-page document is recorded in under 300 bytes")
+
+def test_engine_uses_recorded_geometries():
+    """Output planned from recorded geometries is the same as from the page tree"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_mixed_geometry_pdf(os.path.join(work_dir, "mixed.pdf"), 5)
+        metadata = analyze_document(PdfReader(input_file), input_file)
+        watermarks = [{'text': 'RECORDED', 'target_pages': 'all', 'position': 'top-left'}]
+        watermarker = PDFWatermarker()
+
+        with quiet_file_descriptor_stdout():
+            watermarker.add_multiple_watermarks(input_file, os.path.join(work_dir, "tree.pdf"), watermarks)
+            watermarker.add_multiple_watermarks(input_file, os.path.join(work_dir, "recorded.pdf"), watermarks,
+                                                page_geometries=page_geometries(metadata))
+
+        tree_pages = PdfReader(os.path.join(work_dir, "tree.pdf")).pages
+        recorded_pages = PdfReader(os.path.join(work_dir, "recorded.pdf")).pages
+        for tree_page, recorded_page in zip(tree_pages, recorded_pages):
+            assert 'RECORDED' in recorded_page.extract_text()
+            assert tree_page.extract_text() == recorded_page.extract_text()
+        print("✓ Engine plans overlays from recorded geometries")
+
+def test_metadata_removed_with_content():
+    """Metadata stays while a handle remains and goes with the stored content"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ContentStore(os.path.join(work_dir, 'store'))
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 2)
+        handles = [os.path.join(work_dir, 'first.pdf'), os.path.join(work_dir, 'second.pdf')]
+        for handle in handles:
+            with open(input_file, 'rb') as source:
+                sha256, _ = store.store_file(source, handle)
+
+        store.save_metadata(sha256, analyze_document(PdfReader(handles[0]), handles[0]))
+        store.release_handle(sha256, handles[0])
+        assert store.load_metadata(sha256)['num_pages'] == 2
+        store.release_handle(sha256, handles[1])
+        assert store.load_metadata(sha256) is None
+        print("✓ Metadata is removed with the last handle")
+
+if __name__ == "__main__":
+    test_metadata_matches_page_tree()
+    test_uniform_document_is_one_run()
+    test_engine_uses_recorded_geometries()
+    test_metadata_removed_with_content()
+    print("\n🎉 Document metadata tests completed successfully!")
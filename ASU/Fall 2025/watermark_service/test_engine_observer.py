@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for the engine observer spans
+"""
+
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from watermark_service import PDFWatermarker
+from engine_observer import EngineObserver, PrintObserver
+from benchmark_watermarks import create_benchmark_pdf
+
+class RecordingObserver(EngineObserver):
+    def __init__(self):
+        self.spans = []
+        self.messages = []
+
+    def on_span(self, name, seconds, **fields):
+        assert seconds >= 0
+        self.spans.append((name, fields))
+
+    def on_message(self, message):
+        self.messages.append(message)
+
+    def named(self, name):
+        return [fields for span_name, fields in self.spans if span_name == name]
+
+def test_spans_describe_the_job():
+    """Document, page, overlay, merge and write spans carry the job's sizes"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 6)
+        watermarks = [{'text': 'OBSERVED', 'target_pages': 'all'}, {'text': 'EXTRA', 'target_pages': [2, 3]}]
+
+        for output_mode in ('rewrite', 'incremental'):
+            observer = RecordingObserver()
+            output_file = os.path.join(work_dir, f"{output_mode}.pdf")
+            PDFWatermarker(workers=1, observer=observer).add_multiple_watermarks(
+                input_file, output_file, watermarks, output_mode=output_mode
+            )
+
+            document, = observer.named('document')
+            assert document['pages'] == 6 and document['watermarked_pages'] == 6
+            assert document['output_mode'] == output_mode and document['parallel'] is False
+            assert document['input_bytes'] == os.path.getsize(input_file)
+            assert document['output_bytes'] == os.path.getsize(output_file)
+
+            pages = observer.named('page')
+            assert [page['page'] for page in pages] == [1, 2, 3, 4, 5, 6]
+            assert [page['watermarks'] for page in pages] == [1, 2, 2, 1, 1, 1]
+
+            overlays = observer.named('overlay')
+            assert len(overlays) == 2 and all(overlay['bytes'] > 0 for overlay in overlays)
+            merge, = observer.named('merge')
+            assert merge['overlays'] == 2 and merge['watermarked_pages'] == 6
+            assert observer.named('write') == [{'bytes': os.path.getsize(output_file)}]
+            assert len(observer.named('layout')) == 3 and len(observer.named('parse')) == 1
+        print("✓ Spans report pages, overlays and sizes for rewrite and incremental output")
+
+def test_silent_without_observer():
+    """Library users without an observer get no output from the engine"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 20)
+        captured = io.StringIO()
+        with redirect_stdout(captured):
+            watermarker = PDFWatermarker(workers=1)
+            watermarker.add_multiple_watermarks(
+                input_file, os.path.join(work_dir, "output.pdf"),
+                [{'text': 'QUIET', 'target_pages': 'all', 'position': 'custom'}]
+            )
+            watermarker.add_diagonal_watermark(input_file, os.path.join(work_dir, "diagonal.pdf"), 'QUIET')
+        assert captured.getvalue() == ''
+
+        printed = io.StringIO()
+        PDFWatermarker(workers=1, observer=PrintObserver(printed, spans={'document'})).add_diagonal_watermark(
+            input_file, os.path.join(work_dir, "diagonal.pdf"), 'LOUD'
+        )
+        lines = printed.getvalue().splitlines()
+        assert len(lines) == 1 and lines[0].startswith('[document]') and 'operation=add_diagonal_watermark' in lines[0]
+        print("✓ Engine is silent without an observer and prints selected spans with one")
+
+if __name__ == "__main__":
+    test_spans_describe_the_job()
+    test_silent_without_observer()
+    print("\n🎉 Engine observer tests completed successfully!")
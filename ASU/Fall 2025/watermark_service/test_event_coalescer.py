@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for server-side coalescing of watermark update events
+"""
+
+import threading
+from event_coalescer import UpdateCoalescer
+
+def collect():
+    flushed = []
+    return flushed, lambda file_id, updates: flushed.append((file_id, updates))
+
+def test_flood_becomes_one_broadcast_per_session():
+    """A thousand position updates within a tick are flushed as one batch with the latest position"""
+    flushed, flush_updates = collect()
+    coalescer = UpdateCoalescer(flush_updates)
+
+    for step in range(1000):
+        coalescer.submit('doc', 'wm-1', 'client-a', step, position={'x': step, 'y': step})
+    coalescer.submit('doc', 'wm-2', 'client-a', None, properties={'color': '#ff0000'})
+    coalescer.submit('doc', 'wm-2', 'client-a', None, properties={'opacity': 0.3})
+    coalescer.submit('other', 'wm-1', 'client-b', 1, position='center')
+
+    assert coalescer.flush() == 2
+    assert flushed == [
+        ('doc', [
+            {'watermark_id': 'wm-1', 'position': {'x': 999, 'y': 999}, 'seq': 999},
+            {'watermark_id': 'wm-2', 'properties': {'color': '#ff0000', 'opacity': 0.3}}
+        ]),
+        ('other', [{'watermark_id': 'wm-1', 'position': 'center', 'seq': 1}])
+    ]
+
+    # Nothing pending, nothing broadcast
+    assert coalescer.flush() == 0
+    assert coalescer.stats()['broadcasts'] == 2
+    print("✓ 1,003 updates flushed as 2 broadcasts")
+
+def test_stale_updates_are_dropped():
+    """Updates arriving after a newer one from the same client are ignored"""
+    flushed, flush_updates = collect()
+    coalescer = UpdateCoalescer(flush_updates)
+
+    assert coalescer.submit('doc', 'wm-1', 'client-a', 5, position='top-left')
+    assert not coalescer.submit('doc', 'wm-1', 'client-a', 4, position='stale')
+    coalescer.flush()
+    assert not coalescer.submit('doc', 'wm-1', 'client-a', 5, position='stale')
+
+    # A late property change is kept, nothing newer replaced it
+    assert coalescer.submit('doc', 'wm-1', 'client-a', 3, properties={'color': '#00ff00'})
+    assert not coalescer.submit('doc', 'wm-1', 'client-a', 2, properties={'color': '#ff0000'})
+    coalescer.flush()
+
+    # Sequence numbers are per client
+    assert coalescer.submit('doc', 'wm-1', 'client-b', 1, position='bottom-right')
+    coalescer.forget_client('client-a')
+    assert coalescer.submit('doc', 'wm-1', 'client-a', 1, position='center')
+    coalescer.flush()
+
+    assert [updates[0].get('position') for _, updates in flushed] == ['top-left', None, 'center']
+    assert flushed[1][1][0]['properties'] == {'color': '#00ff00'}
+    assert coalescer.stats()['stale'] == 3
+    print("✓ Stale updates dropped by sequence number")
+
+def test_run_flushes_at_fixed_rate():
+    """The tick loop flushes pending updates until stopped"""
+    flushed, flush_updates = collect()
+    coalescer = UpdateCoalescer(flush_updates, rate=200)
+    stop_event = threading.Event()
+    ticker = threading.Thread(target=coalescer.run, args=(stop_event.wait, stop_event))
+    ticker.start()
+    try:
+        coalescer.submit('doc', 'wm-1', 'client-a', 1, position='center')
+        for _ in range(100):
+            if flushed:
+                break
+            threading.Event().wait(0.01)
+    finally:
+        stop_event.set()
+        ticker.join()
+
+    assert flushed == [('doc', [{'watermark_id': 'wm-1', 'position': 'center', 'seq': 1}])]
+    print("✓ Tick loop flushes pending updates")
+
+if __name__ == "__main__":
+    test_flood_becomes_one_broadcast_per_session()
+    test_stale_updates_are_dropped()
+    test_run_flushes_at_fixed_rate()
+    print("\n🎉 Event coalescing tests completed successfully!")
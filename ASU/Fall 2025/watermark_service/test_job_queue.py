@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test script for the watermark job queue and worker
+"""
+
+import os
+import time
+import tempfile
+import threading
+from PyPDF2 import PdfReader
+from job_queue import (create_job_queue, MemoryJobQueue, SQLiteJobQueue, JOB_DONE, JOB_FAILED, JOB_QUEUED,
+                       JOB_RUNNING, MAX_JOB_ATTEMPTS, WORKER_LOST_ERROR)
+from worker import run_worker, process_job
+from watermark_service import PDFWatermarker
+from benchmark_watermarks import create_benchmark_pdf
+
+def run_jobs(job_queue, work_dir):
+    """Enqueue one good and one broken job, run a worker until both finish"""
+    input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 2)
+    output_file = os.path.join(work_dir, "output.pdf")
+
+    good_id = job_queue.enqueue({
+        'input_path': input_file,
+        'output_path': output_file,
+        'watermarks': [{'text': 'QUEUED', 'target_pages': 'all'}]
+    })
+    broken_id = job_queue.enqueue({
+        'input_path': os.path.join(work_dir, "missing.pdf"),
+        'output_path': os.path.join(work_dir, "never.pdf"),
+        'watermarks': [{'text': 'QUEUED'}]
+    })
+    assert job_queue.get(good_id)['status'] == JOB_QUEUED
+
+    stop_event = threading.Event()
+    worker_thread = threading.Thread(target=run_worker, args=(job_queue, stop_event, 0.1))
+    worker_thread.start()
+    try:
+        for _ in range(100):
+            if job_queue.get(broken_id)['status'] in (JOB_DONE, JOB_FAILED):
+                break
+            stop_event.wait(0.1)
+    finally:
+        stop_event.set()
+        worker_thread.join()
+
+    good_job = job_queue.get(good_id)
+    assert good_job['status'] == JOB_DONE
+    assert good_job['result'] == {'output_path': output_file}
+    assert 'QUEUED' in PdfReader(output_file).pages[1].extract_text()
+
+    broken_job = job_queue.get(broken_id)
+    assert broken_job['status'] == JOB_FAILED and broken_job['error']
+
+def test_memory_queue_runs_jobs():
+    """The in-process broker hands jobs to worker threads"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        job_queue = create_job_queue('memory://')
+        assert isinstance(job_queue, MemoryJobQueue)
+        run_jobs(job_queue, work_dir)
+        print("✓ Memory queue completed one job and failed one job")
+
+def test_sqlite_queue_runs_jobs():
+    """The SQLite broker persists jobs for workers in other processes"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        job_queue = create_job_queue('sqlite:///' + os.path.join(work_dir, 'jobs.db'))
+        assert isinstance(job_queue, SQLiteJobQueue)
+        run_jobs(job_queue, work_dir)
+        print("✓ SQLite queue completed one job and failed one job")
+
+def test_sqlite_jobs_are_claimed_once():
+    """Concurrent consumers never receive the same job"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, 'jobs.db')
+        job_ids = {SQLiteJobQueue(db_path).enqueue({'index': index}) for index in range(40)}
+
+        claimed = []
+        def consume():
+            # Each consumer uses its own queue object, as separate worker processes would
+            consumer_queue = SQLiteJobQueue(db_path)
+            while True:
+                job = consumer_queue.dequeue(timeout=0)
+                if job is None:
+                    return
+                claimed.append(job['id'])
+
+        consumers = [threading.Thread(target=consume) for _ in range(4)]
+        for consumer in consumers:
+            consumer.start()
+        for consumer in consumers:
+            consumer.join()
+
+        assert sorted(claimed) == sorted(job_ids)
+        print("✓ 40 jobs claimed exactly once by 4 consumers")
+
+def check_leases(job_queue):
+    """Claimed jobs of stopped workers are requeued until MAX_JOB_ATTEMPTS, then failed"""
+    job_id = job_queue.enqueue({'index': 0}, dedupe_key='file:spec')
+    assert job_queue.find_pending('file:spec')['id'] == job_id
+    assert job_queue.find_pending('file:other') is None
+
+    # A live worker keeps its job with heartbeats
+    assert job_queue.dequeue(timeout=0)['id'] == job_id
+    time.sleep(0.3)
+    job_queue.heartbeat(job_id)
+    time.sleep(0.3)
+    assert job_queue.find_pending('file:spec')['status'] == JOB_RUNNING
+    assert job_queue.dequeue(timeout=0) is None
+
+    # A stopped worker's job is no longer joined, and goes back to the queue
+    for attempt in range(2, MAX_JOB_ATTEMPTS + 1):
+        time.sleep(0.6)
+        assert job_queue.find_pending('file:spec') is None
+        job = job_queue.dequeue(timeout=0)
+        assert job['id'] == job_id and job['attempts'] == attempt
+
+    time.sleep(0.6)
+    assert job_queue.dequeue(timeout=0) is None
+    failed_job = job_queue.get(job_id)
+    assert failed_job['status'] == JOB_FAILED and failed_job['error'] == WORKER_LOST_ERROR
+
+    # Finished jobs are no longer pending
+    done_id = job_queue.enqueue({'index': 1}, dedupe_key='file:spec')
+    assert job_queue.find_pending('file:spec')['id'] == done_id
+    job_queue.complete(job_queue.dequeue(timeout=0)['id'], {'output_path': 'out.pdf'})
+    assert job_queue.find_pending('file:spec') is None
+
+def test_memory_queue_leases():
+    """The in-process broker requeues jobs whose lease ran out"""
+    job_queue = MemoryJobQueue(lease_seconds=0.5)
+    check_leases(job_queue)
+    # Finished jobs do not stay in the dedupe index
+    assert job_queue._pending == {}
+    print("✓ Memory queue requeues expired jobs and fails them after the last attempt")
+
+def test_sqlite_queue_leases():
+    """The SQLite broker requeues jobs whose lease ran out"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        check_leases(SQLiteJobQueue(os.path.join(work_dir, 'jobs.db'), lease_seconds=0.5))
+        print("✓ SQLite queue requeues expired jobs and fails them after the last attempt")
+
+def test_job_output_is_replaced_atomically():
+    """A job moves a complete file into place, and a failed job leaves the previous output alone"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 2)
+        output_file = os.path.join(work_dir, "output.pdf")
+        watermarker = PDFWatermarker(workers=1)
+
+        def job(text, input_path=input_file):
+            return {'payload': {'input_path': input_path, 'output_path': output_file,
+                                'watermarks': [{'text': text, 'target_pages': 'all'}]}}
+
+        process_job(watermarker, job('FIRST'))
+        with open(output_file, 'rb') as reader:
+            # A download in progress keeps reading the file it opened
+            process_job(watermarker, job('SECOND'))
+            assert 'FIRST' in PdfReader(reader).pages[1].extract_text()
+        assert 'SECOND' in PdfReader(output_file).pages[1].extract_text()
+
+        try:
+            process_job(watermarker, job('BROKEN', os.path.join(work_dir, "missing.pdf")))
+        except Exception:
+            pass
+        else:
+            raise AssertionError("Expected the job to fail")
+        assert 'SECOND' in PdfReader(output_file).pages[1].extract_text()
+        assert sorted(os.listdir(work_dir)) == ['input.pdf', 'output.pdf']
+        print("✓ Job outputs are replaced atomically and failed jobs leave no files")
+
+if __name__ == "__main__":
+    test_memory_queue_runs_jobs()
+    test_sqlite_queue_runs_jobs()
+    test_sqlite_jobs_are_claimed_once()
+    test_memory_queue_leases()
+    test_sqlite_queue_leases()
+    test_job_output_is_replaced_atomically()
+    print("\n🎉 Job queue tests completed successfully!")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the Prometheus metrics
+"""
+
+import os
+import tempfile
+from watermark_service import PDFWatermarker
+from engine_observer import StageTimerObserver
+from metrics import MetricsRegistry, directory_size
+from benchmark_watermarks import create_benchmark_pdf, quiet_file_descriptor_stdout
+
+def test_text_exposition_format():
+    """Counters, gauges and histograms render in the Prometheus text format"""
+    registry = MetricsRegistry()
+    events = registry.counter('events_total', 'Events received', ['event'])
+    latency = registry.histogram('stage_seconds', 'Stage latency', ['stage'], buckets=(0.1, 1))
+    registry.gauge('sessions', 'Open sessions', collect=lambda: 3)
+
+    events.inc(event='connect')
+    events.inc(2, event='say "hi"')
+    for seconds in (0.05, 0.5, 5):
+        latency.observe(seconds, stage='merge')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE events_total counter' in lines
+    assert 'events_total{event="connect"} 1' in lines
+    assert 'events_total{event="say \\"hi\\""} 2' in lines
+    assert 'stage_seconds_bucket{stage="merge",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="merge",le="1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="merge",le="+Inf"} 3' in lines
+    assert 'stage_seconds_sum{stage="merge"} 5.55' in lines
+    assert 'stage_seconds_count{stage="merge"} 3' in lines
+    assert 'sessions 3' in lines
+
+    try:
+        events.inc(stage='merge')
+    except ValueError:
+        print("✓ Metrics render in the Prometheus text format")
+        return
+    raise AssertionError("Expected ValueError for unknown labels")
+
+def test_engine_reports_stages():
+    """A watermark job reports each stage to a stage timer observer"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 4)
+        stages = []
+        observer = StageTimerObserver(lambda stage, seconds: stages.append(stage))
+        with quiet_file_descriptor_stdout():
+            PDFWatermarker(workers=1, observer=observer).add_multiple_watermarks(
+                input_file, os.path.join(work_dir, "output.pdf"),
+                [{'text': 'TIMED', 'target_pages': 'all'}, {'text': 'SECOND', 'target_pages': [2]}]
+            )
+
+        # Two overlays (pages with one and with both watermarks), three layouts, one merge pass
+        assert stages.count('parse') == 1 and stages.count('overlay_render') == 2
+        assert stages.count('layout') == 3 and stages.count('merge') == 1 and stages.count('write') == 1
+        print("✓ Engine reports parse, layout, overlay render, merge and write times")
+
+def test_directory_size_counts_hard_links_once():
+    """Content store handles are hard links, their bytes are counted once"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, 'store'))
+        blob = os.path.join(work_dir, 'store', 'blob.pdf')
+        with open(blob, 'wb') as f:
+            f.write(b'x' * 1000)
+        os.link(blob, os.path.join(work_dir, 'handle.pdf'))
+        with open(os.path.join(work_dir, 'other.pdf'), 'wb') as f:
+            f.write(b'y' * 10)
+        assert directory_size(work_dir) == 1010
+        assert directory_size(os.path.join(work_dir, 'missing')) == 0
+        print("✓ Disk usage counts hard-linked uploads once")
+
+if __name__ == "__main__":
+    test_text_exposition_format()
+    test_engine_reports_stages()
+    test_directory_size_counts_hard_links_once()
+    print("\n🎉 Metrics tests completed successfully!")
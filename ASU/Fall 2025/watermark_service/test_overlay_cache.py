@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for overlay caching in multi-page watermarking
+"""
+
+import os
+import tempfile
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker
+from page_geometry import geometry_from_size
+from benchmark_watermarks import (
+    create_benchmark_pdf,
+    create_mixed_geometry_pdf,
+    run_watermark_job,
+    MIXED_PAGE_GEOMETRIES
+)
+
+def test_overlay_rendered_once_for_all_pages():
+    """A watermark targeting every page is rendered once and applied everywhere"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 5)
+        output_file = os.path.join(work_dir, "output.pdf")
+
+        watermarks = [{'text': 'CONFIDENTIAL', 'position': 'center', 'target_pages': 'all'}]
+        _, renders = run_watermark_job(input_file, output_file, watermarks)
+
+        assert renders == 1
+        reader = PdfReader(output_file)
+        assert len(reader.pages) == 5
+        for page in reader.pages:
+            assert 'CONFIDENTIAL' in page.extract_text()
+        print("✓ One overlay rendered for 5 watermarked pages")
+
+def test_distinct_watermark_sets_get_distinct_overlays():
+    """Pages with different watermark sets get their own overlay"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 4)
+        output_file = os.path.join(work_dir, "output.pdf")
+
+        watermarks = [
+            {'text': 'DRAFT', 'position': 'top-center', 'target_pages': 'all'},
+            {'text': 'PAGE ONE', 'position': 'bottom-center', 'target_pages': [1]}
+        ]
+        _, renders = run_watermark_job(input_file, output_file, watermarks)
+
+        assert renders == 2
+        reader = PdfReader(output_file)
+        assert 'PAGE ONE' in reader.pages[0].extract_text()
+        assert 'PAGE ONE' not in reader.pages[1].extract_text()
+        print("✓ Two overlays rendered for two distinct watermark sets")
+
+def test_overlay_key_ignores_non_render_fields():
+    """Watermark ids and page targets do not split the overlay cache"""
+    watermarker = PDFWatermarker()
+    first = {'id': 'watermark-1', 'text': 'DRAFT', 'target_pages': [1]}
+    second = {'id': 'watermark-2', 'text': 'DRAFT', 'font_size': 24, 'target_pages': 'all'}
+    letter_page = geometry_from_size(612, 792)
+    a4_page = geometry_from_size(595, 842)
+
+    assert watermarker._overlay_key([first], letter_page) == watermarker._overlay_key([second], letter_page)
+    assert watermarker._overlay_key([first], letter_page) != watermarker._overlay_key([first], a4_page)
+    print("✓ Overlay key depends only on render fields and page geometry")
+
+def test_mixed_geometries_render_one_overlay_per_geometry():
+    """Pages of different sizes and rotations each get an overlay built for their geometry"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        num_pages = 3 * len(MIXED_PAGE_GEOMETRIES)
+        input_file = create_mixed_geometry_pdf(os.path.join(work_dir, "input.pdf"), num_pages)
+        output_file = os.path.join(work_dir, "output.pdf")
+
+        watermarks = [{'text': 'CONFIDENTIAL', 'position': 'bottom-right', 'target_pages': 'all'}]
+        _, renders = run_watermark_job(input_file, output_file, watermarks)
+
+        assert renders == len(MIXED_PAGE_GEOMETRIES)
+        reader = PdfReader(output_file)
+        for page in reader.pages:
+            assert 'CONFIDENTIAL' in page.extract_text()
+        print(f"✓ {renders} overlays rendered for {num_pages} pages with mixed geometries")
+
+def test_single_watermark_overlay_in_memory():
+    """create_watermark_pdf still renders one watermark into an in-memory overlay"""
+    overlay = PDFWatermarker().create_watermark_pdf(
+        'DRAFT', 'center', 48, '#FF0000', 0.3, 45, 612, 792
+    )
+    page = PdfReader(overlay).pages[0]
+    assert (float(page.mediabox.width), float(page.mediabox.height)) == (612, 792)
+    assert 'DRAFT' in page.extract_text()
+    print("✓ Single watermark overlay rendered into memory")
+
+if __name__ == "__main__":
+    test_overlay_rendered_once_for_all_pages()
+    test_distinct_watermark_sets_get_distinct_overlays()
+    test_overlay_key_ignores_non_render_fields()
+    test_mixed_geometries_render_one_overlay_per_geometry()
+    test_single_watermark_overlay_in_memory()
+    print("\n🎉 Overlay cache tests completed successfully!")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script for page geometry handling of watermark overlays
+"""
+
+import os
+import tempfile
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker
+from page_geometry import PageGeometry, page_geometry, display_size, display_transform
+from benchmark_watermarks import create_mixed_geometry_pdf, MIXED_PAGE_GEOMETRIES
+
+def apply_matrix(matrix, x, y):
+    a, b, c, d, e, f = matrix
+    return (a * x + c * y + e, b * x + d * y + f)
+
+def test_display_transform_covers_cropbox():
+    """The displayed page maps exactly onto the cropbox for every rotation"""
+    cropbox = (10.0, 20.0, 622.0, 812.0)
+
+    for rotation in (0, 90, 180, 270):
+        geometry = PageGeometry(mediabox=(0.0, 0.0, 640.0, 830.0), cropbox=cropbox, rotation=rotation)
+        width, height = display_size(geometry)
+        matrix = display_transform(geometry)
+
+        corners = {apply_matrix(matrix, x, y) for x in (0, width) for y in (0, height)}
+        assert corners == {(x, y) for x in (cropbox[0], cropbox[2]) for y in (cropbox[1], cropbox[3])}
+
+    print("✓ Displayed page maps onto the cropbox for all rotations")
+
+def test_rotated_page_top_left_maps_to_viewed_top_left():
+    """On a page rotated 90 degrees clockwise, the viewed top-left is the unrotated bottom-left"""
+    geometry = PageGeometry(mediabox=(0.0, 0.0, 612.0, 792.0), cropbox=(0.0, 0.0, 612.0, 792.0), rotation=90)
+    width, height = display_size(geometry)
+
+    assert (width, height) == (792.0, 612.0)
+    assert apply_matrix(display_transform(geometry), 0, height) == (0.0, 0.0)
+    print("✓ Rotated pages are laid out as viewed")
+
+def test_preset_positions_scale_with_page_size():
+    """Preset positions keep their letter coordinates and scale to other page sizes"""
+    watermarker = PDFWatermarker()
+
+    assert watermarker.resolve_preset_position('bottom-right', 612, 792) == (550, 50)
+    x, y = watermarker.resolve_preset_position('top-right', 1224, 1584)
+    assert (x, y) == (1100, 1500)
+    print("✓ Preset positions follow the page size")
+
+def test_page_geometry_reads_size_and_rotation():
+    """Geometry is read from each page of a mixed document"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_mixed_geometry_pdf(os.path.join(work_dir, "input.pdf"), len(MIXED_PAGE_GEOMETRIES))
+        reader = PdfReader(input_file)
+
+        geometries = set()
+        for page, (pagesize, rotation) in zip(reader.pages, MIXED_PAGE_GEOMETRIES):
+            geometry = page_geometry(page)
+            assert geometry.mediabox == (0.0, 0.0, float(page.mediabox.width), float(page.mediabox.height))
+            assert geometry.cropbox == geometry.mediabox
+            assert geometry.rotation == rotation
+            geometries.add(geometry)
+
+        assert len(geometries) == len(MIXED_PAGE_GEOMETRIES)
+
+    print("✓ Page geometry read for every page size and rotation")
+
+if __name__ == "__main__":
+    test_display_transform_covers_cropbox()
+    test_rotated_page_top_left_maps_to_viewed_top_left()
+    test_preset_positions_scale_with_page_size()
+    test_page_geometry_reads_size_and_rotation()
+    print("\n🎉 Page geometry tests completed successfully!")
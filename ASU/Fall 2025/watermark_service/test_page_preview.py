@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for single-page previews from cached documents
+"""
+
+import io
+import os
+import tempfile
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker
+from document_cache import DocumentCache, PAGE_OVERHEAD_BYTES
+from worker import process_job
+from benchmark_watermarks import create_benchmark_pdf
+
+def test_preview_contains_only_requested_page():
+    """A preview is one page, carrying only the watermarks that target it"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 6)
+        reader = PdfReader(input_file)
+        watermarks = [
+            {'text': 'EVERY PAGE', 'target_pages': 'all'},
+            {'text': 'PAGE FOUR', 'target_pages': [4]}
+        ]
+        watermarker = PDFWatermarker()
+
+        page_four = PdfReader(io.BytesIO(watermarker.render_page_preview(reader, 4, watermarks))).pages
+        page_five = PdfReader(io.BytesIO(watermarker.render_page_preview(reader, 5, watermarks))).pages
+
+        assert len(page_four) == 1 and len(page_five) == 1
+        assert 'PAGE FOUR' in page_four[0].extract_text() and 'EVERY PAGE' in page_four[0].extract_text()
+        assert 'PAGE FOUR' not in page_five[0].extract_text()
+        # The source reader is left as it was, so it can stay cached
+        assert 'EVERY PAGE' not in reader.pages[3].extract_text()
+        print("✓ Preview holds one page with its own watermarks")
+
+def test_document_cache_reuses_and_invalidates():
+    """Parsed documents are reused until the file changes or is invalidated"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        cache = DocumentCache(max_documents=1)
+
+        first = cache.get(input_file)
+        assert cache.get(input_file) is first
+
+        cache.invalidate(input_file)
+        second = cache.get(input_file)
+        assert second is not first
+
+        other_file = create_benchmark_pdf(os.path.join(work_dir, "other.pdf"), 2)
+        cache.get(other_file)
+        stats = cache.stats()
+        assert (stats['documents'], stats['hits'], stats['misses']) == (1, 1, 3)
+        print("✓ Document cache reuses readers, evicts and invalidates")
+
+def test_document_cache_is_bounded_by_memory():
+    """Documents keyed by file id and hash are evicted once their estimated size exceeds the limit"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 20)
+        document_size = os.path.getsize(input_file) + 20 * PAGE_OVERHEAD_BYTES
+        cache = DocumentCache(max_bytes=document_size * 2)
+
+        first = cache.get(input_file, ('file-a', 'hash'))
+        cache.get(input_file, ('file-b', 'hash'))
+        assert cache.get(input_file, ('file-a', 'hash')) is first
+        assert cache.stats()['size_bytes'] == document_size * 2
+
+        # A third document pushes out the least recently used one, file-b
+        cache.get(input_file, ('file-c', 'hash'))
+        assert cache.stats()['documents'] == 2
+        assert cache.get(input_file, ('file-a', 'hash')) is first
+
+        # Cleanup drops a session's document by its file id
+        cache.invalidate('file-a')
+        assert cache.get(input_file, ('file-a', 'hash')) is not first
+        print("✓ Document cache evicts by estimated memory and invalidates by file id")
+
+def test_jobs_stamp_cached_document_without_changing_it():
+    """Watermark jobs reuse the cached reader, which previews can still use afterwards"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        cache = DocumentCache()
+        watermarker = PDFWatermarker()
+
+        for text in ('FIRST JOB', 'SECOND JOB'):
+            output_file = os.path.join(work_dir, f"{text}.pdf")
+            job = {'payload': {
+                'input_path': input_file,
+                'output_path': output_file,
+                'watermarks': [{'text': text, 'target_pages': 'all'}],
+                'document_key': ['file-a', 'hash']
+            }}
+            process_job(watermarker, job, document_cache=cache)
+            output_text = PdfReader(output_file).pages[2].extract_text()
+            assert text in output_text and 'FIRST JOB' not in output_text.replace(text, '')
+
+        reader = cache.get(input_file, ('file-a', 'hash')).reader
+        assert 'JOB' not in reader.pages[2].extract_text()
+        assert cache.stats()['misses'] == 1
+        print("✓ Watermark jobs stamp the cached document without changing it")
+
+def test_preview_endpoint_rejects_bad_pages():
+    """/preview answers 400, not 500, for a page that is not a number or not in the document"""
+    import app
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        file_id = 'preview-pages-test'
+        app.upload_index.add(file_id, input_file)
+        try:
+            client = app.app.test_client()
+            for page in ('abc', '1.5', '0', '4', '-1'):
+                response = client.get(f'/preview/{file_id}', query_string={'page': page})
+                assert response.status_code == 400 and response.get_json()['error'], page
+
+            response = client.get(f'/preview/{file_id}', query_string={'page': '3'})
+            assert response.status_code == 200
+            assert len(PdfReader(io.BytesIO(response.data)).pages) == 1
+        finally:
+            app.document_cache.invalidate(input_file)
+            app.upload_index.remove(file_id)
+        print("✓ Preview endpoint rejects malformed and out-of-range pages with 400")
+
+if __name__ == "__main__":
+    test_preview_contains_only_requested_page()
+    test_document_cache_reuses_and_invalidates()
+    test_document_cache_is_bounded_by_memory()
+    test_jobs_stamp_cached_document_without_changing_it()
+    test_preview_endpoint_rejects_bad_pages()
+    print("\n🎉 Page preview tests completed successfully!")
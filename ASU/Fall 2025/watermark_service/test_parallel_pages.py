@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script for page-parallel watermarking of large documents
+"""
+
+import os
+import tempfile
+from PyPDF2 import PdfReader
+from watermark_service import PDFWatermarker, shutdown_process_pool
+from benchmark_watermarks import create_benchmark_pdf
+
+WATERMARKS = [
+    {'text': 'CONFIDENTIAL', 'position': 'center', 'target_pages': 'all'},
+    {'text': 'FIRST PAGE', 'position': 'top-center', 'target_pages': [1]},
+    {'text': 'LAST PAGE', 'position': 'bottom-center', 'target_pages': [9]}
+]
+
+def page_texts(pdf_path):
+    return [page.extract_text() for page in PdfReader(pdf_path).pages]
+
+def test_parallel_output_matches_serial():
+    """Chunks stamped in worker processes are stitched back in page order"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 9)
+        serial_file = os.path.join(work_dir, "serial.pdf")
+        parallel_file = os.path.join(work_dir, "parallel.pdf")
+
+        try:
+            for stamp_mode in ('merge', 'xobject'):
+                PDFWatermarker(workers=1).add_multiple_watermarks(
+                    input_file, serial_file, WATERMARKS, stamp_mode=stamp_mode
+                )
+                PDFWatermarker(workers=2, parallel_min_pages=1).add_multiple_watermarks(
+                    input_file, parallel_file, WATERMARKS, stamp_mode=stamp_mode
+                )
+                assert page_texts(parallel_file) == page_texts(serial_file)
+                print(f"✓ Parallel {stamp_mode} output matches the serial output page by page")
+        finally:
+            shutdown_process_pool()
+
+def test_small_documents_stay_serial():
+    """Documents below the page threshold never start worker processes"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        reader = PdfReader(input_file)
+        assert not PDFWatermarker(workers=4, parallel_min_pages=200)._use_parallel(reader)
+        assert not PDFWatermarker(workers=1, parallel_min_pages=1)._use_parallel(reader)
+        assert PDFWatermarker(workers=4, parallel_min_pages=3)._use_parallel(reader)
+    print("✓ Small documents and single-worker engines use the serial path")
+
+if __name__ == "__main__":
+    test_parallel_output_matches_serial()
+    test_small_documents_stay_serial()
+    print("\n🎉 Parallel page tests completed successfully!")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script for raster tiles of the watermark layer
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import tempfile
+import importlib.util
+from PIL import Image
+from watermark_service import PDFWatermarker
+from page_geometry import geometry_from_size
+from raster_tiles import WatermarkRasterizer, TileCache, tile_grid, TILE_SIZE, EMPTY_TILE_PNG
+from content_store import ContentStore
+from benchmark_watermarks import create_benchmark_pdf
+
+def alpha_at(png, x, y):
+    return Image.open(io.BytesIO(png)).convert('RGBA').getpixel((x, y))[3]
+
+def test_tile_draws_where_layout_places_text():
+    """Text lands on the tile holding the laid out baseline, other tiles stay transparent"""
+    watermarker = PDFWatermarker()
+    rasterizer = WatermarkRasterizer(watermarker)
+    geometry = geometry_from_size(612, 792)
+    watermarks = [{'text': 'MMMM', 'position': '100,500', 'font_size': 60, 'opacity': 1.0, 'color': '#0000ff'}]
+
+    assert tile_grid(geometry, 1.0) == (3, 4)
+
+    # Baseline starts at (100, 500) in PDF space, 292 pixels from the top at zoom 1: tile (0, 1)
+    tile = rasterizer.render_tile(watermarks, geometry, 1.0, 0, 1)
+    image = Image.open(io.BytesIO(tile))
+    assert image.size == (TILE_SIZE, TILE_SIZE)
+    left, top, right, bottom = image.getbbox()
+    assert 95 <= left <= 110 and 34 <= bottom <= 40
+    assert alpha_at(tile, left + 10, bottom - 10) > 0
+
+    # Nothing reaches the bottom of the page
+    assert rasterizer.render_tile(watermarks, geometry, 1.0, 0, 3) == EMPTY_TILE_PNG
+    print("✓ Tiles draw text where the layout places it")
+
+def test_tile_cache_serves_repeats_quickly():
+    """A repeated tile comes from the cache in well under 5 ms"""
+    rasterizer = WatermarkRasterizer(PDFWatermarker())
+    geometry = geometry_from_size(612, 792)
+    watermarks = [{'text': 'CONFIDENTIAL', 'position': 'center', 'rotation': 45, 'font_size': 48}]
+    cache = TileCache(max_bytes=10 * 1024 * 1024)
+    key = (rasterizer.watermarker._overlay_key(watermarks, geometry), 1.0, 1, 1)
+
+    start_time = time.perf_counter()
+    png = cache.get(key)
+    if png is None:
+        png = rasterizer.render_tile(watermarks, geometry, 1.0, 1, 1)
+        cache.put(key, png)
+    first_ms = (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    assert cache.get(key) == png
+    cached_ms = (time.perf_counter() - start_time) * 1000
+
+    assert cached_ms < 5
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    print(f"✓ Tile drawn in {first_ms:.2f} ms, served from cache in {cached_ms:.3f} ms")
+
+def test_tile_cache_evicts_by_size():
+    """The cache drops least recently used tiles beyond its byte budget"""
+    cache = TileCache(max_bytes=250)
+    cache.put('a', b'x' * 100)
+    cache.put('b', b'x' * 100)
+    cache.get('a')
+    cache.put('c', b'x' * 100)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['size_bytes'] == 200
+    print("✓ Tile cache evicts least recently used tiles")
+
+def test_tile_endpoint_answers_repeats_from_the_cache():
+    """A repeated tile request is served without the engine pool or the upload's metadata"""
+    # backend/app.py, which the legacy app.py next to this file would shadow on import
+    spec = importlib.util.spec_from_file_location(
+        'backend_app', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'app.py')
+    )
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_id = str(uuid.uuid4())
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        app.create_session(file_id, 'input.pdf', input_file, uuid.uuid4().hex)
+
+        calls = []
+        run_engine, content_store = app.run_engine, app.content_store
+        app.run_engine = lambda function, *args: calls.append(function.__name__) or run_engine(function, *args)
+        app.content_store = ContentStore(os.path.join(work_dir, 'store'))
+        try:
+            client = app.app.test_client()
+            watermarks = json.dumps([{'text': 'TILED', 'position': 'center', 'rotation': 45, 'target_pages': 'all'}])
+            url = f'/api/tiles/{file_id}/2/1.0/1/1.png'
+
+            first = client.get(url, query_string={'watermarks': watermarks})
+            assert first.status_code == 200 and calls == ['recorded_page_geometry', 'render_tile']
+
+            calls.clear()
+            load_metadata = app.content_store.load_metadata
+            app.content_store.load_metadata = lambda sha256: calls.append('load_metadata') or load_metadata(sha256)
+            repeat = client.get(url, query_string={'watermarks': watermarks})
+            assert repeat.status_code == 200 and repeat.data == first.data
+            assert calls == []
+
+            # Another page with the same geometry shares the tile, after looking up its geometry
+            other_page = client.get(f'/api/tiles/{file_id}/3/1.0/1/1.png', query_string={'watermarks': watermarks})
+            assert other_page.data == first.data and calls == ['recorded_page_geometry', 'load_metadata']
+        finally:
+            app.run_engine, app.content_store = run_engine, content_store
+            del app.active_sessions[file_id]
+        print("✓ Tile endpoint answers repeated requests without the engine pool")
+
+if __name__ == "__main__":
+    test_tile_draws_where_layout_places_text()
+    test_tile_cache_serves_repeats_quickly()
+    test_tile_cache_evicts_by_size()
+    test_tile_endpoint_answers_repeats_from_the_cache()
+    print("\n🎉 Raster tile tests completed successfully!")
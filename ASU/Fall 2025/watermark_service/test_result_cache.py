@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed result cache
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from unittest import mock
+from PyPDF2 import PdfReader
+import result_cache as result_cache_module
+from result_cache import ResultCache, result_key, copy_atomic
+from worker import process_job
+from watermark_service import PDFWatermarker
+from benchmark_watermarks import create_benchmark_pdf, quiet_file_descriptor_stdout
+
+def write_file(path, size):
+    with open(path, 'wb') as output_file:
+        output_file.write(b'x' * size)
+    return path
+
+def test_result_key_canonicalizes_spec():
+    """Ids, key order and spelled-out defaults do not change the key, content does"""
+    digest = 'a' * 64
+    base = result_key(digest, [{'id': 'one', 'text': 'DRAFT'}])
+
+    assert result_key(digest, [{'text': 'DRAFT', 'font_size': 24, 'id': 'two', 'target_pages': [1]}]) == base
+    assert result_key(digest, [{'text': 'FINAL'}]) != base
+    assert result_key('b' * 64, [{'text': 'DRAFT'}]) != base
+    assert result_key(digest, [{'text': 'DRAFT'}], stamp_mode='xobject') != base
+
+    with mock.patch.object(result_cache_module, 'ENGINE_VERSION', 'next'):
+        assert result_key(digest, [{'text': 'DRAFT'}]) != base
+    print("✓ Result keys depend on input, spec and engine version only")
+
+def test_hits_misses_and_bytes_saved():
+    """Lookups are counted so the cache can be sized"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = ResultCache(os.path.join(work_dir, 'cache'), max_bytes=10_000)
+        output_file = write_file(os.path.join(work_dir, 'output.pdf'), 1000)
+
+        assert cache.get('key') is None
+        cache.put('key', output_file)
+        cached_path = cache.get('key')
+        assert cached_path is not None and os.path.getsize(cached_path) == 1000
+        cache.get('key')
+
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (2, 1)
+        assert stats['bytes_saved'] == 2000
+        assert abs(stats['hit_ratio'] - 2 / 3) < 1e-9
+        assert (stats['entries'], stats['size_bytes']) == (1, 1000)
+        print("✓ Hit ratio and bytes saved are reported")
+
+def test_least_recently_used_entries_are_evicted():
+    """The cache stays under max_bytes by dropping the entries used longest ago"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = ResultCache(os.path.join(work_dir, 'cache'), max_bytes=2500)
+        for index in range(2):
+            cache.put(f'key-{index}', write_file(os.path.join(work_dir, f'{index}.pdf'), 1000))
+            # Entries are ordered by mtime, keep them apart on coarse clocks
+            past = time.time() - 100 + index
+            os.utime(cache._entry_path(f'key-{index}'), (past, past))
+
+        # Using key-0 makes key-1 the least recently used entry
+        assert cache.get('key-0') is not None
+        cache.put('key-2', write_file(os.path.join(work_dir, '2.pdf'), 1000))
+
+        assert cache.get('key-1') is None
+        assert cache.get('key-0') is not None and cache.get('key-2') is not None
+        assert cache.stats()['size_bytes'] <= 2500
+        print("✓ Least recently used entry evicted to stay within max_bytes")
+
+def test_entries_survive_later_jobs_on_the_same_output():
+    """Jobs for one file_id rewrite its output path, cached results of earlier specs are unchanged"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = ResultCache(os.path.join(work_dir, 'cache'))
+        input_file = create_benchmark_pdf(os.path.join(work_dir, 'input.pdf'), 2)
+        output_file = os.path.join(work_dir, 'watermarked_file.pdf')
+        watermarker = PDFWatermarker()
+
+        def run(text, output_mode='rewrite'):
+            watermarks = [{'text': text, 'target_pages': 'all'}]
+            key = result_key('a' * 64, watermarks, output_mode=output_mode)
+            job = {'payload': {'input_path': input_file, 'output_path': output_file, 'watermarks': watermarks,
+                               'output_mode': output_mode, 'cache_key': key}}
+            with quiet_file_descriptor_stdout():
+                process_job(watermarker, job, cache)
+            return key
+
+        def cached_text(key):
+            return PdfReader(cache.get(key)).pages[0].extract_text()
+
+        alpha = run('ALPHA')
+        # A cache hit puts the entry back at the output path, then the next spec runs
+        copy_atomic(cache.get(alpha), output_file)
+        bravo = run('BRAVO')
+        charlie = run('CHARLIE', output_mode='incremental')
+
+        assert 'ALPHA' in cached_text(alpha) and 'BRAVO' not in cached_text(alpha)
+        assert 'BRAVO' in cached_text(bravo) and 'CHARLIE' not in cached_text(bravo)
+        assert 'CHARLIE' in cached_text(charlie)
+        assert os.stat(cache.get(alpha)).st_nlink == 1
+        print("✓ Cached results are unaffected by later jobs on the same file")
+
+def test_entries_come_from_the_jobs_own_output():
+    """Another writer of the output path while a job runs never ends up in the job's cache entry"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = ResultCache(os.path.join(work_dir, 'cache'))
+        input_file = create_benchmark_pdf(os.path.join(work_dir, 'input.pdf'), 2)
+        output_file = os.path.join(work_dir, 'watermarked_file.pdf')
+        other_output = create_benchmark_pdf(os.path.join(work_dir, 'other.pdf'), 1)
+
+        replace = os.replace
+        def racing_replace(source, target):
+            replace(source, target)
+            if target == output_file:
+                # A second worker moves its file into place right after this job's
+                shutil.copyfile(other_output, target)
+
+        watermarks = [{'text': 'MINE', 'target_pages': 'all'}]
+        key = result_key('b' * 64, watermarks)
+        job = {'payload': {'input_path': input_file, 'output_path': output_file,
+                           'watermarks': watermarks, 'cache_key': key}}
+        with quiet_file_descriptor_stdout(), mock.patch('worker.os.replace', racing_replace):
+            process_job(PDFWatermarker(), job, cache)
+
+        entry = PdfReader(cache.get(key))
+        assert len(entry.pages) == 2 and 'MINE' in entry.pages[1].extract_text()
+        print("✓ Cache entries are copied from the job's private output")
+
+if __name__ == "__main__":
+    test_result_key_canonicalizes_spec()
+    test_hits_misses_and_bytes_saved()
+    test_least_recently_used_entries_are_evicted()
+    test_entries_survive_later_jobs_on_the_same_output()
+    test_entries_come_from_the_jobs_own_output()
+    print("\n🎉 Result cache tests completed successfully!")
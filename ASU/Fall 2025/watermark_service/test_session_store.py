@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared session store
+"""
+
+import os
+import tempfile
+import threading
+from session_store import create_session_store, MemorySessionStore, SQLiteSessionStore
+
+def new_session(file_id):
+    return {'filename': 'input.pdf', 'file_path': f'/uploads/{file_id}.pdf', 'watermarks': {}, 'room': f'session_{file_id}'}
+
+def check_store(store):
+    """Sessions round-trip, reads are copies, and modify() writes back"""
+    store['abc'] = new_session('abc')
+    assert 'abc' in store and 'missing' not in store
+    assert store.get('missing') is None
+
+    # Changing a read copy does not touch the store, modify() does
+    store['abc']['watermarks']['wm-1'] = {'text': 'A'}
+    assert store['abc']['watermarks'] == {}
+    updated = store.modify('abc', lambda session: session['watermarks'].update({'wm-1': {'text': 'A'}}))
+    assert updated['watermarks'] == {'wm-1': {'text': 'A'}} and store['abc']['watermarks'] == {'wm-1': {'text': 'A'}}
+    assert store.modify('missing', lambda session: session.clear()) is None
+
+    # Per-watermark edits keep the order watermarks were added in
+    def add(watermark_id):
+        return store.modify_watermarks('abc', [watermark_id], lambda records: records.update({watermark_id: {'text': watermark_id}}))
+    for watermark_id in ('wm-2', 'wm-3', 'wm-4'):
+        assert add(watermark_id) == {'filename': 'input.pdf', 'file_path': '/uploads/abc.pdf', 'room': 'session_abc'}
+    store.modify_watermarks('abc', ['wm-1', 'wm-missing'], lambda records: records['wm-1'].update({'opacity': 0.5}))
+    store.modify_watermarks('abc', ['wm-3'], lambda records: records.pop('wm-3'))
+    add('wm-3')
+    assert list(store['abc']['watermarks'].items()) == [
+        ('wm-1', {'text': 'A', 'opacity': 0.5}), ('wm-2', {'text': 'wm-2'}),
+        ('wm-4', {'text': 'wm-4'}), ('wm-3', {'text': 'wm-3'})
+    ]
+    assert store.get('abc', watermarks=False) == {'filename': 'input.pdf', 'file_path': '/uploads/abc.pdf', 'room': 'session_abc'}
+    assert store.modify_watermarks('missing', ['wm-1'], lambda records: records.clear()) is None
+
+    del store['abc']
+    assert 'abc' not in store
+
+def test_memory_store():
+    """The in-process store behaves like the shared ones"""
+    check_store(MemorySessionStore())
+    print("✓ Memory session store works")
+
+def test_sqlite_store_shared_between_replicas():
+    """Two stores on one database see each other's sessions, like two API replicas"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        url = f"sqlite:///{os.path.join(work_dir, 'sessions.db')}"
+        replica_a = create_session_store(url)
+        replica_b = create_session_store(url)
+        assert isinstance(replica_a, SQLiteSessionStore)
+        check_store(replica_a)
+
+        # Uploaded through one replica, watermarked through the other
+        replica_a['upload'] = new_session('upload')
+        assert replica_b['upload']['file_path'] == '/uploads/upload.pdf'
+
+        # Concurrent edits from both replicas are all kept
+        def add_watermarks(store, first_id):
+            for watermark_id in range(first_id, first_id + 25):
+                store.modify_watermarks('upload', [str(watermark_id)], lambda records: records.update({str(watermark_id): {}}))
+
+        threads = [
+            threading.Thread(target=add_watermarks, args=(replica_a, 0)),
+            threading.Thread(target=add_watermarks, args=(replica_b, 100))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ids = sorted(int(watermark_id) for watermark_id in replica_a['upload']['watermarks'])
+        assert ids == list(range(25)) + list(range(100, 125))
+        print("✓ SQLite session store is shared between replicas without lost updates")
+
+def test_sqlite_store_writes_only_changed_watermarks():
+    """Updating one watermark of a large session touches its row, not the whole session"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = SQLiteSessionStore(os.path.join(work_dir, 'sessions.db'))
+        session = new_session('large')
+        session['watermarks'] = {f'wm-{index}': {'text': f'PAGE {index}'} for index in range(2000)}
+        store['large'] = session
+
+        conn = store._connect()
+        changes_before = conn.total_changes
+        store.modify_watermarks('large', ['wm-1500'], lambda records: records['wm-1500'].update({'opacity': 0.5}))
+        # The watermark's row and the session's updated_at
+        assert conn.total_changes - changes_before == 2
+        watermarks = store['large']['watermarks']
+        assert watermarks['wm-1500'] == {'text': 'PAGE 1500', 'opacity': 0.5}
+        assert list(watermarks)[1500] == 'wm-1500' and len(watermarks) == 2000
+        print("✓ SQLite session store updates a watermark by writing only its row")
+
+def test_unsupported_url():
+    try:
+        create_session_store('mongodb://localhost')
+    except ValueError:
+        print("✓ Unsupported session store URLs are rejected")
+        return
+    raise AssertionError("Expected ValueError")
+
+if __name__ == "__main__":
+    test_memory_store()
+    test_sqlite_store_shared_between_replicas()
+    test_sqlite_store_writes_only_changed_watermarks()
+    test_unsupported_url()
+    print("\n🎉 Session store tests completed successfully!")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for applying watermark overlays with different stamp modes
+"""
+
+import os
+import tempfile
+from PyPDF2 import PdfReader, PdfWriter
+from watermark_service import PDFWatermarker
+from xobject_stamper import XObjectStamper
+from benchmark_watermarks import create_benchmark_pdf
+
+WATERMARKS = [
+    {'text': 'CONFIDENTIAL', 'position': 'center', 'rotation': 45, 'target_pages': 'all'},
+    {'text': 'FIRST PAGE', 'position': 'top-left', 'target_pages': [1]}
+]
+
+def test_xobject_mode_shares_one_form_per_overlay():
+    """Every page invokes the same Form XObject instead of carrying its own copy"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 6)
+        output_file = os.path.join(work_dir, "output.pdf")
+
+        watermarker = PDFWatermarker()
+        watermarker.add_multiple_watermarks(input_file, output_file, WATERMARKS, stamp_mode='xobject')
+
+        reader = PdfReader(output_file)
+        form_ids = set()
+        for page_num, page in enumerate(reader.pages, 1):
+            text = page.extract_text()
+            assert 'CONFIDENTIAL' in text
+            assert ('FIRST PAGE' in text) == (page_num == 1)
+
+            xobjects = page['/Resources']['/XObject']
+            form_ids.update(
+                xobjects.raw_get(name).idnum for name in xobjects if name.startswith('/WmOverlay')
+            )
+
+        # One form for page 1 and one shared by pages 2-6
+        assert len(form_ids) == 2
+        print("✓ Pages share one Form XObject per distinct overlay")
+
+def test_unstamped_writer_gets_no_objects():
+    """The shared save-state stream is only added once a page is stamped"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        overlay = PdfReader(PDFWatermarker().create_watermark_pdf(
+            'DRAFT', 'center', 48, '#FF0000', 0.3, 0, 612, 792
+        )).pages[0]
+
+        writer = PdfWriter()
+        for page in PdfReader(input_file).pages:
+            writer.add_page(page)
+        object_count = len(writer._objects)
+        stamper = XObjectStamper(writer)
+        assert len(writer._objects) == object_count
+
+        # Both stamped pages start with the same save-state stream
+        first, second = (stamper.stamp(page, overlay) for page in writer.pages[:2])
+        assert first['/Contents'][0] == second['/Contents'][0]
+        print("✓ Save-state stream added on the first stamp and shared")
+
+def test_xobject_mode_output_is_smaller_than_merge():
+    """Stamping through a shared form adds fewer bytes than merging per page"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 20)
+        merge_file = os.path.join(work_dir, "merge.pdf")
+        xobject_file = os.path.join(work_dir, "xobject.pdf")
+
+        watermarker = PDFWatermarker()
+        watermarker.add_multiple_watermarks(input_file, merge_file, WATERMARKS, stamp_mode='merge')
+        watermarker.add_multiple_watermarks(input_file, xobject_file, WATERMARKS, stamp_mode='xobject')
+
+        assert os.path.getsize(xobject_file) < os.path.getsize(merge_file)
+        assert len(PdfReader(xobject_file).pages) == 20
+        print("✓ XObject stamping produces a smaller file than merging")
+
+def test_unknown_stamp_mode_is_rejected():
+    """An unsupported stamp mode raises ValueError"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 1)
+
+        try:
+            PDFWatermarker().add_multiple_watermarks(
+                input_file, os.path.join(work_dir, "output.pdf"), WATERMARKS, stamp_mode='overlay'
+            )
+        except ValueError:
+            print("✓ Unknown stamp mode rejected")
+        else:
+            assert False, "Expected ValueError for unknown stamp mode"
+
+def test_incremental_update_appends_to_original():
+    """An incremental update keeps the original bytes and appends only the stamped page"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 50)
+        output_file = os.path.join(work_dir, "output.pdf")
+
+        watermarks = [{'text': 'CONFIDENTIAL', 'position': 'center', 'target_pages': [2]}]
+        PDFWatermarker().add_multiple_watermarks(input_file, output_file, watermarks, output_mode='incremental')
+
+        with open(input_file, 'rb') as original, open(output_file, 'rb') as updated:
+            original_bytes = original.read()
+            updated_bytes = updated.read()
+
+        assert updated_bytes.startswith(original_bytes)
+        assert len(updated_bytes) - len(original_bytes) < 4096
+
+        reader = PdfReader(output_file)
+        assert len(reader.pages) == 50
+        assert 'CONFIDENTIAL' in reader.pages[1].extract_text()
+        assert 'CONFIDENTIAL' not in reader.pages[0].extract_text()
+        print("✓ Incremental update appended only the watermarked page")
+
+def test_incremental_update_in_place():
+    """Writing the update to the input path appends to the file itself"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = create_benchmark_pdf(os.path.join(work_dir, "input.pdf"), 3)
+        original_size = os.path.getsize(input_file)
+
+        watermarks = [{'text': 'DRAFT', 'target_pages': 'all'}]
+        PDFWatermarker().add_multiple_watermarks(input_file, input_file, watermarks, output_mode='incremental')
+
+        assert os.path.getsize(input_file) > original_size
+        for page in PdfReader(input_file).pages:
+            assert 'DRAFT' in page.extract_text()
+        print("✓ Incremental update written in place")
+
+if __name__ == "__main__":
+    test_xobject_mode_shares_one_form_per_overlay()
+    test_unstamped_writer_gets_no_objects()
+    test_xobject_mode_output_is_smaller_than_merge()
+    test_unknown_stamp_mode_is_rejected()
+    test_incremental_update_appends_to_original()
+    test_incremental_update_in_place()
+    print("\n🎉 Stamping tests completed successfully!")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script for watermark text measurement and layout
+"""
+
+from reportlab.pdfgen import canvas
+from watermark_service import PDFWatermarker
+from benchmark_watermarks import count_file_io
+import font_metrics
+import text_layout
+
+def test_text_width_matches_canvas():
+    """Cached metrics agree with ReportLab's canvas measurement at every size"""
+    c = canvas.Canvas(None)
+
+    for text in ['CONFIDENTIAL', 'Draft copy - do not distribute', 'Wj']:
+        for font_size in [8, 12.5, 24, 72]:
+            expected = c.stringWidth(text, "Helvetica-Bold", font_size)
+            assert abs(font_metrics.text_width(text, "Helvetica-Bold", font_size) - expected) < 1e-6
+
+    print("✓ Font metrics match canvas.stringWidth")
+
+def test_text_width_is_cached_across_sizes():
+    """One measurement per (text, font) serves every font size"""
+    font_metrics.clear_cache()
+
+    for font_size in range(8, 49):
+        font_metrics.text_width('CONFIDENTIAL', "Helvetica-Bold", font_size)
+
+    info = font_metrics.cache_info()
+    assert info.misses == 1
+    assert info.hits == 40
+    print("✓ Widths scale linearly from a single cached measurement")
+
+def test_layout_does_no_file_io():
+    """Fitting a long watermark does not touch the file system"""
+    watermarker = PDFWatermarker()
+    text = ' '.join(['CONFIDENTIAL'] * 200)
+
+    counts = count_file_io(
+        watermarker.calculate_optimal_font_size, text, 572, 752, "Helvetica-Bold", 48
+    )
+
+    assert sum(counts.values()) == 0
+    print("✓ Layout performed without file I/O")
+
+def fit_text_by_linear_scan(text, max_width, max_height, font_name, font_size):
+    """Reference fitting that tries every size from the requested one down to the minimum"""
+    while font_size > text_layout.MIN_FONT_SIZE:
+        if font_metrics.text_width(text, font_name, font_size) <= max_width:
+            if font_size <= max_height:
+                return font_size, [text]
+        else:
+            lines = text_layout.wrap_text(text, max_width, font_name, font_size)
+            if len(lines) * font_size <= max_height:
+                return font_size, lines
+        font_size -= 1
+
+    return text_layout.MIN_FONT_SIZE, text_layout.wrap_text(text, max_width, font_name, text_layout.MIN_FONT_SIZE)
+
+def test_fit_text_matches_linear_scan():
+    """Binary search picks the same size and lines as stepping down one size at a time"""
+    text = "Internal use only - this disclaimer must wrap across several lines of the page"
+
+    for max_width, max_height in [(572, 752), (200, 100), (120, 40), (60, 10)]:
+        for font_size in [6, 9, 24, 36.5, 72]:
+            expected = fit_text_by_linear_scan(text, max_width, max_height, "Helvetica-Bold", font_size)
+            assert text_layout.fit_text(text, max_width, max_height, "Helvetica-Bold", font_size) == expected
+
+    print("✓ Binary search fitting matches the linear scan")
+
+def test_calculate_optimal_font_size_returns_tuple():
+    """Both the single-line and wrapped results are (font_size, lines) tuples"""
+    watermarker = PDFWatermarker()
+
+    single = watermarker.calculate_optimal_font_size('DRAFT', 572, 752, "Helvetica-Bold", 24)
+    wrapped = watermarker.calculate_optimal_font_size('DRAFT ' * 40, 572, 752, "Helvetica-Bold", 24)
+
+    assert single == (24, ['DRAFT'])
+    assert isinstance(wrapped, tuple) and len(wrapped[1]) > 1
+    print("✓ calculate_optimal_font_size always returns a tuple")
+
+def test_wrap_text_keeps_long_words_whole():
+    """A word wider than the line stays on its own line"""
+    lines = text_layout.wrap_text('a supercalifragilisticexpialidocious b', 50, "Helvetica-Bold", 12)
+
+    assert lines == ['a', 'supercalifragilisticexpialidocious', 'b']
+    print("✓ Over-long words are placed on their own line")
+
+if __name__ == "__main__":
+    test_text_width_matches_canvas()
+    test_text_width_is_cached_across_sizes()
+    test_layout_does_no_file_io()
+    test_fit_text_matches_linear_scan()
+    test_calculate_optimal_font_size_returns_tuple()
+    test_wrap_text_keeps_long_words_whole()
+    print("\n🎉 Text layout tests completed successfully!")
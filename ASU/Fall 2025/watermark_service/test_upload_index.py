@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for the legacy server's file id index
+"""
+
+import os
+import uuid
+import tempfile
+from upload_index import UploadIndex
+
+def touch(path):
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n%%EOF\n')
+    return path
+
+def test_rebuild_from_disk():
+    """Files already on disk are indexed at startup, other names are ignored"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        upload_dir = os.path.join(work_dir, 'uploads')
+        output_dir = os.path.join(work_dir, 'outputs')
+        os.makedirs(upload_dir)
+        os.makedirs(output_dir)
+
+        file_id = str(uuid.uuid4())
+        upload = touch(os.path.join(upload_dir, f"{file_id}_report.pdf"))
+        output = touch(os.path.join(output_dir, f"watermarked_{file_id}.pdf"))
+        touch(os.path.join(upload_dir, 'notes.pdf'))
+
+        index = UploadIndex(os.path.join(upload_dir, '.upload_index.db'))
+        assert index.rebuild(upload_dir, output_dir) == 2
+        assert index.find_upload(file_id) == upload
+        assert sorted(index.paths(file_id)) == sorted([(upload, 'upload'), (output, 'output')])
+
+        # Rebuilding again replaces the index instead of adding to it
+        assert index.rebuild(upload_dir, output_dir) == 2 and len(index) == 2
+        print("✓ Upload index is rebuilt from the upload and output directories")
+
+def test_lookup_and_removal():
+    """Recorded files are found by id, files gone from disk are not returned"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        index = UploadIndex(os.path.join(work_dir, 'index.db'))
+        file_id = str(uuid.uuid4())
+        upload = touch(os.path.join(work_dir, f"{file_id}_input.pdf"))
+        index.add(file_id, upload)
+        index.add(file_id, os.path.join(work_dir, f"watermarked_{file_id}.pdf"), 'output')
+
+        assert index.find_upload(file_id) == upload
+        assert index.find_upload(file_id[:8]) is None
+        assert index.find_upload(str(uuid.uuid4())) is None
+
+        os.remove(upload)
+        assert index.find_upload(file_id) is None
+
+        index.remove(file_id)
+        assert index.paths(file_id) == [] and len(index) == 0
+        print("✓ Upload index finds, forgets and removes files by id")
+
+if __name__ == "__main__":
+    test_rebuild_from_disk()
+    test_lookup_and_removal()
+    print("\n🎉 Upload index tests completed successfully!")
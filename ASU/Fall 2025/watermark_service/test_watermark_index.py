@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Test script for id-indexed session watermark storage
+"""
+
+import json
+from watermark_index import add_watermark, update_watermark, remove_watermark, get_watermark, watermark_list
+
+def test_records_round_trip_compactly():
+    """Watermarks read back as they were added, while defaults are not stored"""
+    watermarks = {}
+    watermark = {'id': 'wm-1', 'text': 'DRAFT', 'position': 'center', 'font_size': 24,
+                 'color': '#ff0000', 'opacity': 0.5, 'rotation': 0, 'custom_x': '', 'custom_y': ''}
+    add_watermark(watermarks, watermark)
+
+    assert watermarks['wm-1'] == {'text': 'DRAFT', 'color': '#ff0000', 'custom_x': '', 'custom_y': ''}
+    assert get_watermark(watermarks, 'wm-1') == watermark
+
+    # Survives the JSON round trip of the shared session stores, order included
+    add_watermark(watermarks, {'id': 'wm-0', 'text': 'SECOND'})
+    restored = json.loads(json.dumps(watermarks))
+    assert [w['id'] for w in watermark_list(restored)] == ['wm-1', 'wm-0']
+    print("✓ Watermark records round-trip compactly and in order")
+
+def test_update_and_remove_by_id():
+    """Updates and removals touch only the watermark with the given id"""
+    watermarks = {}
+    for index in range(5):
+        add_watermark(watermarks, {'id': f'wm-{index}', 'text': f'W{index}'})
+
+    assert update_watermark(watermarks, 'wm-2', {'position': 'top-left', 'opacity': 0.9, 'id': 'ignored'})
+    assert get_watermark(watermarks, 'wm-2')['position'] == 'top-left'
+    # Setting a field back to its default drops it from the record
+    assert update_watermark(watermarks, 'wm-2', {'position': 'center'})
+    assert watermarks['wm-2'] == {'text': 'W2', 'opacity': 0.9}
+
+    assert remove_watermark(watermarks, 'wm-3')
+    assert not remove_watermark(watermarks, 'wm-3')
+    assert not update_watermark(watermarks, 'missing', {'text': 'X'})
+    assert [w['id'] for w in watermark_list(watermarks)] == ['wm-0', 'wm-1', 'wm-2', 'wm-4']
+    print("✓ Watermarks updated and removed by id")
+
+if __name__ == "__main__":
+    test_records_round_trip_compactly()
+    test_update_and_remove_by_id()
+    print("\n🎉 Watermark index tests completed successfully!")